@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of extract_sir_pdf_gemini.py: drives main() over a PDF corpus with a
+local fake Gemini client instead of the API, so throughput and performance changes
+(workers, caching, chunking, ...) can be compared run over run without a key.
+
+The fake client:
+- answers with the records already extracted in analysis_output/ for the same PDF
+  (empty records when there is no output, which also exercises RETRY EMPTY)
+- sleeps a configurable latency (+ jitter) per upload and per generate call
+- injects random 503 errors (--error-rate, --upload-error-rate) and bursts of 429s
+  (--burst-every/--burst-length)
+- expires cached prompts after their TTL (--cache-ttl-scale shortens it to exercise renewal)
+- runs Batch API jobs in memory (--batch: submit, poll, collect, RETRY EMPTY resubmission)
+- reports usage metadata (input tokens from the page count, output tokens from the answer)
+
+Outputs, caches and telemetry go to a temporary directory; nothing in the repo is touched.
+
+Reported per run: files/min, p50/p95/max per-file latency, injected errors, retries and
+back-off sleep, time in extract_json() and parse_valid_sir_records().
+
+Usage:
+    python3 bench_sir_pipeline.py pdfs
+    python3 bench_sir_pipeline.py pdfs --latency-ms 800 --error-rate 0.02 --sleep-scale 0.01 -- --workers 4
+    python3 bench_sir_pipeline.py pdfs --repeat 2 --json-out tmp/bench.json --baseline tmp/bench_prev.json
+    python3 bench_sir_pipeline.py pdfs --batch --upload-error-rate 0.1 --sleep-scale 0.01
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import extract_sir_pdf_gemini as pipeline
+
+# Retry back-off and rate-limit waits go through time.sleep; fake latency does not.
+_real_sleep = time.sleep
+
+
+def load_canned_responses(output_dir: Path) -> dict[str, str]:
+    """<group>/<stem> and <stem> -> JSON answer with the records of the existing output."""
+    canned: dict[str, str] = {}
+    for path in sorted(output_dir.rglob("*.extracted.json")):
+        try:
+            records = json.loads(path.read_text(encoding="utf-8")).get("records") or []
+        except (OSError, json.JSONDecodeError):
+            continue
+        stem = path.name.removesuffix(".extracted.json")
+        answer = json.dumps({"records": records}, ensure_ascii=False)
+        canned[f"{path.parent.name}/{stem}"] = answer
+        canned.setdefault(stem, answer)
+    return canned
+
+
+class FakeError(Exception):
+    pass
+
+
+class FakeGemini:
+    """Just enough of genai.Client (files, models, caches, batches) for the extraction pipeline."""
+
+    def __init__(self, args: argparse.Namespace, canned: dict[str, str]) -> None:
+        self.args = args
+        self.canned = canned
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.uploaded: dict[str, Path] = {}
+        self.cached_contents: dict[str, SimpleNamespace] = {}
+        self.jobs: dict[str, SimpleNamespace] = {}
+        self.stats = {
+            "uploads": 0,
+            "generate_calls": 0,
+            "errors_503": 0,
+            "errors_429": 0,
+            "upload_errors_503": 0,
+            "batch_jobs": 0,
+            "batch_requests": 0,
+            "cache_renewals": 0,
+            "cache_expired_errors": 0,
+        }
+        self.files = SimpleNamespace(upload=self.upload, get=self.get_file, delete=self.delete_file)
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+        self.caches = SimpleNamespace(
+            list=lambda: [c for c in self.cached_contents.values() if not self._cache_expired(c)],
+            create=self.create_cache,
+            update=self.update_cache,
+            delete=lambda name: self.cached_contents.pop(name, None),
+        )
+        self.batches = SimpleNamespace(create=self.create_batch, get=self.get_batch)
+
+    def _latency(self, base_ms: float) -> None:
+        with self.lock:
+            jitter = self.rng.uniform(-self.args.jitter_ms, self.args.jitter_ms)
+        _real_sleep(max(0.0, base_ms + jitter) / 1000)
+
+    def upload(self, file, config):
+        self._latency(self.args.upload_latency_ms)
+        with self.lock:
+            if self.rng.random() < self.args.upload_error_rate:
+                self.stats["upload_errors_503"] += 1
+                raise FakeError("503 UNAVAILABLE (injected upload)")
+            self.stats["uploads"] += 1
+            name = f"files/{self.stats['uploads']}"
+        self.uploaded[name] = Path(file.name)
+        return SimpleNamespace(
+            name=name, uri=f"fake://{name}", display_name=config.display_name, expiration_time=None
+        )
+
+    def get_file(self, name):
+        if name not in self.uploaded:
+            raise FakeError(f"404 NOT_FOUND {name}")
+        return SimpleNamespace(name=name, uri=f"fake://{name}")
+
+    def delete_file(self, name):
+        self.uploaded.pop(name, None)
+
+    def _expire_time(self, ttl: str) -> datetime:
+        seconds = float(ttl.removesuffix("s")) * self.args.cache_ttl_scale
+        return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+    def _cache_expired(self, cached: SimpleNamespace) -> bool:
+        return cached.expire_time <= datetime.now(timezone.utc)
+
+    def create_cache(self, model, config):
+        with self.lock:
+            name = f"cachedContents/{len(self.cached_contents) + 1}"
+            cached = SimpleNamespace(
+                name=name,
+                display_name=config.display_name,
+                model=f"models/{model}",
+                expire_time=self._expire_time(config.ttl),
+            )
+            self.cached_contents[name] = cached
+        return cached
+
+    def update_cache(self, name, config):
+        with self.lock:
+            cached = self.cached_contents.get(name)
+            if cached is None or self._cache_expired(cached):
+                raise FakeError(f"404 NOT_FOUND CachedContent not found: {name}")
+            self.stats["cache_renewals"] += 1
+            cached.expire_time = self._expire_time(config.ttl)
+        return cached
+
+    def _answer(self, pdf_path: Path) -> str:
+        key = f"{pdf_path.parent.name}/{pdf_path.stem}"
+        return self.canned.get(key) or self.canned.get(pdf_path.stem) or '{"records": []}'
+
+    def generate_content(self, model, contents, config=None):
+        with self.lock:
+            self.stats["generate_calls"] += 1
+            call_no = self.stats["generate_calls"]
+            fail_503 = self.rng.random() < self.args.error_rate
+        burst = self.args.burst_every and call_no % self.args.burst_every < self.args.burst_length
+        self._latency(self.args.latency_ms)
+        if burst:
+            with self.lock:
+                self.stats["errors_429"] += 1
+            raise FakeError("429 RESOURCE_EXHAUSTED (injected burst)")
+        if fail_503:
+            with self.lock:
+                self.stats["errors_503"] += 1
+            raise FakeError("503 UNAVAILABLE (injected)")
+        cached_tokens = 0
+        if isinstance(config, dict) and config.get("cached_content"):
+            cached = self.cached_contents.get(config["cached_content"])
+            if cached is None or self._cache_expired(cached):
+                with self.lock:
+                    self.stats["cache_expired_errors"] += 1
+                raise FakeError("403 PERMISSION_DENIED CachedContent not found (or permission denied)")
+            cached_tokens = 1200
+        file_uri = contents[0].file_data.file_uri
+        pdf_path = self.uploaded.get(file_uri.removeprefix("fake://"), Path("unknown.pdf"))
+        text = self._answer(pdf_path)
+        usage = SimpleNamespace(
+            prompt_token_count=pipeline.estimate_request_tokens(pdf_path, "") + 1200,
+            cached_content_token_count=cached_tokens,
+            candidates_token_count=len(text) // 4,
+            thoughts_token_count=0,
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def create_batch(self, model, src, config=None):
+        with self.lock:
+            self.stats["batch_jobs"] += 1
+            name = f"batches/{self.stats['batch_jobs']}"
+        job = SimpleNamespace(
+            name=name, state=SimpleNamespace(name="JOB_STATE_PENDING"), src=list(src), polls=0
+        )
+        self.jobs[name] = job
+        return job
+
+    def get_batch(self, name):
+        job = self.jobs[name]
+        job.polls += 1
+        if job.polls == 1:
+            job.state = SimpleNamespace(name="JOB_STATE_RUNNING")
+            return job
+        if job.state.name == "JOB_STATE_SUCCEEDED":
+            return job
+        responses = []
+        for request in job.src:
+            with self.lock:
+                self.stats["batch_requests"] += 1
+                fail_503 = self.rng.random() < self.args.error_rate
+            if fail_503:
+                with self.lock:
+                    self.stats["errors_503"] += 1
+                responses.append(SimpleNamespace(
+                    metadata=request.metadata, response=None, error="503 UNAVAILABLE (injected)"
+                ))
+                continue
+            file_uri = request.contents[0].file_data.file_uri
+            pdf_path = self.uploaded.get(file_uri.removeprefix("fake://"), Path("unknown.pdf"))
+            responses.append(SimpleNamespace(
+                metadata=request.metadata,
+                response=SimpleNamespace(text=self._answer(pdf_path)),
+                error=None,
+            ))
+        job.state = SimpleNamespace(name="JOB_STATE_SUCCEEDED")
+        job.dest = SimpleNamespace(inlined_responses=responses)
+        return job
+
+
+class StageTimer:
+    """Wraps a pipeline function to add up its wall time across threads."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.original = getattr(pipeline, name)
+        self.calls = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.original(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.calls += 1
+                self.seconds += time.perf_counter() - started
+
+
+class SleepMeter:
+    """Replaces time.sleep during the run: scales and adds up back-off/rate-limit waits."""
+
+    def __init__(self, scale: float) -> None:
+        self.scale = scale
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, seconds: float) -> None:
+        with self.lock:
+            self.seconds += seconds
+        _real_sleep(seconds * self.scale)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_once(args: argparse.Namespace, canned: dict[str, str], work_dir: Path, run_no: int) -> dict:
+    client = FakeGemini(args, canned)
+    out_dir = work_dir / f"out-{run_no}"
+    telemetry_dir = work_dir / f"telemetry-{run_no}"
+    argv = [
+        args.input_path,
+        "--output-dir", str(out_dir),
+        "--cache-dir", str(work_dir / "cache"),
+        "--upload-registry", str(work_dir / "uploads.json"),
+        "--telemetry-dir", str(telemetry_dir),
+        "--journal-dir", str(work_dir / f"journal-{run_no}"),
+        "--min-seconds-between-calls", "0",
+        "--allow-file-failures",
+        *args.pipeline_args,
+    ]
+    timers = [StageTimer("extract_json"), StageTimer("parse_valid_sir_records")]
+    sleep_meter = SleepMeter(args.sleep_scale)
+    for timer in timers:
+        setattr(pipeline, timer.name, timer)
+    time.sleep = sleep_meter
+    log = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            rc = pipeline.main(argv, client=client)
+    finally:
+        wall = time.perf_counter() - started
+        time.sleep = _real_sleep
+        for timer in timers:
+            setattr(pipeline, timer.name, timer.original)
+    if args.verbose:
+        print(log.getvalue())
+
+    lines = []
+    for path in telemetry_dir.glob("*.jsonl"):
+        lines.extend(json.loads(line) for line in path.read_text(encoding="utf-8").splitlines())
+    latencies = [line["total_ms"] for line in lines]
+    statuses: dict[str, int] = {}
+    for line in lines:
+        statuses[line["status"]] = statuses.get(line["status"], 0) + 1
+    files = len(lines)
+    rate_limit_wait = sum(line.get("rate_limit_wait_ms", 0) for line in lines) / 1000
+    return {
+        "run": run_no,
+        "exit_code": rc,
+        "files": files,
+        "statuses": statuses,
+        "wall_seconds": round(wall, 3),
+        "files_per_min": round(files / wall * 60, 1) if wall else 0.0,
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "latency_ms_max": max(latencies, default=0),
+        "uploads": client.stats["uploads"],
+        "generate_calls": client.stats["generate_calls"],
+        "injected_503": client.stats["errors_503"],
+        "injected_429": client.stats["errors_429"],
+        "prompt_cache_renewals": client.stats["cache_renewals"],
+        "prompt_cache_expired": client.stats["cache_expired_errors"],
+        "generate_retries": sum(line.get("generate_retries", 0) for line in lines),
+        "quota_errors": sum(line.get("quota_errors", 0) for line in lines),
+        "retry_empty_calls": sum(line.get("retry_empty_calls", 0) for line in lines),
+        # Unscaled seconds the pipeline asked to sleep in back-off (rate-limit waits excluded).
+        "backoff_sleep_seconds": round(max(0.0, sleep_meter.seconds - rate_limit_wait), 3),
+        "rate_limit_wait_seconds": round(rate_limit_wait, 3),
+        **{
+            f"{timer.name}_ms": round(timer.seconds * 1000, 1)
+            for timer in timers
+        },
+        **{f"{timer.name}_calls": timer.calls for timer in timers},
+    }
+
+
+def run_batch(args: argparse.Namespace, canned: dict[str, str], work_dir: Path, run_no: int) -> dict:
+    client = FakeGemini(args, canned)
+    out_dir = work_dir / f"out-{run_no}"
+    batch_dir = work_dir / f"batches-{run_no}"
+    common = [
+        "--output-dir", str(out_dir),
+        "--cache-dir", str(work_dir / "cache"),
+        "--upload-registry", str(work_dir / "uploads.json"),
+        "--batch-dir", str(batch_dir),
+        "--allow-file-failures",
+    ]
+    sleep_meter = SleepMeter(args.sleep_scale)
+    time.sleep = sleep_meter
+    log = io.StringIO()
+    started = time.perf_counter()
+    polls = 0
+    try:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            rc = pipeline.main(
+                [args.input_path, "--batch-submit", *common, *args.pipeline_args], client=client
+            )
+            # Poll until every job, including RETRY EMPTY follow-ups, has been collected.
+            while rc == 0 and polls < 10 and any(
+                not json.loads(path.read_text(encoding="utf-8")).get("collected_at_utc")
+                for path in batch_dir.glob("*.json")
+            ):
+                polls += 1
+                rc = pipeline.main(["--batch-collect", *common], client=client)
+    finally:
+        wall = time.perf_counter() - started
+        time.sleep = _real_sleep
+    if args.verbose:
+        print(log.getvalue())
+    outputs = list(out_dir.rglob("*.extracted.json"))
+    return {
+        "run": run_no,
+        "exit_code": rc,
+        "wall_seconds": round(wall, 3),
+        "batch_jobs": client.stats["batch_jobs"],
+        "batch_requests": client.stats["batch_requests"],
+        "collect_polls": polls,
+        "outputs_written": len(outputs),
+        "outputs_empty": sum(
+            1 for path in outputs
+            if not json.loads(path.read_text(encoding="utf-8")).get("records")
+        ),
+        "uploads": client.stats["uploads"],
+        "injected_upload_503": client.stats["upload_errors_503"],
+        "injected_503": client.stats["errors_503"],
+        "backoff_sleep_seconds": round(sleep_meter.seconds, 3),
+    }
+
+
+def print_batch_report(result: dict, baseline: dict | None) -> None:
+    print(f"Batch run {result['run']} (exit {result['exit_code']})")
+    for key, value in result.items():
+        if key in ("run", "exit_code"):
+            continue
+        line = f"  {key:<30}: {value}"
+        if baseline is not None and baseline.get(key) is not None:
+            line += f"  (baseline {baseline[key]})"
+        print(line)
+
+
+def print_report(result: dict, baseline: dict | None) -> None:
+    print(f"Run {result['run']} (exit {result['exit_code']})")
+    statuses = " ".join(f"{k}={v}" for k, v in sorted(result["statuses"].items()))
+    print(f"  Files           : {result['files']} ({statuses})")
+    keys = [
+        ("wall_seconds", "Wall time (s)"),
+        ("files_per_min", "Files/min"),
+        ("latency_ms_p50", "Latency p50 (ms)"),
+        ("latency_ms_p95", "Latency p95 (ms)"),
+        ("latency_ms_max", "Latency max (ms)"),
+        ("uploads", "Uploads"),
+        ("generate_calls", "Generate calls"),
+        ("injected_503", "Injected 503"),
+        ("injected_429", "Injected 429"),
+        ("prompt_cache_renewals", "Prompt cache renewals"),
+        ("prompt_cache_expired", "Prompt cache expired calls"),
+        ("generate_retries", "Retries"),
+        ("quota_errors", "Quota errors"),
+        ("retry_empty_calls", "RETRY EMPTY calls"),
+        ("backoff_sleep_seconds", "Back-off sleep (s)"),
+        ("rate_limit_wait_seconds", "Rate-limit wait (s)"),
+        ("extract_json_ms", "extract_json (ms)"),
+        ("parse_valid_sir_records_ms", "parse_valid_sir_records (ms)"),
+    ]
+    for key, label in keys:
+        line = f"  {label:<30}: {result[key]}"
+        if baseline is not None and isinstance(baseline.get(key), (int, float)):
+            before = baseline[key]
+            if before:
+                line += f"  ({(result[key] - before) / before * 100:+.1f}% vs baseline {before})"
+            else:
+                line += f"  (baseline {before})"
+        print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark extract_sir_pdf_gemini.py offline with a fake Gemini backend",
+        epilog="Arguments after -- are passed to extract_sir_pdf_gemini.py (e.g. -- --workers 4).",
+    )
+    parser.add_argument("input_path", help="PDF corpus (e.g. pdfs)")
+    parser.add_argument("--canned-dir", default="analysis_output",
+                        help="Existing outputs used as model answers (default: analysis_output)")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Generate latency (default: 500)")
+    parser.add_argument("--upload-latency-ms", type=float, default=100, help="Upload latency (default: 100)")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="± uniform jitter on latencies (default: 200)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of generate calls failing with 503 (default: 0)")
+    parser.add_argument("--burst-every", type=int, default=0,
+                        help="Every N generate calls start a burst of 429s (default: 0 = off)")
+    parser.add_argument("--burst-length", type=int, default=3, help="429s per burst (default: 3)")
+    parser.add_argument("--cache-ttl-scale", type=float, default=1.0,
+                        help="Scale the TTL of cached prompts, e.g. 0.0001 to expire them mid-run (default: 1)")
+    parser.add_argument("--upload-error-rate", type=float, default=0.0,
+                        help="Fraction of uploads failing with 503 (default: 0)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Run the --batch-submit/--batch-collect path against the fake batch service")
+    parser.add_argument("--sleep-scale", type=float, default=1.0,
+                        help="Scale retry back-off and rate-limit sleeps, e.g. 0.01 (default: 1 = real)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs sharing the extraction cache: run 2+ measures the cache-hit path (default: 1)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for jitter/errors (default: 1)")
+    parser.add_argument("--json-out", help="Write the results as JSON (input for --baseline)")
+    parser.add_argument("--baseline", help="Earlier --json-out to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    argv = sys.argv[1:]
+    pipeline_args: list[str] = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, pipeline_args = argv[:split], argv[split + 1:]
+    args = parser.parse_args(argv)
+    args.pipeline_args = pipeline_args
+
+    if not Path(args.input_path).exists():
+        print(f"Input path not found: {args.input_path}", file=sys.stderr)
+        return 1
+    canned = load_canned_responses(Path(args.canned_dir))
+    baseline_runs = []
+    if args.baseline:
+        baseline_runs = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["runs"]
+
+    print(f"Canned answers: {len(canned)} outputs from {args.canned_dir}")
+    results = []
+    with tempfile.TemporaryDirectory(prefix="sir-bench-") as tmp:
+        for run_no in range(1, max(1, args.repeat) + 1):
+            baseline = baseline_runs[run_no - 1] if run_no <= len(baseline_runs) else None
+            if args.batch:
+                result = run_batch(args, canned, Path(tmp), run_no)
+                print_batch_report(result, baseline)
+            else:
+                result = run_once(args, canned, Path(tmp), run_no)
+                print_report(result, baseline)
+            results.append(result)
+
+    if args.json_out:
+        out_path = Path(args.json_out)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        settings = {k: v for k, v in vars(args).items() if k not in ("json_out", "baseline", "verbose")}
+        out_path.write_text(json.dumps({"settings": settings, "runs": results}, indent=2), encoding="utf-8")
+        print(f"Results: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
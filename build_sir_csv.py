@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
-"""Build relational CSVs from SIR extracted JSON files.
+"""Build relational tables from SIR extracted JSON files.
 
-Produces:
+Produces (--format csv, default):
   <output-dir>/sir_records.csv   — one row per SirRecord
   <output-dir>/violations.csv    — one row per possible_violation
+
+--format parquet / duckdb write the same tables as .parquet files / sir.duckdb.
 """
 
 import argparse
 import csv
+import hashlib
 import json
+import re
+import sys
+from datetime import datetime
 from pathlib import Path
 
 SIR_RECORDS_FIELDS = [
@@ -56,7 +62,585 @@ VIOLATIONS_FIELDS = [
 ]
 
 
-def build_csvs(input_dir: Path, output_dir: Path) -> None:
+FORMATS = ("csv", "parquet", "duckdb")
+INT_FIELDS = {
+    "record_index",
+    "dead_confirmed",
+    "injured_confirmed",
+    "missing_confirmed",
+    "dead_possible_min",
+    "dead_possible_max",
+    "possible_violations_count",
+    "violation_index",
+    "source_rows_in_signature",
+}
+FLOAT_FIELDS = {"lat", "lon"}
+BOOL_FIELDS = {"libyan_coast_guard_involved"}
+TIMESTAMP_FIELDS = {"generated_at_utc"}
+LIST_FIELDS = {"evidence_pages"}
+DUCKDB_FILE = "sir.duckdb"
+
+DEDUP_MODES = ("strict", "conservative")
+DEDUP_OUTPUTS = {
+    "strict": ("sir_records_dedup", "violations_dedup"),
+    "conservative": ("sir_records_conservative", "violations_conservative"),
+}
+CONSERVATIVE_GROUPS_TABLE = "sir_records_conservative_groups"
+CONSERVATIVE_GROUPS_FIELDS = [
+    "sir_id",
+    "event_signature",
+    "source_rows_in_signature",
+    "min_report_date",
+    "max_report_date",
+    "source_files",
+]
+CONFIDENCE_SCORES = {"high": 2, "medium": 1, "low": 0}
+# Compilations and annual reports restate SIRs second-hand: prefer the SIR itself.
+LOW_PRIORITY_SOURCE_MARKERS = (
+    "email",
+    "annual",
+    "sea-borders-surveillance-report",
+    "sea_surveillance_report",
+)
+COMPLETENESS_FIELDS = [
+    "report_date",
+    "incident_date",
+    "country_or_area",
+    "where_clear",
+    "geocodable",
+    "geocodable_query",
+    "dead_confirmed",
+    "injured_confirmed",
+    "missing_confirmed",
+    "possible_violations_count",
+    "evidence_quote",
+    "evidence_pages",
+]
+# Same fields as the event signature in docs/output_csv_dedup_conservative.sql.
+SIGNATURE_FIELDS = [
+    "report_date",
+    "incident_date",
+    "country_or_area",
+    "where_clear",
+    "location_type",
+    "dead_confirmed",
+    "injured_confirmed",
+    "missing_confirmed",
+    "possible_violations_count",
+]
+ISO_DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def manifest_name(fmt: str) -> str:
+    return "build_manifest.json" if fmt == "csv" else f"build_manifest_{fmt}.json"
+
+
+def make_record_uid(rel_path: str, record_index: int) -> str:
+    return hashlib.sha256(f"{rel_path}#{record_index}".encode("utf-8")).hexdigest()[:16]
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def rows_from_extracted(json_path: Path, rel_path: str) -> tuple[list[dict], list[dict]] | None:
+    batch = json_path.parent.name
+    try:
+        with open(json_path, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except json.JSONDecodeError as exc:
+        print(f"WARN: skipping {json_path} ({exc})")
+        return None
+
+    source_file = data.get("source_file", "")
+    model = data.get("model", "")
+    generated_at_utc = data.get("generated_at_utc", "")
+    record_rows: list[dict] = []
+    violation_rows: list[dict] = []
+
+    for rec_idx, rec in enumerate(data.get("records", [])):
+        record_uid = make_record_uid(rel_path, rec_idx)
+        violations = rec.get("possible_violations") or []
+        evidence_pages = rec.get("evidence_pages") or []
+
+        record_rows.append({
+            "record_uid": record_uid,
+            "batch": batch,
+            "source_file": source_file,
+            "record_index": rec_idx,
+            "model": model,
+            "generated_at_utc": generated_at_utc,
+            "sir_id": rec.get("sir_id"),
+            "report_date": rec.get("report_date"),
+            "incident_date": rec.get("incident_date"),
+            "location_details": rec.get("location_details"),
+            "where_clear": rec.get("where_clear"),
+            "location_text_raw": rec.get("location_text_raw"),
+            "country_or_area": rec.get("country_or_area"),
+            "location_type": rec.get("location_type"),
+            "precision_level": rec.get("precision_level"),
+            "geocodable": rec.get("geocodable"),
+            "geocodable_query": rec.get("geocodable_query"),
+            "lat": rec.get("lat"),
+            "lon": rec.get("lon"),
+            "uncertainty_note": rec.get("uncertainty_note"),
+            "dead_confirmed": rec.get("dead_confirmed"),
+            "injured_confirmed": rec.get("injured_confirmed"),
+            "missing_confirmed": rec.get("missing_confirmed"),
+            "dead_possible_min": rec.get("dead_possible_min"),
+            "dead_possible_max": rec.get("dead_possible_max"),
+            "possible_violations_count": len(violations),
+            "context_note": rec.get("context_note"),
+            "libyan_coast_guard_involved": rec.get("libyan_coast_guard_involved"),
+            "evidence_quote": rec.get("evidence_quote"),
+            "confidence": rec.get("confidence"),
+            "evidence_pages": list(evidence_pages),
+        })
+
+        for v_idx, v in enumerate(violations):
+            violation_rows.append({
+                "record_uid": record_uid,
+                "sir_id": rec.get("sir_id"),
+                "source_file": source_file,
+                "violation_index": v_idx,
+                "violation_name": v.get("violation_name"),
+                "legal_basis": v.get("legal_basis"),
+                "assessment": v.get("assessment"),
+            })
+
+    return record_rows, violation_rows
+
+
+def load_manifest(output_dir: Path, fmt: str = "csv") -> dict:
+    path = output_dir / manifest_name(fmt)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8")).get("files", {})
+    except json.JSONDecodeError:
+        return {}
+
+
+def write_manifest(output_dir: Path, files: dict, fmt: str = "csv") -> None:
+    path = output_dir / manifest_name(fmt)
+    path.write_text(
+        json.dumps({"version": 1, "files": files}, ensure_ascii=False, indent=1),
+        encoding="utf-8",
+    )
+
+
+def group_by_uid(rows: list[dict]) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {}
+    for row in rows:
+        grouped.setdefault(row["record_uid"], []).append(row)
+    return grouped
+
+
+def to_csv_value(field: str, value: object) -> object:
+    if field in LIST_FIELDS and isinstance(value, list):
+        return ",".join(str(p) for p in value)
+    if field in TIMESTAMP_FIELDS and isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def to_typed_value(field: str, value: object) -> object:
+    if value is None or value == "":
+        return [] if field in LIST_FIELDS else None
+    if field in LIST_FIELDS:
+        if isinstance(value, str):
+            return [int(p) for p in value.split(",") if p.strip()]
+        return [int(p) for p in value]
+    if field in INT_FIELDS:
+        return int(value)
+    if field in FLOAT_FIELDS:
+        return float(value)
+    if field in BOOL_FIELDS:
+        if isinstance(value, str):
+            return value.strip().lower() == "true"
+        return bool(value)
+    if field in TIMESTAMP_FIELDS and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value
+
+
+def require_module(name: str, fmt: str):
+    try:
+        return __import__(name)
+    except ImportError:
+        sys.exit(f"--format {fmt} requires the '{name}' package (pip install {name})")
+
+
+def arrow_schema(pa, fields: list[str]):
+    columns = []
+    for field in fields:
+        if field in LIST_FIELDS:
+            col_type = pa.list_(pa.int32())
+        elif field in INT_FIELDS:
+            col_type = pa.int32()
+        elif field in FLOAT_FIELDS:
+            col_type = pa.float64()
+        elif field in BOOL_FIELDS:
+            col_type = pa.bool_()
+        elif field in TIMESTAMP_FIELDS:
+            col_type = pa.timestamp("us", tz="UTC")
+        else:
+            col_type = pa.string()
+        columns.append(pa.field(field, col_type))
+    return pa.schema(columns)
+
+
+def duckdb_type(field: str) -> str:
+    if field in LIST_FIELDS:
+        return "INTEGER[]"
+    if field in INT_FIELDS:
+        return "INTEGER"
+    if field in FLOAT_FIELDS:
+        return "DOUBLE"
+    if field in BOOL_FIELDS:
+        return "BOOLEAN"
+    if field in TIMESTAMP_FIELDS:
+        return "TIMESTAMPTZ"
+    return "VARCHAR"
+
+
+def table_paths(output_dir: Path, fmt: str) -> list[Path]:
+    if fmt == "duckdb":
+        return [output_dir / DUCKDB_FILE]
+    return [output_dir / f"sir_records.{fmt}", output_dir / f"violations.{fmt}"]
+
+
+def read_existing_rows(output_dir: Path, fmt: str) -> tuple[list[dict], list[dict]]:
+    if fmt == "csv":
+        tables = []
+        for path in table_paths(output_dir, fmt):
+            with open(path, newline="", encoding="utf-8") as fh:
+                tables.append(list(csv.DictReader(fh)))
+        return tables[0], tables[1]
+    if fmt == "parquet":
+        require_module("pyarrow", fmt)
+        import pyarrow.parquet as pq
+
+        records_path, violations_path = table_paths(output_dir, fmt)
+        return (
+            pq.read_table(records_path).to_pylist(),
+            pq.read_table(violations_path).to_pylist(),
+        )
+    raise ValueError(f"Unsupported format for row read-back: {fmt}")
+
+
+def write_table(
+    output_dir: Path, fmt: str, name: str, fields: list[str], rows: list[dict]
+) -> Path:
+    if fmt == "csv":
+        path = output_dir / f"{name}.csv"
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.DictWriter(fh, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({f: to_csv_value(f, row.get(f)) for f in fields})
+        return path
+
+    typed = [[to_typed_value(f, row.get(f)) for f in fields] for row in rows]
+    if fmt == "parquet":
+        pa = require_module("pyarrow", fmt)
+        import pyarrow.parquet as pq
+
+        path = output_dir / f"{name}.parquet"
+        table = pa.Table.from_pylist(
+            [dict(zip(fields, values)) for values in typed],
+            schema=arrow_schema(pa, fields),
+        )
+        pq.write_table(table, path, compression="zstd")
+        return path
+
+    duckdb = require_module("duckdb", fmt)
+    path = output_dir / DUCKDB_FILE
+    con = duckdb.connect(str(path))
+    try:
+        columns = ", ".join(f"{f} {duckdb_type(f)}" for f in fields)
+        con.execute(f"CREATE OR REPLACE TABLE {name} ({columns})")
+        if typed:
+            placeholders = ", ".join("?" for _ in fields)
+            con.executemany(f"INSERT INTO {name} VALUES ({placeholders})", typed)
+    finally:
+        con.close()
+    return path
+
+
+def read_duckdb_table(output_dir: Path, name: str) -> list[dict]:
+    duckdb = require_module("duckdb", "duckdb")
+    con = duckdb.connect(str(output_dir / DUCKDB_FILE), read_only=True)
+    try:
+        # Read timestamps back as ISO text: fetching TIMESTAMPTZ values needs pytz.
+        names = [r[0] for r in con.execute(f"DESCRIBE {name}").fetchall()]
+        select = ", ".join(
+            f"strftime({n}, '%Y-%m-%dT%H:%M:%S.%f%z') AS {n}" if n in TIMESTAMP_FIELDS else n
+            for n in names
+        )
+        cursor = con.execute(f"SELECT {select} FROM {name}")
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, values)) for values in cursor.fetchall()]
+    finally:
+        con.close()
+
+
+def write_rows(
+    output_dir: Path, fmt: str, record_rows: list[dict], violation_rows: list[dict]
+) -> None:
+    write_table(output_dir, fmt, "sir_records", SIR_RECORDS_FIELDS, record_rows)
+    write_table(output_dir, fmt, "violations", VIOLATIONS_FIELDS, violation_rows)
+
+
+def splice_duckdb(
+    output_dir: Path,
+    full_rebuild: bool,
+    stale_uids: list[str],
+    record_rows: list[dict],
+    violation_rows: list[dict],
+) -> None:
+    duckdb = require_module("duckdb", "duckdb")
+    con = duckdb.connect(str(output_dir / DUCKDB_FILE))
+    try:
+        con.execute("BEGIN TRANSACTION")
+        for table, fields in (
+            ("sir_records", SIR_RECORDS_FIELDS),
+            ("violations", VIOLATIONS_FIELDS),
+        ):
+            if full_rebuild:
+                con.execute(f"DROP TABLE IF EXISTS {table}")
+            columns = ", ".join(f"{f} {duckdb_type(f)}" for f in fields)
+            con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+            if stale_uids:
+                con.execute(
+                    f"DELETE FROM {table} WHERE list_contains(?, record_uid)",
+                    [stale_uids],
+                )
+        for table, fields, rows in (
+            ("sir_records", SIR_RECORDS_FIELDS, record_rows),
+            ("violations", VIOLATIONS_FIELDS, violation_rows),
+        ):
+            if not rows:
+                continue
+            placeholders = ", ".join("?" for _ in fields)
+            con.executemany(
+                f"INSERT INTO {table} VALUES ({placeholders})",
+                [[to_typed_value(f, row.get(f)) for f in fields] for row in rows],
+            )
+        con.execute("COMMIT")
+    finally:
+        con.close()
+
+
+def _value(row: dict, field: str) -> object:
+    value = to_typed_value(field, row.get(field))
+    if value == [] or value == "":
+        return None
+    return value
+
+
+def _desc_text(value: object) -> tuple:
+    if value is None:
+        return (1,)
+    return (0,) + tuple(-ord(ch) for ch in str(value)) + (1,)
+
+
+def _text(value: object) -> str:
+    return "" if value is None else str(value)
+
+
+def dedup_rank_key(row: dict) -> tuple:
+    """Quality ranking (smaller is better), as in docs/output_csv_dedup*.sql."""
+    source_file = _text(row.get("source_file"))
+    source_priority = 0 if any(m in source_file.lower() for m in LOW_PRIORITY_SOURCE_MARKERS) else 1
+    completeness = sum(1 for f in COMPLETENESS_FIELDS if _value(row, f) is not None)
+    confidence = CONFIDENCE_SCORES.get(_text(row.get("confidence")), -1)
+    incident_date = _value(row, "incident_date")
+    if incident_date is not None and not ISO_DATE_PATTERN.match(str(incident_date)):
+        incident_date = None
+    impact = sum(
+        _value(row, f) or 0 for f in ("dead_confirmed", "injured_confirmed", "missing_confirmed")
+    )
+    violations = _value(row, "possible_violations_count")
+    return (
+        -source_priority,
+        -completeness,
+        -confidence,
+        _desc_text(_value(row, "report_date")),
+        _desc_text(incident_date),
+        -impact,
+        (0, -violations) if violations is not None else (1, 0),
+        source_file,
+        _value(row, "record_index") or 0,
+    )
+
+
+def event_signature(row: dict) -> str:
+    parts = []
+    for field in SIGNATURE_FIELDS:
+        value = _value(row, field)
+        text = _text(value)
+        parts.append(text.strip() if field in ("country_or_area", "where_clear") else text)
+    return "||".join(parts)
+
+
+class DedupIndex:
+    """Best row per dedup group, fed one row at a time."""
+
+    def __init__(self, mode: str) -> None:
+        self.mode = mode
+        self.groups: dict[str, dict] = {}
+
+    def add(self, row: dict) -> None:
+        sir_id = _value(row, "sir_id")
+        if sir_id is None:
+            return
+        signature = event_signature(row) if self.mode == "conservative" else ""
+        key = f"{sir_id}\x1f{signature}"
+        report_date = _value(row, "report_date")
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = {
+                "sir_id": sir_id,
+                "event_signature": signature,
+                "best": row,
+                "rows": 1,
+                "min_report_date": report_date,
+                "max_report_date": report_date,
+                "source_files": [_text(row.get("source_file"))],
+            }
+            return
+        group["rows"] += 1
+        if report_date is not None:
+            if group["min_report_date"] is None or report_date < group["min_report_date"]:
+                group["min_report_date"] = report_date
+            if group["max_report_date"] is None or report_date > group["max_report_date"]:
+                group["max_report_date"] = report_date
+        source_file = _text(row.get("source_file"))
+        if source_file not in group["source_files"]:
+            group["source_files"].append(source_file)
+        if dedup_rank_key(row) < dedup_rank_key(group["best"]):
+            group["best"] = row
+
+    def kept_rows(self) -> list[dict]:
+        rows = [g["best"] for g in self.groups.values()]
+        if self.mode == "strict":
+            return sorted(rows, key=lambda r: _text(r.get("sir_id")))
+        return sorted(
+            rows,
+            key=lambda r: (
+                _text(r.get("sir_id")),
+                (_value(r, "report_date") is None, _text(_value(r, "report_date"))),
+                (_value(r, "incident_date") is None, _text(_value(r, "incident_date"))),
+                _text(r.get("source_file")),
+            ),
+        )
+
+    def group_rows(self) -> list[dict]:
+        return [
+            {
+                "sir_id": g["sir_id"],
+                "event_signature": g["event_signature"],
+                "source_rows_in_signature": g["rows"],
+                "min_report_date": g["min_report_date"],
+                "max_report_date": g["max_report_date"],
+                "source_files": " | ".join(sorted(g["source_files"])),
+            }
+            for g in sorted(
+                self.groups.values(), key=lambda g: (g["sir_id"], g["event_signature"])
+            )
+        ]
+
+    def save(self, path: Path, records_digest: str) -> None:
+        state = {"mode": self.mode, "records_digest": records_digest, "groups": self.groups}
+        path.write_text(json.dumps(state, ensure_ascii=False, default=str), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path, mode: str, records_digest: str) -> "DedupIndex | None":
+        try:
+            state = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        # The index must cover exactly the records of the previous build.
+        if state.get("mode") != mode or state.get("records_digest") != records_digest:
+            return None
+        index = cls(mode)
+        index.groups = state["groups"]
+        return index
+
+
+def dedup_state_path(output_dir: Path, fmt: str, mode: str) -> Path:
+    return output_dir / f"dedup_state_{mode}_{fmt}.json"
+
+
+def records_digest(rows: list[dict]) -> str:
+    digest = hashlib.sha256()
+    for uid in sorted(_text(r.get("record_uid")) for r in rows):
+        digest.update(uid.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def run_dedup(
+    output_dir: Path,
+    fmt: str,
+    mode: str,
+    record_rows: list[dict],
+    violation_rows: list[dict],
+    added_rows: list[dict] | None = None,
+) -> None:
+    state_path = dedup_state_path(output_dir, fmt, mode)
+    index = None
+    if added_rows is not None:
+        added_uids = {_text(r.get("record_uid")) for r in added_rows}
+        previous = [r for r in record_rows if _text(r.get("record_uid")) not in added_uids]
+        index = DedupIndex.load(state_path, mode, records_digest(previous))
+        if index is None:
+            print(f"Dedup {mode}: saved index does not match the previous build, re-scanning")
+    if index is not None:
+        for row in added_rows:
+            index.add(row)
+    else:
+        index = DedupIndex(mode)
+        for row in record_rows:
+            index.add(row)
+    index.save(state_path, records_digest(record_rows))
+
+    kept = index.kept_rows()
+    kept_uids = {_text(r.get("record_uid")) for r in kept}
+    kept_violations = sorted(
+        (v for v in violation_rows if _text(v.get("record_uid")) in kept_uids),
+        key=lambda v: (
+            _text(v.get("sir_id")),
+            _text(v.get("record_uid")),
+            _value(v, "violation_index") or 0,
+        ),
+    )
+    records_table, violations_table = DEDUP_OUTPUTS[mode]
+    path = write_table(output_dir, fmt, records_table, SIR_RECORDS_FIELDS, kept)
+    write_table(output_dir, fmt, violations_table, VIOLATIONS_FIELDS, kept_violations)
+    if mode == "conservative":
+        write_table(
+            output_dir, fmt, CONSERVATIVE_GROUPS_TABLE, CONSERVATIVE_GROUPS_FIELDS,
+            index.group_rows(),
+        )
+    print(f"Dedup {mode}: kept {len(kept)}/{len(record_rows)} records, "
+          f"{len(kept_violations)} violations → {path}")
+
+
+def build_tables(
+    input_dir: Path,
+    output_dir: Path,
+    incremental: bool = False,
+    fmt: str = "csv",
+    dedup_modes: tuple[str, ...] = (),
+) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
 
     json_files = sorted(input_dir.glob("**/*.extracted.json"))
@@ -64,96 +648,112 @@ def build_csvs(input_dir: Path, output_dir: Path) -> None:
         print(f"No .extracted.json files found in {input_dir}")
         return
 
-    record_uid = 0
-    records_written = 0
-    violations_written = 0
-
-    with open(output_dir / "sir_records.csv", "w", newline="", encoding="utf-8") as rf, \
-         open(output_dir / "violations.csv", "w", newline="", encoding="utf-8") as vf:
-
-        rw = csv.DictWriter(rf, fieldnames=SIR_RECORDS_FIELDS)
-        vw = csv.DictWriter(vf, fieldnames=VIOLATIONS_FIELDS)
-        rw.writeheader()
-        vw.writeheader()
-
-        for json_path in json_files:
-            batch = json_path.parent.name
-            try:
-                with open(json_path, encoding="utf-8") as fh:
-                    data = json.load(fh)
-            except json.JSONDecodeError as exc:
-                print(f"WARN: skipping {json_path} ({exc})")
+    manifest = load_manifest(output_dir, fmt) if incremental else {}
+    if incremental and not (manifest and all(p.exists() for p in table_paths(output_dir, fmt))):
+        print("No usable manifest or previous tables: running a full build.")
+        manifest = {}
+
+    existing_records: dict[str, list[dict]] = {}
+    existing_violations: dict[str, list[dict]] = {}
+    if manifest and fmt != "duckdb":
+        old_records, old_violations = read_existing_rows(output_dir, fmt)
+        existing_records = group_by_uid(old_records)
+        existing_violations = group_by_uid(old_violations)
+
+    new_manifest: dict[str, dict] = {}
+    files_reparsed = 0
+    record_rows: list[dict] = []
+    violation_rows: list[dict] = []
+    # DuckDB is spliced in place, so it only needs the rows that changed.
+    changed_records: list[dict] = []
+    changed_violations: list[dict] = []
+    stale_uids: list[str] = []
+
+    for json_path in json_files:
+        rel_path = json_path.relative_to(input_dir).as_posix()
+        stat = json_path.stat()
+        entry = {"mtime": stat.st_mtime, "size": stat.st_size}
+        previous = manifest.get(rel_path)
+        unchanged = False
+        if previous is not None:
+            if previous["mtime"] == entry["mtime"] and previous["size"] == entry["size"]:
+                entry["sha256"] = previous["sha256"]
+                unchanged = True
+            else:
+                entry["sha256"] = file_sha256(json_path)
+                unchanged = entry["sha256"] == previous["sha256"]
+        else:
+            entry["sha256"] = file_sha256(json_path)
+
+        if unchanged:
+            uids = previous["record_uids"]
+            file_records = [r for uid in uids for r in existing_records.get(uid, [])]
+            file_violations = [v for uid in uids for v in existing_violations.get(uid, [])]
+            entry["record_uids"] = uids
+        else:
+            if previous is not None:
+                stale_uids.extend(previous["record_uids"])
+            parsed = rows_from_extracted(json_path, rel_path)
+            if parsed is None:
                 continue
+            file_records, file_violations = parsed
+            files_reparsed += 1
+            changed_records.extend(file_records)
+            changed_violations.extend(file_violations)
+            entry["record_uids"] = [r["record_uid"] for r in file_records]
+
+        new_manifest[rel_path] = entry
+        record_rows.extend(file_records)
+        violation_rows.extend(file_violations)
+
+    removed = set(manifest) - set(new_manifest)
+    for rel_path in removed:
+        stale_uids.extend(manifest[rel_path]["record_uids"])
+
+    if fmt == "duckdb":
+        splice_duckdb(
+            output_dir, not manifest, stale_uids, changed_records, changed_violations
+        )
+    else:
+        write_rows(output_dir, fmt, record_rows, violation_rows)
+
+    write_manifest(output_dir, new_manifest, fmt)
+    print(f"Parsed {files_reparsed}/{len(json_files)} JSON files (removed: {len(removed)})")
+    if fmt == "duckdb":
+        print(f"Inserted {len(changed_records)} records, {len(changed_violations)} violations "
+              f"(replaced {len(stale_uids)} stale record ids) → {output_dir / DUCKDB_FILE}")
+    else:
+        records_path, violations_path = table_paths(output_dir, fmt)
+        print(f"Written {len(record_rows)} records → {records_path}")
+        print(f"Written {len(violation_rows)} violations → {violations_path}")
 
-            source_file = data.get("source_file", "")
-            model = data.get("model", "")
-            generated_at_utc = data.get("generated_at_utc", "")
-
-            for rec_idx, rec in enumerate(data.get("records", [])):
-                record_uid += 1
-                violations = rec.get("possible_violations") or []
-                evidence_pages = rec.get("evidence_pages") or []
-
-                rw.writerow({
-                    "record_uid": record_uid,
-                    "batch": batch,
-                    "source_file": source_file,
-                    "record_index": rec_idx,
-                    "model": model,
-                    "generated_at_utc": generated_at_utc,
-                    "sir_id": rec.get("sir_id", ""),
-                    "report_date": rec.get("report_date", ""),
-                    "incident_date": rec.get("incident_date", ""),
-                    "location_details": rec.get("location_details", ""),
-                    "where_clear": rec.get("where_clear", ""),
-                    "location_text_raw": rec.get("location_text_raw", ""),
-                    "country_or_area": rec.get("country_or_area", ""),
-                    "location_type": rec.get("location_type", ""),
-                    "precision_level": rec.get("precision_level", ""),
-                    "geocodable": rec.get("geocodable", ""),
-                    "geocodable_query": rec.get("geocodable_query", ""),
-                    "lat": rec.get("lat", ""),
-                    "lon": rec.get("lon", ""),
-                    "uncertainty_note": rec.get("uncertainty_note", ""),
-                    "dead_confirmed": rec.get("dead_confirmed", ""),
-                    "injured_confirmed": rec.get("injured_confirmed", ""),
-                    "missing_confirmed": rec.get("missing_confirmed", ""),
-                    "dead_possible_min": rec.get("dead_possible_min", ""),
-                    "dead_possible_max": rec.get("dead_possible_max", ""),
-                    "possible_violations_count": len(violations),
-                    "context_note": rec.get("context_note", ""),
-                    "libyan_coast_guard_involved": rec.get("libyan_coast_guard_involved", ""),
-                    "evidence_quote": rec.get("evidence_quote", ""),
-                    "confidence": rec.get("confidence", ""),
-                    "evidence_pages": ",".join(str(p) for p in evidence_pages),
-                })
-                records_written += 1
-
-                for v_idx, v in enumerate(violations):
-                    vw.writerow({
-                        "record_uid": record_uid,
-                        "sir_id": rec.get("sir_id", ""),
-                        "source_file": source_file,
-                        "violation_index": v_idx,
-                        "violation_name": v.get("violation_name", ""),
-                        "legal_basis": v.get("legal_basis", ""),
-                        "assessment": v.get("assessment", ""),
-                    })
-                    violations_written += 1
-
-    print(f"Written {records_written} records → {output_dir / 'sir_records.csv'}")
-    print(f"Written {violations_written} violations → {output_dir / 'violations.csv'}")
+    if dedup_modes and fmt == "duckdb":
+        record_rows = read_duckdb_table(output_dir, "sir_records")
+        violation_rows = read_duckdb_table(output_dir, "violations")
+    only_additions = bool(manifest) and not stale_uids
+    for mode in dedup_modes:
+        run_dedup(
+            output_dir, fmt, mode, record_rows, violation_rows,
+            added_rows=changed_records if only_additions else None,
+        )
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Build relational CSVs from SIR extracted JSON files.")
+    parser = argparse.ArgumentParser(description="Build relational tables from SIR extracted JSON files.")
     parser.add_argument("--input-dir", default="analysis_output", type=Path,
                         help="Directory containing .extracted.json files (default: analysis_output)")
     parser.add_argument("--output-dir", default="output_csv", type=Path,
-                        help="Directory for output CSVs (default: output_csv)")
+                        help="Directory for output tables (default: output_csv)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-read only new/changed JSON files using the build manifest")
+    parser.add_argument("--format", choices=FORMATS, default="csv",
+                        help="Output format: csv, parquet or duckdb (default: csv)")
+    parser.add_argument("--dedup", action="append", choices=DEDUP_MODES, default=[],
+                        help="Also write the strict and/or conservative dedup tables (repeatable)")
     args = parser.parse_args()
 
-    build_csvs(args.input_dir, args.output_dir)
+    build_tables(args.input_dir, args.output_dir, incremental=args.incremental, fmt=args.format,
+                 dedup_modes=tuple(dict.fromkeys(args.dedup)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Local pre-classifier: scores each PDF for Serious Incident Report content from its
+text layer (plus page count and metadata title), without any API call.
+
+Labels:
+- sir      SIR markers found in the text layer
+- non_sir  readable text layer without any SIR marker: safe to skip before extraction
+- unknown  little or no text layer (scanned), unreadable PDF, or weak markers only:
+           left to the API
+
+The markers are the ones used by the empty-output audit (docs/empty-json-audit-2026-02-17.md).
+Compares the labels with the existing outputs in analysis_output/ (empty vs non-empty
+records) and reports the precision of the non_sir skip.
+
+Usage:
+    python3 classify_sir_pdfs.py pdfs
+    python3 classify_sir_pdfs.py pdfs --output-dir analysis_output --report tmp/preclassify.tsv
+"""
+
+import argparse
+import csv
+import json
+import logging
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+DEFAULT_MAX_PAGES = 30
+# Below this many text characters per page read, the PDF is treated as scanned.
+MIN_TEXT_CHARS_PER_PAGE = 120
+# (name, pattern, weight): strong markers alone are enough for "sir".
+SIR_MARKERS = (
+    ("sir_phrase", re.compile(r"serious\s+incident\s+report", re.IGNORECASE), 3),
+    ("sir_number", re.compile(r"\bSIR\s*[-_/]?\s*(?:no\.?\s*)?\d{2,}\b", re.IGNORECASE), 3),
+    ("sir_id", re.compile(r"\b\d{3,6}/20\d{2}\b"), 1),
+    ("incident_report", re.compile(r"incident\s+report", re.IGNORECASE), 1),
+    ("sir_word", re.compile(r"\bSIRs?\b"), 1),
+)
+SIR_SCORE_THRESHOLD = 3
+LABELS = ("sir", "non_sir", "unknown")
+
+
+def require_pypdf():
+    try:
+        import pypdf
+    except ImportError:
+        sys.exit("PDF pre-classification requires the 'pypdf' package (pip install pypdf)")
+    # Broken/LFS-pointer PDFs end up "unknown"; pypdf's own warnings are just noise here.
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    return pypdf
+
+
+def read_text_layer(pdf_path: Path, max_pages: int = DEFAULT_MAX_PAGES) -> tuple[int, int, str]:
+    """Return (total pages, pages read, text of the first `max_pages` pages + title)."""
+    pypdf = require_pypdf()
+    reader = pypdf.PdfReader(str(pdf_path))
+    total = len(reader.pages)
+    parts = []
+    title = (reader.metadata or {}).get("/Title")
+    if title:
+        parts.append(str(title))
+    pages_read = min(total, max_pages)
+    for page in reader.pages[:pages_read]:
+        parts.append(page.extract_text() or "")
+    return total, pages_read, "\n".join(parts)
+
+
+def classify_text(text: str, pages_read: int) -> tuple[str, int, dict[str, int]]:
+    """Return (label, score, marker hits)."""
+    hits = {name: len(pattern.findall(text)) for name, pattern, _ in SIR_MARKERS}
+    score = sum(min(hits[name], 5) * weight for name, _, weight in SIR_MARKERS)
+    text_chars = len("".join(text.split()))
+    if score >= SIR_SCORE_THRESHOLD:
+        return "sir", score, hits
+    if score == 0 and text_chars >= MIN_TEXT_CHARS_PER_PAGE * max(1, pages_read):
+        return "non_sir", score, hits
+    return "unknown", score, hits
+
+
+def classify_pdf(pdf_path: Path, max_pages: int = DEFAULT_MAX_PAGES) -> dict:
+    try:
+        pages, pages_read, text = read_text_layer(pdf_path, max_pages)
+    except Exception as exc:  # pypdf raises many types on broken/non-PDF input
+        return {
+            "path": str(pdf_path),
+            "label": "unknown",
+            "score": 0,
+            "pages": 0,
+            "text_chars": 0,
+            "hits": {},
+            "reason": f"unreadable: {type(exc).__name__}",
+        }
+    label, score, hits = classify_text(text, pages_read)
+    text_chars = len("".join(text.split()))
+    reason = ""
+    if label == "unknown":
+        reason = "no text layer" if score == 0 else "weak markers"
+    return {
+        "path": str(pdf_path),
+        "label": label,
+        "score": score,
+        "pages": pages,
+        "text_chars": text_chars,
+        "hits": hits,
+        "reason": reason,
+    }
+
+
+def expected_output_path(pdf_path: Path, input_root: Path, output_dir: Path) -> Path:
+    """Same layout as extract_sir_pdf_gemini.py: <output>/<top folder>/<stem>.extracted.json."""
+    rel = pdf_path.relative_to(input_root)
+    group_dir = output_dir / rel.parts[0] if len(rel.parts) > 1 else output_dir
+    return group_dir / f"{pdf_path.stem}.extracted.json"
+
+
+def output_record_count(path: Path) -> int | None:
+    try:
+        return len(json.loads(path.read_text(encoding="utf-8")).get("records") or [])
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return None
+
+
+def evaluate(rows: list[dict]) -> dict:
+    """Compare labels with existing outputs: empty records ~ non-SIR document."""
+    with_output = [r for r in rows if r["output_records"] is not None]
+    empty = [r for r in with_output if r["output_records"] == 0]
+    skipped = [r for r in with_output if r["label"] == "non_sir"]
+    skipped_empty = [r for r in skipped if r["output_records"] == 0]
+    return {
+        "files": len(rows),
+        "labels": {label: sum(1 for r in rows if r["label"] == label) for label in LABELS},
+        "with_output": len(with_output),
+        "empty_outputs": len(empty),
+        "predicted_non_sir": len(skipped),
+        "non_sir_on_empty": len(skipped_empty),
+        "skip_precision": round(len(skipped_empty) / len(skipped), 3) if skipped else None,
+        "empty_recall": round(len(skipped_empty) / len(empty), 3) if empty else None,
+        "false_skips": [r["path"] for r in skipped if r["output_records"] > 0],
+    }
+
+
+def write_report(path: Path, rows: list[dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fields = ["path", "label", "score", "pages", "text_chars", "output_records", "reason", "hits"]
+    with path.open("w", encoding="utf-8", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields, delimiter="\t")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row, "hits": json.dumps(row["hits"])})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Classify PDFs as SIR / non-SIR from their text layer")
+    parser.add_argument("input_path", help="PDF file or directory (e.g. pdfs)")
+    parser.add_argument("--output-dir", default="analysis_output",
+                        help="Existing extraction outputs to compare with (default: analysis_output)")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES,
+                        help=f"Pages of text read per PDF (default: {DEFAULT_MAX_PAGES})")
+    parser.add_argument("--report", help="Write per-file labels and scores to this TSV")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel processes (default: 4)")
+    args = parser.parse_args()
+
+    require_pypdf()
+    input_path = Path(args.input_path)
+    if input_path.is_file():
+        pdfs, input_root = [input_path], input_path.parent
+    elif input_path.is_dir():
+        pdfs, input_root = sorted(input_path.rglob("*.pdf")), input_path
+    else:
+        print(f"Input path not found: {input_path}", file=sys.stderr)
+        return 1
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        rows = list(pool.map(classify_pdf, pdfs, [args.max_pages] * len(pdfs), chunksize=4))
+    output_dir = Path(args.output_dir)
+    for pdf_path, row in zip(pdfs, rows):
+        row["output_records"] = output_record_count(
+            expected_output_path(pdf_path, input_root, output_dir)
+        )
+
+    stats = evaluate(rows)
+    labels = stats["labels"]
+    print(f"PDFs classified : {stats['files']} "
+          f"(sir={labels['sir']} non_sir={labels['non_sir']} unknown={labels['unknown']})")
+    print(f"With output     : {stats['with_output']} ({stats['empty_outputs']} with records: [])")
+    print(f"non_sir vs out. : {stats['predicted_non_sir']} predicted, "
+          f"{stats['non_sir_on_empty']} on empty outputs")
+    print(f"Skip precision  : {stats['skip_precision']}  (non_sir that really came back empty)")
+    print(f"Empty recall    : {stats['empty_recall']}  (empty outputs the skip would have avoided; "
+          f"each costs 1 upload + 2 generate calls)")
+    for path in stats["false_skips"]:
+        print(f"  [FALSE SKIP] {path}")
+    if args.report:
+        write_report(Path(args.report), rows)
+        print(f"Report          : {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
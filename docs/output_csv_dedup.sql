@@ -1,6 +1,9 @@
 -- Dedup workflow for output_csv/sir_records.csv
 -- Objective: keep one best row per sir_id using transparent ranking criteria.
 --
+-- Native equivalent (same ranking, runs inside the build):
+-- python3 build_sir_csv.py --dedup strict
+--
 -- Run:
 -- duckdb :memory: ".read docs/output_csv_dedup.sql"
 
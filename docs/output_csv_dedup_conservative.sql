@@ -12,6 +12,9 @@
 --
 -- Within each (sir_id, signature), keep the best row by quality ranking.
 --
+-- Native equivalent (same ranking, runs inside the build):
+-- python3 build_sir_csv.py --dedup conservative
+--
 -- Run:
 -- duckdb :memory: ".read docs/output_csv_dedup_conservative.sql"
 
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Downloads the files listed in zip_urls.txt (ZIP or PDF) into rawdata/:
+- several downloads run in parallel, with a per-host connection cap and pause
+- partial downloads resume with an HTTP Range request from <name>.part
+- a file is renamed into place only after its size and ZIP CRCs / PDF header+trailer check out
+- existing files that fail the check (e.g. a truncated ZIP) are resumed, not skipped
+
+Usage:
+    python3 download_sir_files.py zip_urls.txt
+    python3 download_sir_files.py zip_urls.txt --zip-dir rawdata --workers 8 --per-host 2
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlsplit
+
+import requests
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; frontex-sir-scraper/1.0)"}
+CHUNK_SIZE = 1 << 16
+PART_SUFFIX = ".part"
+
+
+def read_url_list(path: Path) -> list[str]:
+    """URLs in file order; blank lines and '#' comments are ignored."""
+    urls = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith("#") and line not in urls:
+            urls.append(line)
+    return urls
+
+
+def target_name(url: str) -> str:
+    """Local file name, same rule as process_sir_zips.sh (basename, spaces → _)."""
+    name = os.path.basename(url.split("?", 1)[0])
+    return name.replace(" ", "_")
+
+
+def verify_file(path: Path, expected_size: int | None = None) -> str | None:
+    """Return None if the file looks complete, otherwise a reason."""
+    size = path.stat().st_size
+    if size == 0:
+        return "empty file"
+    if expected_size is not None and size != expected_size:
+        return f"size {size} != expected {expected_size}"
+    suffix = path.name.removesuffix(PART_SUFFIX).lower()
+    if suffix.endswith(".zip"):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                bad = zf.testzip()
+        except (zipfile.BadZipFile, OSError) as exc:
+            return f"bad zip ({exc})"
+        if bad is not None:
+            return f"CRC error in member {bad}"
+    elif suffix.endswith(".pdf"):
+        with open(path, "rb") as fh:
+            if not fh.read(5).startswith(b"%PDF"):
+                return "missing %PDF header"
+            fh.seek(max(0, size - 2048))
+            if b"%%EOF" not in fh.read():
+                return "missing %%EOF trailer (truncated?)"
+    return None
+
+
+class HostLimiter:
+    """Caps concurrent connections per host and spaces request starts."""
+
+    def __init__(self, per_host: int, delay: float) -> None:
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores: dict[str, threading.Semaphore] = {}
+        self._next_start: dict[str, float] = {}
+
+    def _semaphore(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            return self._semaphores.setdefault(host, threading.Semaphore(self.per_host))
+
+    def acquire(self, host: str) -> None:
+        self._semaphore(host).acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, host: str) -> None:
+        self._semaphore(host).release()
+
+
+def _expected_total(response: requests.Response, offset: int) -> int | None:
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length) + (offset if response.status_code == 206 else 0)
+    return None
+
+
+def download_one(
+    session: requests.Session,
+    url: str,
+    dest_dir: Path,
+    limiter: HostLimiter,
+    retries: int = 3,
+    backoff: float = 2.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> tuple[str, Path]:
+    """Download `url` into `dest_dir`; return (status, path), status in new/skipped."""
+    final_path = dest_dir / target_name(url)
+    part_path = final_path.with_name(final_path.name + PART_SUFFIX)
+
+    if final_path.exists():
+        problem = verify_file(final_path)
+        if problem is None:
+            print(f"[SKIP download] {final_path.name}")
+            return "skipped", final_path
+        # Keep the bytes we have: a truncated file is resumed, not thrown away.
+        print(f"[RESUME] {final_path.name}: {problem}")
+        os.replace(final_path, part_path)
+
+    host = urlsplit(url).netloc
+    for attempt in range(retries):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = dict(HEADERS)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        wait = 0.0
+        limiter.acquire(host)
+        try:
+            print(f"[DOWNLOAD] {url} -> {final_path}" + (f" (from byte {offset})" if offset else ""))
+            with session.get(url, headers=headers, stream=True, timeout=60) as r:
+                if r.status_code == 416 and offset:
+                    expected = None  # server says we already have every byte
+                else:
+                    r.raise_for_status()
+                    mode = "ab" if r.status_code == 206 else "wb"
+                    expected = _expected_total(r, offset)
+                    with open(part_path, mode) as fh:
+                        for chunk in r.iter_content(CHUNK_SIZE):
+                            fh.write(chunk)
+            problem = verify_file(part_path, expected)
+            if problem is None:
+                os.replace(part_path, final_path)
+                return "new", final_path
+            if r.status_code == 416:
+                part_path.unlink()  # complete-looking but corrupt: start over
+            raise ValueError(f"integrity check failed: {problem}")
+        except (requests.RequestException, ValueError) as exc:
+            status = getattr(getattr(exc, "response", None), "status_code", None)
+            permanent = status is not None and 400 <= status < 500 and status not in (408, 429)
+            if permanent or attempt == retries - 1:
+                raise
+            wait = backoff * 2**attempt
+            print(f"  [RETRY {attempt + 1}/{retries}] {final_path.name}: {exc} — waiting {wait:g}s",
+                  file=sys.stderr)
+        finally:
+            limiter.release(host)
+        # Back off without holding the per-host slot, so other files keep downloading.
+        if wait:
+            sleep(wait)
+    raise RuntimeError("unreachable")
+
+
+def download_all(
+    urls: list[str],
+    dest_dir: Path,
+    workers: int = 4,
+    per_host: int = 2,
+    delay: float = 0.5,
+    session: requests.Session | None = None,
+) -> dict[str, int]:
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    session = session or requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(workers, 10))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    limiter = HostLimiter(per_host, delay)
+    counts = {"new": 0, "skipped": 0, "failed": 0}
+
+    def run(url: str) -> str:
+        try:
+            status, _ = download_one(session, url, dest_dir, limiter)
+            return status
+        except Exception as exc:
+            print(f"[ERROR] {url}: {exc}", file=sys.stderr)
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for status in pool.map(run, urls):
+            counts[status] += 1
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Download SIR ZIP/PDF files in parallel")
+    parser.add_argument("urls_file", help="File with one URL per line (e.g. zip_urls.txt)")
+    parser.add_argument("--zip-dir", default="rawdata", help="Download directory (default: rawdata)")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel downloads (default: 4)")
+    parser.add_argument("--per-host", type=int, default=2,
+                        help="Max concurrent connections per host (default: 2)")
+    parser.add_argument("--delay", type=float, default=0.5,
+                        help="Min seconds between request starts on the same host (default: 0.5)")
+    args = parser.parse_args()
+
+    urls_path = Path(args.urls_file)
+    if not urls_path.is_file():
+        print(f"Input file not found: {urls_path}", file=sys.stderr)
+        return 1
+
+    counts = download_all(
+        read_url_list(urls_path),
+        Path(args.zip_dir),
+        workers=args.workers,
+        per_host=args.per_host,
+        delay=args.delay,
+    )
+    print(f"Downloads: new={counts['new']} skipped={counts['skipped']} failed={counts['failed']}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,14 +3,20 @@ from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
 import json
 import os
+import random
 import re
+import shutil
 import sys
+import tempfile
+import threading
 import time
-from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Any, Callable, Iterable, Iterator, Literal, Optional
 
 from google import genai
 from google.genai import types
@@ -33,15 +39,126 @@ SIR_ID_PATTERN = re.compile(r"\b\d+/\d{4}\b")
 ANNUAL_REPORT_PATTERN = re.compile(
     r"(?<![a-z0-9])annual[\s_-]*report(?=[^a-z0-9]|$)", flags=re.IGNORECASE
 )
-UPLOAD_RETRYABLE_ERROR_PATTERNS = (
+# Error classes for RetryPolicy: quota and transient errors are retried, permanent and
+# validation errors are not. Matched on the HTTP code when the SDK sets one, else on
+# the lower-cased message.
+QUOTA_ERROR_PATTERNS = ("429", "resource_exhausted", "quota", "rate limit")
+TRANSIENT_ERROR_PATTERNS = (
     "failed to create file",
-    "429",
     "500",
+    "502",
     "503",
-    "resource_exhausted",
+    "504",
     "unavailable",
     "deadline_exceeded",
     "internal",
+    "timed out",
+    "timeout",
+    "connection",
+)
+TRANSIENT_HTTP_CODES = {408, 500, 502, 503, 504}
+RETRY_DELAY_PATTERN = re.compile(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s")
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+# Gemini bills each PDF page as a fixed number of input tokens.
+TOKENS_PER_PDF_PAGE = 258
+# Bump when SirRecord/BatchOutput change shape: invalidates cached extractions.
+SCHEMA_VERSION = 1
+CONFIDENCE_RANK = {"high": 2, "medium": 1, "low": 0}
+GENERATION_CONFIG = {"temperature": 0, "response_mime_type": "application/json"}
+RETRY_EMPTY_PROMPT_NOTE = (
+    "\n\nNOTA: il tentativo precedente non ha trovato SIR. "
+    "Ricontrolla con attenzione: il documento potrebbe contenere SIR con ID "
+    "solo numerico (es. 'no. 911') o senza numero. "
+    "Se esistono blocchi 'Serious Incident Report', estraili."
+)
+SUMMARY_FIELDS = [
+    "source_file",
+    "model",
+    "sir_id",
+    "report_date",
+    "incident_date",
+    "location_details",
+    "where_clear",
+    "location_text_raw",
+    "country_or_area",
+    "location_type",
+    "precision_level",
+    "geocodable",
+    "geocodable_query",
+    "lat",
+    "lon",
+    "uncertainty_note",
+    "dead_confirmed",
+    "injured_confirmed",
+    "missing_confirmed",
+    "dead_possible_min",
+    "dead_possible_max",
+    "possible_violations_count",
+    "possible_violations_json",
+    "libyan_coast_guard_involved",
+    "confidence",
+    "evidence_pages",
+    "evidence_quote",
+    "context_note",
+]
+FILE_TOTAL_FIELDS = (
+    "records_total",
+    "dead_confirmed_total",
+    "injured_confirmed_total",
+    "missing_confirmed_total",
+    "dead_possible_total_min",
+    "dead_possible_total_max",
+    "records_invalid_skipped",
+)
+# RunCounters rolled up into summary_totals.json (timings in ms, tokens from usage metadata).
+TOTALS_COUNTER_FIELDS = (
+    "cache_hits",
+    "cache_misses",
+    "uploads",
+    "uploads_avoided",
+    "prompt_tokens",
+    "cached_prompt_tokens",
+    "output_tokens",
+    "thinking_tokens",
+    "extraction_calls",
+    "retry_empty_calls",
+    "triage_calls",
+    "triage_sir",
+    "triage_non_sir",
+    "triage_unsure",
+    "extraction_calls_avoided",
+    "generate_retries",
+    "upload_retries",
+    "upload_ms",
+    "generate_ms",
+    "validate_ms",
+    "rate_limit_wait_ms",
+    "retry_wait_ms",
+    "quota_errors",
+)
+# USD per 1M tokens: (input, output incl. thinking, cached input). Longest prefix wins;
+# see docs/model-requirements.md. Unknown models are reported with a cost of 0.
+MODEL_PRICES_USD_PER_1M = {
+    "gemini-2.5-flash": (0.30, 2.50, 0.03),
+    "gemini-2.5-flash-lite": (0.10, 0.40, 0.01),
+    "gemini-2.5-pro": (1.25, 10.00, 0.125),
+    "gemini-3-flash": (0.50, 3.00, 0.05),
+}
+# summary_totals.json fields that describe the last run, not the corpus:
+# replaced (not accumulated) when an incremental run updates a summary.
+SUMMARY_RUN_FIELDS = (
+    "generated_at_utc",
+    "model",
+    "files_failed",
+    "files_skipped_annual_report",
+    "files_skipped_non_sir",
+    "files_skipped_by_limit",
+)
+WINDOW_PROMPT_NOTE = (
+    "\n\nNOTA: questo PDF contiene solo le pagine {start}-{end} di un documento di "
+    "{total} pagine. In evidence_pages usa i numeri di pagina di questo PDF "
+    "(la sua prima pagina è 1). Estrai anche i SIR che iniziano o finiscono fuori "
+    "da queste pagine, con le sole informazioni visibili qui."
 )
 
 
@@ -245,6 +362,12 @@ class BatchOutput(BaseModel):
     dead_possible_total_min: int = Field(ge=0)
     dead_possible_total_max: int = Field(ge=0)
     records_invalid_skipped: int = Field(default=0, ge=0)
+    extraction_key: Optional[str] = None
+    # Set to "non_sir" when the triage cascade skipped the full extraction.
+    triage: Optional[str] = None
+    # Outputs written before this field existed have no schema_version in their
+    # JSON (version 0): migrate_sir_outputs.py upgrades them.
+    schema_version: int = SCHEMA_VERSION
 
 
 def normalize_model_name(model: str) -> str:
@@ -301,6 +424,32 @@ def is_annual_report_pdf(path: Path) -> bool:
     return bool(ANNUAL_REPORT_PATTERN.search(str(path)))
 
 
+def parse_shard(value: str) -> tuple[int, int]:
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {value!r}") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {value!r}: need 1 <= i <= N")
+    return index - 1, count
+
+
+def shard_assignments(pdfs: list[Path], count: int) -> dict[Path, int]:
+    """Split PDFs into `count` shards by page count; copies of a PDF share a shard."""
+    by_sha: dict[str, list[Path]] = {}
+    for pdf in pdfs:
+        by_sha.setdefault(file_sha256(pdf), []).append(pdf)
+    pages = {sha: count_pdf_pages(paths[0]) for sha, paths in by_sha.items()}
+    loads = [0] * count
+    assignment: dict[Path, int] = {}
+    for sha in sorted(by_sha, key=lambda sha: (-pages[sha], sha)):
+        shard = min(range(count), key=lambda idx: (loads[idx], idx))
+        loads[shard] += pages[sha]
+        for pdf in by_sha[sha]:
+            assignment[pdf] = shard
+    return assignment
+
+
 def build_prompt(prompt_path: Path) -> str:
     if not prompt_path.exists():
         raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
@@ -327,36 +476,647 @@ def extract_json(text: str) -> dict:
     raise ValueError("Could not parse JSON from model response")
 
 
-def is_retryable_upload_error(exc: Exception) -> bool:
+def count_pdf_pages(pdf_path: Path) -> int:
+    try:
+        import pypdf
+    except ImportError:
+        pypdf = None
+    if pypdf is not None:
+        try:
+            return max(1, len(pypdf.PdfReader(str(pdf_path)).pages))
+        except Exception:
+            pass
+    # Without pypdf: byte scan, which misses pages inside compressed object streams.
+    try:
+        data = pdf_path.read_bytes()
+    except OSError:
+        return 1
+    return max(1, len(PDF_PAGE_PATTERN.findall(data)))
+
+
+def estimate_request_tokens(pdf_path: Path, prompt: str) -> int:
+    return count_pdf_pages(pdf_path) * TOKENS_PER_PDF_PAGE + len(prompt) // 4
+
+
+class RateLimiter:
+    """Token buckets for requests and input tokens per minute, shared by all workers."""
+
+    def __init__(
+        self, requests_per_minute: float = 0, tokens_per_minute: float = 0
+    ) -> None:
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.token_capacity = float(tokens_per_minute)
+        self._requests = 1.0
+        self._tokens = self.token_capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.request_rate > 0:
+            self._requests = min(1.0, self._requests + elapsed * self.request_rate)
+        if self.token_rate > 0:
+            self._tokens = min(
+                self.token_capacity, self._tokens + elapsed * self.token_rate
+            )
+
+    def acquire(self, tokens: int = 0) -> float:
+        waited = 0.0
+        if self.token_rate > 0:
+            tokens = min(tokens, int(self.token_capacity))
+        while True:
+            with self._lock:
+                self._refill()
+                delay = 0.0
+                if self.request_rate > 0 and self._requests < 1.0:
+                    delay = (1.0 - self._requests) / self.request_rate
+                if self.token_rate > 0 and self._tokens < tokens:
+                    delay = max(delay, (tokens - self._tokens) / self.token_rate)
+                if delay <= 0:
+                    if self.request_rate > 0:
+                        self._requests -= 1.0
+                    if self.token_rate > 0:
+                        self._tokens -= tokens
+                    return waited
+            time.sleep(delay)
+            waited += delay
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        if self.token_rate <= 0 or actual_tokens is None:
+            return
+        with self._lock:
+            self._tokens -= actual_tokens - estimated_tokens
+
+
+class QuotaExhausted(RuntimeError):
+    """Call given up on quota errors: the PDF is deferred, not failed."""
+
+
+def classify_error(exc: Exception) -> str:
+    """'quota', 'transient', 'permanent' or 'validation'."""
+    if isinstance(exc, QuotaExhausted):
+        return "quota"
+    if isinstance(exc, ValueError):  # includes JSONDecodeError and pydantic's ValidationError
+        return "validation"
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and 400 <= code < 600:
+        if code == 429:
+            return "quota"
+        return "transient" if code in TRANSIENT_HTTP_CODES else "permanent"
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return "transient"
     message = str(exc).lower()
-    return any(pattern in message for pattern in UPLOAD_RETRYABLE_ERROR_PATTERNS)
+    if any(pattern in message for pattern in QUOTA_ERROR_PATTERNS):
+        return "quota"
+    name = type(exc).__name__
+    if any(part in name for part in ("Timeout", "Connect", "Network", "RemoteProtocol")):
+        return "transient"
+    if any(pattern in message for pattern in TRANSIENT_ERROR_PATTERNS):
+        return "transient"
+    return "permanent"
+
+
+def server_retry_delay(exc: Exception) -> Optional[float]:
+    match = RETRY_DELAY_PATTERN.search(str(exc))
+    if match:
+        return float(match.group(1))
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None  # HTTP-date form: fall back to our own backoff
+
+
+class QuotaBreaker:
+    """Pauses all API calls after `threshold` quota errors in a row, then ends the run."""
+
+    def __init__(self, threshold: int = 5, pause_seconds: float = 60, pauses: int = 2) -> None:
+        self.threshold = threshold
+        self.pause_seconds = pause_seconds
+        self.pauses_left = pauses
+        self.opened = False
+        self._consecutive = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+
+    def record_quota_error(self) -> str:
+        """Returns "open", "paused" (this error tripped a pause) or ""."""
+        with self._lock:
+            if self.opened:
+                return "open"
+            if self.threshold <= 0 or time.monotonic() < self._paused_until:
+                return ""  # disabled, or sent before the pause started
+            self._consecutive += 1
+            if self._consecutive < self.threshold:
+                return ""
+            self._consecutive = 0
+            if self.pauses_left > 0:
+                self.pauses_left -= 1
+                self._paused_until = time.monotonic() + self.pause_seconds
+                print(
+                    f"[QUOTA] {self.threshold} quota errors in a row: pausing API calls "
+                    f"for {self.pause_seconds:g}s",
+                    file=sys.stderr,
+                )
+                return "paused"
+            self.opened = True
+            print(
+                "[QUOTA] quota still exhausted: ending the run, the remaining PDFs "
+                "are left for the next run",
+                file=sys.stderr,
+            )
+            return "open"
+
+    def wait(self) -> float:
+        with self._lock:
+            delay = self._paused_until - time.monotonic()
+        if not self.opened and delay > 0:
+            time.sleep(delay)
+        if self.opened:
+            raise QuotaExhausted("API quota exhausted (circuit breaker open)")
+        return max(0.0, delay)
+
+
+class RetryPolicy:
+    """Retries quota/transient errors with jittered backoff or the server's retry delay."""
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 5,
+        max_delay: float = 120,
+        breaker: Optional[QuotaBreaker] = None,
+    ) -> None:
+        self.max_retries = max(1, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+
+    def backoff(self, attempt: int, exc: Exception) -> float:
+        server_delay = server_retry_delay(exc)
+        if server_delay is not None:
+            return server_delay + random.uniform(0, 1)
+        return min(self.max_delay, self.base_delay * 2**attempt) * random.uniform(0.5, 1.0)
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        label: str,
+        counters: Optional[RunCounters] = None,
+        retry_counter: str = "",
+    ) -> Any:
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                waited = self.breaker.wait()
+                if counters is not None and waited > 0:
+                    counters.add("retry_wait_ms", int(waited * 1000))
+            try:
+                result = fn()
+            except QuotaExhausted:
+                raise
+            except Exception as exc:
+                kind = classify_error(exc)
+                state = ""
+                if kind == "quota":
+                    if counters is not None:
+                        counters.add("quota_errors")
+                    if self.breaker is not None:
+                        state = self.breaker.record_quota_error()
+                if state == "open":
+                    raise QuotaExhausted(str(exc)) from exc
+                if state != "paused":
+                    attempt += 1
+                    if kind == "quota" and attempt >= self.max_retries:
+                        raise QuotaExhausted(str(exc)) from exc
+                    if kind not in ("quota", "transient") or attempt >= self.max_retries:
+                        raise
+                if counters is not None and retry_counter:
+                    counters.add(retry_counter)
+                if state == "paused":
+                    continue  # the breaker's pause is the backoff: attempt not used up
+                wait = self.backoff(attempt - 1, exc)
+                print(
+                    f"  [{label} {attempt}/{self.max_retries}] {kind}: {exc} "
+                    f"— waiting {wait:.1f}s",
+                    file=sys.stderr,
+                )
+                if counters is not None:
+                    counters.add("retry_wait_ms", int(wait * 1000))
+                time.sleep(wait)
+            else:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return result
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def extraction_cache_key(
+    pdf_sha256: str, prompt: str, model: str, variant: str = ""
+) -> str:
+    parts = [str(SCHEMA_VERSION), model, text_sha256(prompt), pdf_sha256]
+    if variant:
+        parts.append(variant)
+    material = "\0".join(parts)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def chunk_variant(pdf_file: Path, chunk_pages: int, chunk_overlap: int) -> str:
+    if chunk_pages <= 0 or count_pdf_pages(pdf_file) <= chunk_pages:
+        return ""
+    return f"windows:{chunk_pages}/{chunk_overlap}"
+
+
+class RunCounters:
+    def __init__(self) -> None:
+        self._values: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def merge(self, other: "RunCounters") -> None:
+        for name, value in other.as_dict().items():
+            self.add(name, value)
+
+    def as_dict(self) -> dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._values.items()))
+
+
+def counter_totals(counters: RunCounters) -> dict:
+    totals = {field: counters.get(field) for field in TOTALS_COUNTER_FIELDS}
+    totals["estimated_cost_usd"] = round(counters.get("cost_micro_usd") / 1_000_000, 6)
+    return totals
+
+
+def elapsed_ms(started: float) -> int:
+    return int((time.monotonic() - started) * 1000)
+
+
+class ExtractionCache:
+    """Extraction results keyed on PDF bytes, prompt, model and SCHEMA_VERSION."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("schema_version") != SCHEMA_VERSION:
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-used time for gc()
+        except OSError:
+            pass
+        return entry.get("output")
+
+    def put(self, key: str, output: BatchOutput, pdf_sha256: str, prompt: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "key": key,
+            "schema_version": SCHEMA_VERSION,
+            "model": output.model,
+            "prompt_sha256": text_sha256(prompt),
+            "pdf_sha256": pdf_sha256,
+            "created_at_utc": datetime.now(timezone.utc).isoformat(),
+            "output": output.model_dump(mode="json"),
+        }
+        tmp_path = path.with_suffix(f".tmp{threading.get_ident()}")
+        tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def gc(self, max_age_days: float) -> tuple[int, int]:
+        removed = kept = 0
+        cutoff = time.time() - max_age_days * 86400
+        for path in sorted(self.root.glob("*/*.json")):
+            try:
+                stale = path.stat().st_mtime < cutoff
+                if not stale:
+                    entry = json.loads(path.read_text(encoding="utf-8"))
+                    stale = entry.get("schema_version") != SCHEMA_VERSION
+            except (OSError, json.JSONDecodeError):
+                stale = True
+            if stale:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                kept += 1
+        for shard in self.root.glob("*"):
+            if shard.is_dir() and not any(shard.iterdir()):
+                shard.rmdir()
+        return removed, kept
+
+
+class UploadRegistry:
+    """PDF content hash -> uploaded Gemini file, reused across runs until it expires."""
+
+    # Do not reuse a file this close to its expiry: a slow call could outlive it.
+    EXPIRY_MARGIN_SECONDS = 3600
+    DEFAULT_LIFETIME_SECONDS = 47 * 3600
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        try:
+            entries = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            entries = {}
+        self._entries: dict[str, dict] = {
+            sha: entry for sha, entry in entries.items() if not self._expired(entry)
+        }
+
+    def _expired(self, entry: dict, margin_seconds: Optional[float] = None) -> bool:
+        try:
+            expires = datetime.fromisoformat(entry["expires_at_utc"])
+        except (KeyError, TypeError, ValueError):
+            return True
+        remaining = (expires - datetime.now(timezone.utc)).total_seconds()
+        return remaining < (self.EXPIRY_MARGIN_SECONDS if margin_seconds is None else margin_seconds)
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".tmp{threading.get_ident()}")
+        tmp_path.write_text(json.dumps(self._entries, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def key_lock(self, pdf_sha256: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(pdf_sha256, threading.Lock())
+
+    def lookup(
+        self, client: genai.Client, pdf_sha256: str, margin_seconds: Optional[float] = None
+    ) -> Optional[types.File]:
+        with self._lock:
+            entry = self._entries.get(pdf_sha256)
+        if entry is None or self._expired(entry, margin_seconds):
+            return None
+        try:
+            remote = client.files.get(name=entry["name"])
+        except Exception:
+            remote = None
+        state = getattr(getattr(remote, "state", None), "name", "ACTIVE")
+        if remote is None or state != "ACTIVE" or not getattr(remote, "uri", None):
+            self.forget(pdf_sha256)
+            return None
+        return remote
+
+    def register(self, pdf_sha256: str, uploaded: types.File, pdf_file: Path) -> None:
+        expires = getattr(uploaded, "expiration_time", None)
+        if not isinstance(expires, datetime):
+            expires = datetime.now(timezone.utc) + timedelta(seconds=self.DEFAULT_LIFETIME_SECONDS)
+        with self._lock:
+            self._entries[pdf_sha256] = {
+                "name": uploaded.name,
+                "uri": uploaded.uri,
+                "expires_at_utc": expires.astimezone(timezone.utc).isoformat(),
+                "uploaded_at_utc": datetime.now(timezone.utc).isoformat(),
+                "source_file": str(pdf_file),
+            }
+            self._save()
+
+    def forget(self, pdf_sha256: str) -> None:
+        with self._lock:
+            if self._entries.pop(pdf_sha256, None) is not None:
+                self._save()
+
+    def cleanup(self, client: genai.Client) -> tuple[int, int]:
+        deleted = failed = 0
+        with self._lock:
+            entries = list(self._entries.items())
+        for sha, entry in entries:
+            try:
+                client.files.delete(name=entry["name"])
+                deleted += 1
+            except Exception as exc:
+                print(f"  [WARN] could not delete {entry['name']}: {exc}", file=sys.stderr)
+                failed += 1
+            self.forget(sha)
+        with self._lock:
+            self._save()
+        return deleted, failed
+
+
+def output_is_stale(
+    out_path: Path, pdf_file: Path, prompt: str, model: str, variant: str = ""
+) -> bool:
+    try:
+        recorded = json.loads(out_path.read_text(encoding="utf-8")).get("extraction_key")
+    except (OSError, json.JSONDecodeError):
+        return True
+    return recorded != extraction_cache_key(file_sha256(pdf_file), prompt, model, variant)
 
 
 def upload_pdf(
-    client: genai.Client, pdf_path: Path, max_retries: int = 3
+    client: genai.Client,
+    pdf_path: Path,
+    counters: Optional[RunCounters] = None,
+    retry: Optional[RetryPolicy] = None,
 ) -> types.File:
-    for attempt in range(max_retries):
+    def attempt() -> types.File:
+        with open(pdf_path, "rb") as fh:
+            return client.files.upload(
+                file=fh,
+                config=types.UploadFileConfig(
+                    mime_type="application/pdf",
+                    display_name=pdf_path.name,
+                ),
+            )
+
+    return (retry or RetryPolicy()).call(attempt, "RETRY-UPLOAD", counters, "upload_retries")
+
+
+def request_contents(file_uri: str, prompt: str) -> list[types.Part]:
+    return [
+        types.Part.from_uri(file_uri=file_uri, mime_type="application/pdf"),
+        types.Part.from_text(text=prompt),
+    ]
+
+
+class PromptCache:
+    """The extraction prompt as a Gemini cached context, reused across runs."""
+
+    DISPLAY_PREFIX = "sir-prompt-"
+    # Renew the TTL when less than this is left (at most half the TTL).
+    RENEW_MARGIN_SECONDS = 300
+
+    def __init__(
+        self, client: genai.Client, model: str, prompt: str, source: str, ttl_minutes: float
+    ) -> None:
+        self.client = client
+        self.model = model
+        self.prompt = prompt
+        self.ttl_seconds = int(ttl_minutes * 60)
+        self.ttl = f"{self.ttl_seconds}s"
+        self.renew_margin = min(self.RENEW_MARGIN_SECONDS, self.ttl_seconds / 2)
+        self.prefix = f"{self.DISPLAY_PREFIX}{source}-"
+        self.display_name = (
+            f"{self.prefix}{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]}"
+        )
+        self.name: Optional[str] = None
+        self.expires_at: Optional[datetime] = None
+        self._opened = False
+        self._lock = threading.Lock()
+
+    def _is_ours(self, cached: types.CachedContent) -> bool:
+        return (cached.display_name or "").startswith(self.prefix) and (
+            cached.model or ""
+        ).endswith(self.model)
+
+    def _track_expiry(self, cached: Any) -> None:
+        expires = getattr(cached, "expire_time", None)
+        if not isinstance(expires, datetime):
+            expires = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        self.expires_at = expires
+
+    def open(self) -> Optional[str]:
+        with self._lock:
+            if not self._opened:
+                self._opened = True
+                self._open()
+            elif self.name is not None and self._remaining() < self.renew_margin:
+                self._renew()
+            return self.name
+
+    def _remaining(self) -> float:
+        if self.expires_at is None:
+            return 0.0
+        return (self.expires_at - datetime.now(timezone.utc)).total_seconds()
+
+    def _renew(self) -> None:
         try:
-            with open(pdf_path, "rb") as fh:
-                return client.files.upload(
-                    file=fh,
-                    config=types.UploadFileConfig(
-                        mime_type="application/pdf",
-                        display_name=pdf_path.name,
+            updated = self.client.caches.update(
+                name=self.name, config=types.UpdateCachedContentConfig(ttl=self.ttl)
+            )
+            self._track_expiry(updated)
+        except Exception as exc:
+            print(f"[PROMPT CACHE] could not renew {self.name} ({exc}), reopening")
+            self.name = None
+            self._open()
+
+    def reset(self, name: str) -> None:
+        with self._lock:
+            if self.name == name:
+                self.name = None
+                self._opened = False
+
+    @staticmethod
+    def lost(exc: Exception) -> bool:
+        message = str(exc).lower()
+        return "cachedcontent" in message or (
+            "cache" in message and ("not found" in message or "expired" in message)
+        )
+
+    def _open(self) -> None:
+        try:
+            for cached in self.client.caches.list():
+                if not self._is_ours(cached):
+                    continue
+                if cached.display_name == self.display_name and self.name is None:
+                    updated = self.client.caches.update(
+                        name=cached.name, config=types.UpdateCachedContentConfig(ttl=self.ttl)
+                    )
+                    self._track_expiry(updated)
+                    self.name = cached.name
+                    print(f"[PROMPT CACHE] reusing {cached.name}")
+                else:
+                    # Older prompt version (or a duplicate): no longer valid.
+                    self.client.caches.delete(name=cached.name)
+                    print(f"[PROMPT CACHE] deleted stale {cached.name}")
+            if self.name is None:
+                created = self.client.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=self.display_name,
+                        contents=[
+                            types.Content(role="user", parts=[types.Part.from_text(text=self.prompt)])
+                        ],
+                        ttl=self.ttl,
                     ),
                 )
+                self._track_expiry(created)
+                self.name = created.name
+                print(f"[PROMPT CACHE] created {created.name}")
         except Exception as exc:
-            last_attempt = attempt == max_retries - 1
-            if last_attempt or not is_retryable_upload_error(exc):
-                raise
-            wait = 5 * 2**attempt
-            print(
-                f"  [RETRY-UPLOAD {attempt + 1}/{max_retries}] {exc} — waiting {wait}s",
-                file=sys.stderr,
-            )
-            time.sleep(wait)
-
-    raise RuntimeError("unreachable")
+            # e.g. prompt below the model's minimum cacheable size: send it inline.
+            print(f"[WARN] Prompt cache unavailable, sending the prompt inline: {exc}", file=sys.stderr)
+            self.name = None
+
+    def request(self, file_uri: str, prompt: str) -> tuple[list[types.Part], dict]:
+        if not prompt.startswith(self.prompt) or self.open() is None:
+            return request_contents(file_uri, prompt), GENERATION_CONFIG
+        contents = [types.Part.from_uri(file_uri=file_uri, mime_type="application/pdf")]
+        suffix = prompt[len(self.prompt):]
+        if suffix:
+            contents.append(types.Part.from_text(text=suffix))
+        return contents, {**GENERATION_CONFIG, "cached_content": self.name}
+
+
+def model_prices(model: str) -> Optional[tuple[float, float, float]]:
+    matches = [name for name in MODEL_PRICES_USD_PER_1M if model.startswith(name)]
+    return MODEL_PRICES_USD_PER_1M[max(matches, key=len)] if matches else None
+
+
+def record_usage(counters: RunCounters, model: str, usage: Any) -> None:
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+    output_tokens = getattr(usage, "candidates_token_count", None) or 0
+    thinking_tokens = getattr(usage, "thoughts_token_count", None) or 0
+    counters.add("prompt_tokens", prompt_tokens)
+    counters.add("cached_prompt_tokens", cached_tokens)
+    counters.add("output_tokens", output_tokens)
+    counters.add("thinking_tokens", thinking_tokens)
+    prices = model_prices(model)
+    if prices is None:
+        return
+    input_price, output_price, cached_price = prices
+    cost = (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + (output_tokens + thinking_tokens) * output_price
+    )
+    # prices are per 1M tokens, so tokens * price is already in micro-USD
+    counters.add("cost_micro_usd", round(cost))
 
 
 def call_gemini(
@@ -364,37 +1124,58 @@ def call_gemini(
     model: str,
     uploaded_file: types.File,
     prompt: str,
-    max_retries: int = 3,
+    limiter: Optional[RateLimiter] = None,
+    estimated_tokens: int = 0,
+    prompt_cache: Optional[PromptCache] = None,
+    counters: Optional[RunCounters] = None,
+    retry: Optional[RetryPolicy] = None,
 ) -> dict:
-    for attempt in range(max_retries):
+    def build_request() -> tuple[list[types.Part], dict]:
+        if prompt_cache is not None:
+            return prompt_cache.request(uploaded_file.uri, prompt)
+        return request_contents(uploaded_file.uri, prompt), GENERATION_CONFIG
+
+    def send(contents: list[types.Part], config: dict) -> Any:
+        if limiter is not None:
+            waited = limiter.acquire(estimated_tokens)
+            if waited >= 1:
+                print(f"  [WAIT] rate limit: waited {waited:.1f}s")
+            if counters is not None:
+                counters.add("rate_limit_wait_ms", int(waited * 1000))
+        started = time.monotonic()
         try:
-            response = client.models.generate_content(
+            return client.models.generate_content(
                 model=model,
-                contents=[
-                    types.Part.from_uri(
-                        file_uri=uploaded_file.uri,
-                        mime_type="application/pdf",
-                    ),
-                    types.Part.from_text(text=prompt),
-                ],
-                config={
-                    "temperature": 0,
-                    "response_mime_type": "application/json",
-                },
+                contents=contents,
+                config=config,
             )
-            text = getattr(response, "text", None)
-            if not text:
-                raise ValueError("Gemini response did not contain text output")
-            return extract_json(text)
-        except (ValueError, json.JSONDecodeError):
-            raise
+        finally:
+            if counters is not None:
+                counters.add("generate_ms", elapsed_ms(started))
+
+    def attempt() -> dict:
+        contents, config = build_request()
+        try:
+            response = send(contents, config)
         except Exception as exc:
-            if attempt == max_retries - 1:
+            cache_name = config.get("cached_content")
+            if not cache_name or not PromptCache.lost(exc):
                 raise
-            wait = 5 * 2**attempt
-            print(f"  [RETRY {attempt + 1}/{max_retries}] {exc} — waiting {wait}s")
-            time.sleep(wait)
-    raise RuntimeError("unreachable")
+            # Expired or deleted under us: resend inline now, later calls reopen the cache.
+            print(f"  [PROMPT CACHE] {cache_name} is gone ({exc}), sending the prompt inline")
+            prompt_cache.reset(cache_name)
+            response = send(request_contents(uploaded_file.uri, prompt), GENERATION_CONFIG)
+        usage = getattr(response, "usage_metadata", None)
+        if limiter is not None:
+            limiter.settle(estimated_tokens, getattr(usage, "prompt_token_count", None))
+        if counters is not None:
+            record_usage(counters, model, usage)
+        text = getattr(response, "text", None)
+        if not text:
+            raise ValueError("Gemini response did not contain text output")
+        return extract_json(text)
+
+    return (retry or RetryPolicy()).call(attempt, "RETRY", counters, "generate_retries")
 
 
 def sum_opt(records: list[SirRecord], attr: str) -> int:
@@ -466,46 +1247,15 @@ def parse_valid_sir_records(
     return valid_records, skipped
 
 
-def process_file(
-    client: genai.Client,
-    model: str,
+def build_batch_output(
     pdf_file: Path,
-    out_dir: Path,
-    skip_existing: bool,
-    prompt_path: Path,
-) -> tuple[Path, BatchOutput]:
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir / f"{pdf_file.stem}.extracted.json"
-
-    if skip_existing and out_path.exists():
-        print(f"  [SKIP] {out_path} already exists")
-        existing = BatchOutput.model_validate_json(out_path.read_text(encoding="utf-8"))
-        return out_path, existing
-
-    prompt = build_prompt(prompt_path)
-    uploaded = upload_pdf(client, pdf_file)
-    try:
-        raw_json = call_gemini(client, model, uploaded, prompt)
-        records, records_invalid_skipped = parse_valid_sir_records(raw_json, pdf_file)
-        if not records:
-            retry_prompt = (
-                prompt
-                + "\n\nNOTA: il tentativo precedente non ha trovato SIR. "
-                "Ricontrolla con attenzione: il documento potrebbe contenere SIR con ID "
-                "solo numerico (es. 'no. 911') o senza numero. "
-                "Se esistono blocchi 'Serious Incident Report', estraili."
-            )
-            print(f"  [RETRY EMPTY] {pdf_file.name} — second attempt")
-            raw_json2 = call_gemini(client, model, uploaded, retry_prompt)
-            records2, skipped2 = parse_valid_sir_records(raw_json2, pdf_file)
-            if records2:
-                raw_json, records, records_invalid_skipped = raw_json2, records2, skipped2
-    finally:
-        try:
-            client.files.delete(name=uploaded.name)
-        except Exception:
-            pass
-    result = BatchOutput(
+    model: str,
+    records: list[SirRecord],
+    records_invalid_skipped: int,
+    extraction_key: Optional[str] = None,
+    triage: Optional[str] = None,
+) -> BatchOutput:
+    return BatchOutput(
         source_file=str(pdf_file),
         model=model,
         generated_at_utc=datetime.now(timezone.utc).isoformat(),
@@ -516,191 +1266,1594 @@ def process_file(
         dead_possible_total_min=sum_opt(records, "dead_possible_min"),
         dead_possible_total_max=sum_max_possible(records),
         records_invalid_skipped=records_invalid_skipped,
+        extraction_key=extraction_key,
+        triage=triage,
     )
 
-    out_path.write_text(
-        json.dumps(result.model_dump(mode="json"), ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
-    return out_path, result
 
+def timed_upload(
+    client: genai.Client,
+    pdf_file: Path,
+    counters: Optional[RunCounters] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> types.File:
+    started = time.monotonic()
+    uploaded = upload_pdf(client, pdf_file, counters=counters, retry=retry)
+    if counters is not None:
+        counters.add("uploads")
+        counters.add("upload_ms", elapsed_ms(started))
+    return uploaded
 
-def write_summary(
-    records: list[dict], totals: dict, out_dir: Path
-) -> tuple[Path, Path]:
-    out_dir.mkdir(parents=True, exist_ok=True)
-    csv_path = out_dir / "summary.csv"
-    json_path = out_dir / "summary_totals.json"
 
-    fields = [
-        "source_file",
-        "model",
-        "sir_id",
-        "report_date",
-        "incident_date",
-        "location_details",
-        "where_clear",
-        "location_text_raw",
-        "country_or_area",
-        "location_type",
-        "precision_level",
-        "geocodable",
-        "geocodable_query",
-        "lat",
-        "lon",
-        "uncertainty_note",
-        "dead_confirmed",
-        "injured_confirmed",
-        "missing_confirmed",
-        "dead_possible_min",
-        "dead_possible_max",
-        "possible_violations_count",
-        "possible_violations_json",
-        "libyan_coast_guard_involved",
-        "confidence",
-        "evidence_pages",
-        "evidence_quote",
-        "context_note",
-    ]
-    with csv_path.open("w", encoding="utf-8", newline="") as fh:
-        writer = csv.DictWriter(fh, fieldnames=fields)
-        writer.writeheader()
-        for row in records:
-            row = row.copy()
-            row["evidence_pages"] = ",".join(
-                str(x) for x in row.get("evidence_pages", [])
-            )
-            violations = row.pop("possible_violations", [])
-            row["possible_violations_count"] = len(violations)
-            row["possible_violations_json"] = json.dumps(
-                violations, ensure_ascii=False
-            )
-            writer.writerow(row)
+def acquire_upload(
+    client: genai.Client,
+    pdf_file: Path,
+    uploads: Optional[UploadRegistry] = None,
+    counters: Optional[RunCounters] = None,
+    retry: Optional[RetryPolicy] = None,
+    margin_seconds: Optional[float] = None,
+) -> types.File:
+    if uploads is None:
+        return timed_upload(client, pdf_file, counters, retry)
+    pdf_sha256 = file_sha256(pdf_file)
+    with uploads.key_lock(pdf_sha256):
+        uploaded = uploads.lookup(client, pdf_sha256, margin_seconds)
+        if uploaded is not None:
+            print(f"  [UPLOAD REUSED] {pdf_file.name} -> {uploaded.name}")
+            if counters is not None:
+                counters.add("uploads_avoided")
+            return uploaded
+        uploaded = timed_upload(client, pdf_file, counters, retry)
+        uploads.register(pdf_sha256, uploaded, pdf_file)
+        return uploaded
+
+
+def timed_validation(
+    raw_json: dict, pdf_file: Path, counters: Optional[RunCounters] = None
+) -> tuple[list[SirRecord], int]:
+    started = time.monotonic()
+    try:
+        return parse_valid_sir_records(raw_json, pdf_file)
+    finally:
+        if counters is not None:
+            counters.add("validate_ms", elapsed_ms(started))
 
-    json_path.write_text(
-        json.dumps(totals, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
-    return csv_path, json_path
 
+def extract_records(
+    client: genai.Client,
+    model: str,
+    pdf_file: Path,
+    prompt: str,
+    limiter: Optional[RateLimiter] = None,
+    retry_empty: bool = True,
+    uploads: Optional[UploadRegistry] = None,
+    counters: Optional[RunCounters] = None,
+    prompt_cache: Optional[PromptCache] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> tuple[list[SirRecord], int]:
+    estimated_tokens = estimate_request_tokens(pdf_file, prompt)
+    uploaded = acquire_upload(client, pdf_file, uploads, counters, retry)
+    try:
+        if counters is not None:
+            counters.add("extraction_calls")
+        raw_json = call_gemini(
+            client,
+            model,
+            uploaded,
+            prompt,
+            limiter=limiter,
+            estimated_tokens=estimated_tokens,
+            prompt_cache=prompt_cache,
+            counters=counters,
+            retry=retry,
+        )
+        records, records_invalid_skipped = timed_validation(raw_json, pdf_file, counters)
+        if not records and retry_empty:
+            retry_prompt = prompt + RETRY_EMPTY_PROMPT_NOTE
+            print(f"  [RETRY EMPTY] {pdf_file.name} — second attempt")
+            if counters is not None:
+                counters.add("extraction_calls")
+                counters.add("retry_empty_calls")
+            raw_json2 = call_gemini(
+                client,
+                model,
+                uploaded,
+                retry_prompt,
+                limiter=limiter,
+                estimated_tokens=estimated_tokens,
+                prompt_cache=prompt_cache,
+                counters=counters,
+                retry=retry,
+            )
+            records2, skipped2 = timed_validation(raw_json2, pdf_file, counters)
+            if records2:
+                records, records_invalid_skipped = records2, skipped2
+    finally:
+        # Registered uploads stay on the provider for the next run.
+        if uploads is None:
+            try:
+                client.files.delete(name=uploaded.name)
+            except Exception:
+                pass
+    return records, records_invalid_skipped
 
-def main() -> int:
-    parser = argparse.ArgumentParser(
-        description="Extract SIR victim + location fields from PDF using Gemini File API + Pydantic schema."
-    )
-    parser.add_argument("input_path", help="PDF file or directory containing PDF files")
-    parser.add_argument(
-        "--model",
-        default="gemini-2.5-flash",
-        help="Gemini model name (default: gemini-2.5-flash)",
-    )
-    parser.add_argument(
-        "--output-dir",
-        default="analysis_output",
-        help="Directory where JSON outputs will be written",
-    )
-    parser.add_argument(
-        "--exclude",
-        action="append",
-        default=[],
-        help="Glob pattern to exclude PDF files. Can be used multiple times.",
-    )
-    parser.add_argument(
-        "--min-seconds-between-calls",
-        type=float,
-        default=4.0,
-        help="Minimum delay between Gemini API calls (default: 4.0).",
-    )
-    parser.add_argument(
-        "--skip-existing",
-        action="store_true",
-        default=True,
-        help="Skip PDFs that already have an extracted JSON output (default: on).",
-    )
-    parser.add_argument(
-        "--no-skip-existing",
-        dest="skip_existing",
-        action="store_false",
-        help="Re-process PDFs even if output already exists.",
-    )
-    parser.add_argument(
-        "--prompt-path",
-        default="prompts/extract_sir.txt",
-        help="Path to prompt file (default: prompts/extract_sir.txt)",
-    )
-    parser.add_argument(
-        "--skip-completed-groups",
-        action="store_true",
-        default=True,
-        help="Skip groups/folders that already have summary.csv (default: on).",
-    )
-    parser.add_argument(
-        "--no-skip-completed-groups",
-        dest="skip_completed_groups",
-        action="store_false",
-        help="Do not skip groups by summary.csv; useful for incremental daily batches.",
-    )
-    parser.add_argument(
-        "--max-new-files",
-        type=int,
-        default=0,
-        help="Process at most N new files requiring API calls (0 = no limit).",
-    )
-    parser.add_argument(
-        "--skip-annual-reports",
-        action="store_true",
-        default=True,
-        help="Skip PDFs that appear to be annual reports by filename/path pattern (default: on).",
-    )
-    parser.add_argument(
-        "--no-skip-annual-reports",
-        dest="skip_annual_reports",
-        action="store_false",
-        help="Do not skip annual report PDFs.",
-    )
-    parser.add_argument(
-        "--allow-file-failures",
-        action="store_true",
-        default=False,
-        help="Exit with code 0 even if some PDFs fail; failed files are still reported.",
-    )
-    args = parser.parse_args()
 
-    if args.max_new_files < 0:
-        print("--max-new-files must be >= 0", file=sys.stderr)
-        return 1
+def require_pypdf():
+    try:
+        import pypdf
+    except ImportError:
+        sys.exit("--chunk-pages requires the 'pypdf' package (pip install pypdf)")
+    return pypdf
+
+
+def page_windows(total: int, size: int, overlap: int) -> list[tuple[int, int]]:
+    step = max(1, size - overlap)
+    windows = []
+    start = 1
+    while True:
+        end = min(total, start + size - 1)
+        windows.append((start, end))
+        if end >= total:
+            return windows
+        start += step
+
+
+def write_pdf_pages(reader: Any, start: int, end: int, out_path: Path) -> None:
+    pypdf = require_pypdf()
+    writer = pypdf.PdfWriter()
+    for page_idx in range(start - 1, end):
+        writer.add_page(reader.pages[page_idx])
+    with open(out_path, "wb") as fh:
+        writer.write(fh)
+
+
+def remap_evidence_pages(record: SirRecord, start: int, end: int) -> SirRecord:
+    length = end - start + 1
+    pages = set()
+    for page in record.evidence_pages:
+        if 1 <= page <= length:
+            pages.add(page + start - 1)
+        elif start <= page <= end:
+            pages.add(page)  # the model already used the original numbering
+    return record.model_copy(update={"evidence_pages": sorted(pages)})
+
+
+def _quote_key(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def records_overlap(a: SirRecord, b: SirRecord) -> bool:
+    """Same SIR seen from two windows: same sir_id, or same quote on shared pages."""
+    shared_pages = bool(set(a.evidence_pages) & set(b.evidence_pages))
+    if a.sir_id and b.sir_id:
+        return a.sir_id == b.sir_id and (
+            shared_pages or not a.evidence_pages or not b.evidence_pages
+        )
+    qa, qb = _quote_key(a.evidence_quote), _quote_key(b.evidence_quote)
+    return shared_pages and (qa in qb or qb in qa)
 
-    if args.max_new_files > 0 and args.skip_completed_groups:
-        print(
-            "[INFO] --max-new-files detected: disabling group-summary skip for incremental processing."
+
+def merge_records(a: SirRecord, b: SirRecord) -> SirRecord:
+    def rank(rec: SirRecord) -> tuple[int, int]:
+        filled = sum(
+            1 for name in SirRecord.model_fields if getattr(rec, name) not in (None, [], "")
         )
-        args.skip_completed_groups = False
-    incremental_mode = args.max_new_files > 0
+        return filled, CONFIDENCE_RANK[rec.confidence]
 
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("Missing GEMINI_API_KEY environment variable", file=sys.stderr)
-        return 1
+    keep, other = (a, b) if rank(a) >= rank(b) else (b, a)
+    update: dict[str, Any] = {
+        name: getattr(other, name)
+        for name in SirRecord.model_fields
+        if getattr(keep, name) in (None, [], "") and getattr(other, name) not in (None, [], "")
+    }
+    update["evidence_pages"] = sorted(set(a.evidence_pages) | set(b.evidence_pages))
+    return keep.model_copy(update=update)
 
-    try:
-        targets = read_pdf_targets(args.input_path)
-    except (FileNotFoundError, ValueError) as exc:
-        print(str(exc), file=sys.stderr)
-        return 1
 
-    targets = [p for p in targets if not should_exclude(p, args.exclude)]
-    if not targets:
-        print("No .pdf files found in input path", file=sys.stderr)
-        return 1
+def merge_window_records(per_window: list[list[SirRecord]]) -> list[SirRecord]:
+    merged: list[tuple[SirRecord, set[int]]] = []
+    for window_idx, records in enumerate(per_window):
+        for rec in records:
+            for i, (existing, windows) in enumerate(merged):
+                if window_idx not in windows and records_overlap(existing, rec):
+                    merged[i] = (merge_records(existing, rec), windows | {window_idx})
+                    break
+            else:
+                merged.append((rec, {window_idx}))
+    return [rec for rec, _ in merged]
 
-    model = normalize_model_name(args.model)
-    client = genai.Client(api_key=api_key)
-    out_dir = Path(args.output_dir)
-    prompt_path = Path(args.prompt_path)
-    groups = group_targets_by_top_folder(targets, args.input_path)
+
+def extract_records_windowed(
+    client: genai.Client,
+    model: str,
+    pdf_file: Path,
+    prompt: str,
+    chunk_pages: int,
+    chunk_overlap: int,
+    limiter: Optional[RateLimiter] = None,
+    chunk_workers: int = 4,
+    uploads: Optional[UploadRegistry] = None,
+    counters: Optional[RunCounters] = None,
+    prompt_cache: Optional[PromptCache] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> tuple[list[SirRecord], int]:
+    pypdf = require_pypdf()
+    reader = pypdf.PdfReader(str(pdf_file))
+    total = len(reader.pages)
+    windows = page_windows(total, chunk_pages, chunk_overlap)
+    if len(windows) == 1:
+        return extract_records(
+            client,
+            model,
+            pdf_file,
+            prompt,
+            limiter=limiter,
+            uploads=uploads,
+            counters=counters,
+            prompt_cache=prompt_cache,
+            retry=retry,
+        )
+
+    print(
+        f"  [CHUNK] {pdf_file.name}: {total} pages -> {len(windows)} windows "
+        f"of {chunk_pages} (overlap {chunk_overlap})"
+    )
+    with tempfile.TemporaryDirectory(prefix="sir-windows-") as tmp_dir:
+        window_files = []
+        for start, end in windows:
+            window_file = Path(tmp_dir) / f"{pdf_file.stem}.p{start:04d}-{end:04d}.pdf"
+            write_pdf_pages(reader, start, end, window_file)
+            window_files.append(window_file)
+
+        def run_window(idx: int) -> tuple[list[SirRecord], int]:
+            start, end = windows[idx]
+            window_prompt = prompt + WINDOW_PROMPT_NOTE.format(
+                start=start, end=end, total=total
+            )
+            # An empty window is normal in a compilation: no per-window RETRY EMPTY.
+            records, skipped = extract_records(
+                client,
+                model,
+                window_files[idx],
+                window_prompt,
+                limiter=limiter,
+                retry_empty=False,
+                uploads=uploads,
+                counters=counters,
+                prompt_cache=prompt_cache,
+                retry=retry,
+            )
+            return [remap_evidence_pages(rec, start, end) for rec in records], skipped
+
+        with ThreadPoolExecutor(max_workers=max(1, min(chunk_workers, len(windows)))) as pool:
+            window_results = list(pool.map(run_window, range(len(windows))))
+
+    records = merge_window_records([recs for recs, _ in window_results])
+    records_invalid_skipped = sum(skipped for _, skipped in window_results)
+    print(
+        f"  [MERGE] {pdf_file.name}: "
+        f"{sum(len(recs) for recs, _ in window_results)} window records -> {len(records)}"
+    )
+    if not records:
+        print(f"  [CHUNK EMPTY] {pdf_file.name} — falling back to whole-file extraction")
+        return extract_records(
+            client,
+            model,
+            pdf_file,
+            prompt,
+            limiter=limiter,
+            uploads=uploads,
+            counters=counters,
+            prompt_cache=prompt_cache,
+            retry=retry,
+        )
+    return records, records_invalid_skipped
+
+
+def write_atomic(path: Path, write: Callable[[Any], None], mode: str = "w") -> None:
+    """Temp file + fsync + rename: a killed run never leaves a truncated file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        encoding = None if "b" in mode else "utf-8"
+        newline = None if "b" in mode else ""
+        with os.fdopen(fd, mode, encoding=encoding, newline=newline) as fh:
+            write(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def write_json_atomic(path: Path, data: dict) -> None:
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    write_atomic(path, lambda fh: fh.write(text))
+
+
+def totals_sidecar_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.name.removesuffix(".extracted.json") + ".totals.json")
+
+
+def file_totals(data: dict) -> dict:
+    totals = {field: data.get(field) or 0 for field in FILE_TOTAL_FIELDS}
+    totals["records_total"] = len(data.get("records") or [])
+    return totals
+
+
+def write_totals_sidecar(out_path: Path, totals: dict) -> None:
+    # Size + mtime of the output it describes: a hand-edited output is re-read.
+    stat = out_path.stat()
+    sidecar = dict(totals, output_size=stat.st_size, output_mtime_ns=stat.st_mtime_ns)
+    write_json_atomic(totals_sidecar_path(out_path), sidecar)
+
+
+def read_output_totals(out_path: Path) -> dict:
+    stat = out_path.stat()
+    try:
+        sidecar = json.loads(totals_sidecar_path(out_path).read_text(encoding="utf-8"))
+        if (
+            sidecar.get("output_size") == stat.st_size
+            and sidecar.get("output_mtime_ns") == stat.st_mtime_ns
+        ):
+            return {field: sidecar.get(field, 0) for field in FILE_TOTAL_FIELDS}
+    except (OSError, json.JSONDecodeError):
+        pass
+    totals = file_totals(json.loads(out_path.read_text(encoding="utf-8")))
+    write_totals_sidecar(out_path, totals)
+    return totals
+
+
+def write_batch_output(out_path: Path, result: BatchOutput) -> dict:
+    data = result.model_dump(mode="json")
+    write_json_atomic(out_path, data)
+    totals = file_totals(data)
+    write_totals_sidecar(out_path, totals)
+    return totals
+
+
+class TriageCascade:
+    """Cheap first pass: 'non_sir' PDFs get an empty output without a full extraction."""
+
+    VERDICTS = ("sir", "non_sir", "unsure")
+
+    def __init__(self, model: str, prompt: str, pages: int = 0, retry_empty: bool = True) -> None:
+        self.model = model
+        self.prompt = prompt
+        self.pages = pages
+        self.retry_empty = retry_empty
+
+    def _ask(
+        self,
+        client: genai.Client,
+        pdf_file: Path,
+        limiter: Optional[RateLimiter],
+        uploads: Optional[UploadRegistry],
+        counters: Optional[RunCounters],
+        retry: Optional[RetryPolicy],
+    ) -> dict:
+        estimated_tokens = estimate_request_tokens(pdf_file, self.prompt)
+        uploaded = acquire_upload(client, pdf_file, uploads, counters, retry)
+        try:
+            return call_gemini(
+                client,
+                self.model,
+                uploaded,
+                self.prompt,
+                limiter=limiter,
+                estimated_tokens=estimated_tokens,
+                counters=counters,
+                retry=retry,
+            )
+        finally:
+            if uploads is None:
+                try:
+                    client.files.delete(name=uploaded.name)
+                except Exception:
+                    pass
+
+    def classify(
+        self,
+        client: genai.Client,
+        pdf_file: Path,
+        limiter: Optional[RateLimiter] = None,
+        uploads: Optional[UploadRegistry] = None,
+        counters: Optional[RunCounters] = None,
+        retry: Optional[RetryPolicy] = None,
+    ) -> str:
+        try:
+            if self.pages > 0 and count_pdf_pages(pdf_file) > self.pages:
+                reader = require_pypdf().PdfReader(str(pdf_file))
+                with tempfile.TemporaryDirectory(prefix="sir-triage-") as tmp_dir:
+                    probe = Path(tmp_dir) / f"{pdf_file.stem}.p0001-{self.pages:04d}.pdf"
+                    write_pdf_pages(reader, 1, self.pages, probe)
+                    # Probe bytes are not stable across runs: never registered.
+                    answer = self._ask(client, probe, limiter, None, counters, retry)
+            else:
+                answer = self._ask(client, pdf_file, limiter, uploads, counters, retry)
+            verdict = str(answer.get("verdict", "")).strip().lower()
+            reason = answer.get("reason") or ""
+        except QuotaExhausted:
+            raise
+        except Exception as exc:
+            # A failed probe must not lose a document: let the full extraction decide.
+            verdict, reason = "unsure", f"triage failed: {exc}"
+        if verdict not in self.VERDICTS:
+            verdict = "unsure"
+        print(f"  [TRIAGE {verdict.upper()}] {pdf_file.name}" + (f" — {reason}" if reason else ""))
+        if counters is not None:
+            counters.add("triage_calls")
+            counters.add(f"triage_{verdict}")
+            if verdict == "non_sir":
+                # What the document would have cost: the extraction plus its RETRY EMPTY.
+                counters.add("extraction_calls_avoided", 2 if self.retry_empty else 1)
+        return verdict
+
+
+class TelemetryLog:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    def record(
+        self,
+        pdf_file: Path,
+        model: str,
+        counters: RunCounters,
+        total_ms: int,
+        result: Optional[tuple[Path, dict]],
+        error: Optional[Exception],
+    ) -> None:
+        if isinstance(error, QuotaExhausted):
+            status = "deferred"
+        elif error is not None:
+            status = "failed"
+        elif counters.get("cache_hits"):
+            status = "cache_hit"
+        elif counters.get("triage_non_sir"):
+            status = "triage_skip"
+        elif counters.get("extraction_calls"):
+            status = "extracted"
+        else:
+            return  # existing output reused: nothing to report
+        line = {
+            "ts_utc": datetime.now(timezone.utc).isoformat(),
+            "pdf_file": str(pdf_file),
+            "model": model,
+            "status": status,
+            "records": result[1]["records_total"] if result is not None else None,
+            "total_ms": total_ms,
+            **counters.as_dict(),
+            "estimated_cost_usd": round(counters.get("cost_micro_usd") / 1_000_000, 6),
+            "error": str(error) if error is not None else None,
+        }
+        with self._lock, self.path.open("a", encoding="utf-8") as fh:
+            fh.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+class RunJournal:
+    """Append-only, fsynced JSONL record of one run, read by --resume/--retry-failed."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, event: str, **fields: Any) -> None:
+        line = {"ts_utc": datetime.now(timezone.utc).isoformat(), "event": event, **fields}
+        with self._lock, self.path.open("a", encoding="utf-8") as fh:
+            fh.write(json.dumps(line, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def start(self, pdf_file: Path) -> None:
+        self.write("start", pdf_file=str(pdf_file))
+
+    def finish(
+        self, pdf_file: Path, out_path: Path, records: int, counters: RunCounters
+    ) -> None:
+        self.write(
+            "finish",
+            pdf_file=str(pdf_file),
+            output=str(out_path),
+            records=records,
+            counters=counters.as_dict(),
+        )
+
+    def fail(self, pdf_file: Path, error: Exception, counters: RunCounters) -> None:
+        self.write(
+            "fail",
+            pdf_file=str(pdf_file),
+            error_class=type(error).__name__,
+            error=str(error),
+            counters=counters.as_dict(),
+        )
+
+    @staticmethod
+    def latest(journal_dir: Path) -> Optional[Path]:
+        paths = sorted(journal_dir.glob("run-*.jsonl"))
+        return paths[-1] if paths else None
+
+    @staticmethod
+    def replay(path: Path, unfinished: bool, failed: bool) -> tuple[dict, list[str]]:
+        run: dict = {}
+        planned: list[str] = []
+        last_event: dict[str, str] = {}
+        for raw in path.read_text(encoding="utf-8").splitlines():
+            try:
+                line = json.loads(raw)
+            except json.JSONDecodeError:
+                continue  # last line cut by the crash
+            event = line.get("event")
+            if event == "run":
+                run = line
+            elif event == "plan":
+                planned.extend(line.get("pdf_files") or [])
+            elif event in ("start", "finish", "fail", "deferred"):
+                # PDFs deferred by the quota breaker were cut short like a crash.
+                quota = event == "deferred" and line.get("reason") == "quota"
+                last_event[line["pdf_file"]] = "start" if quota else event
+        selected = []
+        for pdf in planned:
+            event = last_event.get(pdf)
+            if (unfinished and event in (None, "start")) or (failed and event == "fail"):
+                selected.append(pdf)
+        return run, selected
+
+
+def write_prometheus_textfile(path: Path, totals: dict, duration_seconds: float) -> None:
+    lines = []
+
+    def gauge(name: str, value: float, help_text: str) -> None:
+        lines.append(f"# HELP sir_extract_{name} {help_text}")
+        lines.append(f"# TYPE sir_extract_{name} gauge")
+        lines.append(f"sir_extract_{name} {value}")
+
+    gauge("last_run_timestamp_seconds", int(time.time()), "Unix time the last run finished.")
+    gauge("last_run_duration_seconds", round(duration_seconds, 3), "Wall time of the last run.")
+    for field, value in totals.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauge(field, value, f"summary_totals.json {field} of the last run.")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def process_file(
+    client: genai.Client,
+    model: str,
+    pdf_file: Path,
+    out_dir: Path,
+    skip_existing: bool,
+    prompt: str,
+    limiter: Optional[RateLimiter] = None,
+    cache: Optional[ExtractionCache] = None,
+    counters: Optional[RunCounters] = None,
+    chunk_pages: int = 0,
+    chunk_overlap: int = 0,
+    chunk_workers: int = 4,
+    uploads: Optional[UploadRegistry] = None,
+    prompt_cache: Optional[PromptCache] = None,
+    triage: Optional[TriageCascade] = None,
+    telemetry: Optional[TelemetryLog] = None,
+    journal: Optional[RunJournal] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> tuple[Path, dict]:
+    file_counters = RunCounters()
+    started = time.monotonic()
+    result = None
+    error = None
+    if journal is not None and not (
+        skip_existing and (out_dir / f"{pdf_file.stem}.extracted.json").exists()
+    ):
+        journal.start(pdf_file)
+    else:
+        journal = None
+    try:
+        result = extract_file(
+            client,
+            model,
+            pdf_file,
+            out_dir,
+            skip_existing,
+            prompt,
+            limiter=limiter,
+            cache=cache,
+            counters=file_counters,
+            chunk_pages=chunk_pages,
+            chunk_overlap=chunk_overlap,
+            chunk_workers=chunk_workers,
+            uploads=uploads,
+            prompt_cache=prompt_cache,
+            triage=triage,
+            retry=retry,
+        )
+        return result
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        if counters is not None:
+            counters.merge(file_counters)
+        if telemetry is not None:
+            telemetry.record(pdf_file, model, file_counters, elapsed_ms(started), result, error)
+        if journal is not None and isinstance(error, QuotaExhausted):
+            # Not a failure of this PDF: left for the next run like --max-new-files leftovers.
+            journal.write("deferred", pdf_file=str(pdf_file), reason="quota")
+        elif journal is not None and error is not None:
+            journal.fail(pdf_file, error, file_counters)
+        elif journal is not None and result is not None:
+            journal.finish(pdf_file, result[0], result[1]["records_total"], file_counters)
+
+
+def extract_file(
+    client: genai.Client,
+    model: str,
+    pdf_file: Path,
+    out_dir: Path,
+    skip_existing: bool,
+    prompt: str,
+    limiter: Optional[RateLimiter] = None,
+    cache: Optional[ExtractionCache] = None,
+    counters: Optional[RunCounters] = None,
+    chunk_pages: int = 0,
+    chunk_overlap: int = 0,
+    chunk_workers: int = 4,
+    uploads: Optional[UploadRegistry] = None,
+    prompt_cache: Optional[PromptCache] = None,
+    triage: Optional[TriageCascade] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> tuple[Path, dict]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"{pdf_file.stem}.extracted.json"
+
+    if skip_existing and out_path.exists():
+        print(f"  [SKIP] {out_path} already exists")
+        return out_path, read_output_totals(out_path)
+
+    pdf_sha256 = file_sha256(pdf_file)
+    variant = chunk_variant(pdf_file, chunk_pages, chunk_overlap)
+    cache_key = extraction_cache_key(pdf_sha256, prompt, model, variant)
+
+    def extract() -> Optional[tuple[list[SirRecord], int]]:
+        if triage is not None:
+            if triage.classify(client, pdf_file, limiter, uploads, counters, retry) == "non_sir":
+                return None
+        if variant:
+            return extract_records_windowed(
+                client,
+                model,
+                pdf_file,
+                prompt,
+                chunk_pages,
+                chunk_overlap,
+                limiter=limiter,
+                chunk_workers=chunk_workers,
+                uploads=uploads,
+                counters=counters,
+                prompt_cache=prompt_cache,
+                retry=retry,
+            )
+        return extract_records(
+            client,
+            model,
+            pdf_file,
+            prompt,
+            limiter=limiter,
+            uploads=uploads,
+            counters=counters,
+            prompt_cache=prompt_cache,
+            retry=retry,
+        )
+
+    def write_triage_skip() -> tuple[Path, dict]:
+        # Not cached: the extraction cache only holds real extractions.
+        result = build_batch_output(pdf_file, model, [], 0, cache_key, triage="non_sir")
+        return out_path, write_batch_output(out_path, result)
+
+    if cache is None:
+        extracted = extract()
+        if extracted is None:
+            return write_triage_skip()
+        records, records_invalid_skipped = extracted
+        result = build_batch_output(
+            pdf_file, model, records, records_invalid_skipped, cache_key
+        )
+        return out_path, write_batch_output(out_path, result)
+
+    with cache.key_lock(cache_key):
+        cached = cache.get(cache_key)
+        if cached is not None:
+            result = BatchOutput.model_validate(cached)
+            result.source_file = str(pdf_file)
+            print(f"  [CACHE HIT] {pdf_file.name}")
+            if counters is not None:
+                counters.add("cache_hits")
+            return out_path, write_batch_output(out_path, result)
+        if counters is not None:
+            counters.add("cache_misses")
+        extracted = extract()
+        if extracted is None:
+            return write_triage_skip()
+        records, records_invalid_skipped = extracted
+        result = build_batch_output(
+            pdf_file, model, records, records_invalid_skipped, cache_key
+        )
+        cache.put(cache_key, result, pdf_sha256, prompt)
+    return out_path, write_batch_output(out_path, result)
+
+
+BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+BATCH_FAILED_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+# A batch job may wait up to 24 h: only reuse registered uploads that outlive it.
+BATCH_UPLOAD_MARGIN_SECONDS = 25 * 3600
+
+
+def batch_state_name(job: Any) -> str:
+    state = getattr(job, "state", None)
+    return getattr(state, "name", None) or str(state)
+
+
+def batch_manifest_path(batch_dir: Path, job_name: str) -> Path:
+    return batch_dir / f"{job_name.replace('/', '_')}.json"
+
+
+def pdfs_in_open_batches(batch_dir: Path) -> set[str]:
+    pdfs: set[str] = set()
+    for manifest_path in batch_dir.glob("*.json"):
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if not manifest.get("collected_at_utc"):
+            pdfs.update(entry["pdf_file"] for entry in manifest["requests"])
+    return pdfs
+
+
+def submit_batch(
+    client: genai.Client,
+    model: str,
+    pending: list[dict],
+    prompt: str,
+    batch_dir: Path,
+    retry_empty: bool = True,
+    uploads: Optional[UploadRegistry] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Path:
+    requests = []
+    entries = []
+    for idx, entry in enumerate(pending):
+        entry = dict(entry, key=f"req-{idx:05d}")
+        if not entry.get("uploaded_uri"):
+            uploaded = acquire_upload(
+                client,
+                Path(entry["pdf_file"]),
+                uploads,
+                retry=retry,
+                margin_seconds=BATCH_UPLOAD_MARGIN_SECONDS,
+            )
+            entry["uploaded_name"], entry["uploaded_uri"] = uploaded.name, uploaded.uri
+            # Registered uploads belong to the registry: collection must not delete them.
+            entry["upload_registered"] = uploads is not None
+        requests.append(
+            types.InlinedRequest(
+                contents=request_contents(entry["uploaded_uri"], entry.get("prompt_used", prompt)),
+                config=GENERATION_CONFIG,
+                metadata={"key": entry["key"]},
+            )
+        )
+        entries.append(entry)
+
+    job = client.batches.create(
+        model=model,
+        src=requests,
+        config={"display_name": f"sir-extract-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}"},
+    )
+    manifest = {
+        "job_name": job.name,
+        "model": model,
+        "created_at_utc": datetime.now(timezone.utc).isoformat(),
+        "prompt": prompt,
+        "retry_empty": retry_empty,
+        "state": batch_state_name(job),
+        "requests": entries,
+    }
+    path = batch_manifest_path(batch_dir, job.name)
+    write_json_atomic(path, manifest)
+    return path
+
+
+def collect_batch(
+    client: genai.Client,
+    manifest_path: Path,
+    batch_dir: Path,
+    cache: Optional[ExtractionCache] = None,
+) -> tuple[str, int, int]:
+    """Return (state, outputs written, failed requests); empty results are resubmitted."""
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    job = client.batches.get(name=manifest["job_name"])
+    state = batch_state_name(job)
+    if state not in BATCH_DONE_STATES | BATCH_FAILED_STATES:
+        manifest["state"] = state
+        write_json_atomic(manifest_path, manifest)
+        return state, 0, 0
+
+    entries = manifest["requests"]
+    responses = []
+    if state in BATCH_DONE_STATES:
+        responses = list(getattr(getattr(job, "dest", None), "inlined_responses", None) or [])
+    by_key = {}
+    for idx, item in enumerate(responses):
+        key = (getattr(item, "metadata", None) or {}).get("key")
+        by_key[key or entries[idx]["key"]] = item
+
+    written = failed = 0
+    retry_entries: list[dict] = []
+    for entry in entries:
+        pdf_file = Path(entry["pdf_file"])
+        item = by_key.get(entry["key"])
+        try:
+            if item is None:
+                raise RuntimeError(f"batch job {state} without a response for this request")
+            if getattr(item, "error", None):
+                raise RuntimeError(f"batch request error: {item.error}")
+            text = getattr(item.response, "text", None)
+            if not text:
+                raise ValueError("Gemini response did not contain text output")
+            records, skipped = parse_valid_sir_records(extract_json(text), pdf_file)
+        except Exception as exc:
+            print(f"[ERROR] {pdf_file}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        if not records and manifest["retry_empty"]:
+            print(f"  [RETRY EMPTY] {pdf_file.name} — queued for a follow-up batch job")
+            retry_entries.append(entry)
+            continue
+        result = build_batch_output(
+            pdf_file, manifest["model"], records, skipped, entry["extraction_key"]
+        )
+        out_path = Path(entry["out_dir"]) / f"{pdf_file.stem}.extracted.json"
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        if cache is not None:
+            cache.put(entry["extraction_key"], result, entry["pdf_sha256"], manifest["prompt"])
+        write_batch_output(out_path, result)
+        print(f"[OK] {pdf_file} -> {out_path}")
+        written += 1
+
+    if retry_entries:
+        retry_path = submit_batch(
+            client,
+            manifest["model"],
+            [dict(e, prompt_used=manifest["prompt"] + RETRY_EMPTY_PROMPT_NOTE) for e in retry_entries],
+            manifest["prompt"],
+            batch_dir,
+            retry_empty=False,
+        )
+        print(f"[BATCH] {len(retry_entries)} empty result(s) resubmitted: {retry_path}")
+
+    keep = {e["uploaded_name"] for e in retry_entries}
+    for entry in entries:
+        if entry.get("upload_registered"):
+            continue
+        if entry.get("uploaded_name") and entry["uploaded_name"] not in keep:
+            try:
+                client.files.delete(name=entry["uploaded_name"])
+            except Exception:
+                pass
+    manifest["state"] = state
+    manifest["collected_at_utc"] = datetime.now(timezone.utc).isoformat()
+    write_json_atomic(manifest_path, manifest)
+    return state, written, failed
+
+
+def collect_batches(
+    client: genai.Client, batch_dir: Path, cache: Optional[ExtractionCache] = None
+) -> tuple[int, int, int]:
+    written = failed = pending = 0
+    for manifest_path in sorted(batch_dir.glob("*.json")):
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("collected_at_utc"):
+            continue
+        state, job_written, job_failed = collect_batch(client, manifest_path, batch_dir, cache)
+        print(
+            f"[BATCH] {manifest['job_name']}: {state} "
+            f"({len(manifest['requests'])} requests, written={job_written}, failed={job_failed})"
+        )
+        written += job_written
+        failed += job_failed
+        if state not in BATCH_DONE_STATES | BATCH_FAILED_STATES:
+            pending += 1
+    return written, failed, pending
+
+
+def summary_rows(out_paths: Iterable[Path]) -> Iterator[dict]:
+    for out_path in out_paths:
+        data = json.loads(out_path.read_text(encoding="utf-8"))
+        for rec in data.get("records") or []:
+            yield {**rec, "source_file": data["source_file"], "model": data["model"]}
+
+
+def summary_csv_row(row: dict) -> dict:
+    row = row.copy()
+    row["evidence_pages"] = ",".join(
+        str(x) for x in row.get("evidence_pages", [])
+    )
+    violations = row.pop("possible_violations", [])
+    row["possible_violations_count"] = len(violations)
+    row["possible_violations_json"] = json.dumps(
+        violations, ensure_ascii=False
+    )
+    return row
+
+
+def write_summary(
+    rows: Iterable[dict], totals: dict, out_dir: Path
+) -> tuple[Path, Path]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    csv_path = out_dir / "summary.csv"
+    json_path = out_dir / "summary_totals.json"
+
+    def write_rows(fh: Any) -> None:
+        writer = csv.DictWriter(fh, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(summary_csv_row(row))
+
+    write_atomic(csv_path, write_rows)
+    write_json_atomic(json_path, totals)
+    return csv_path, json_path
+
+
+def write_summary_from_csvs(
+    csv_paths: list[Path], totals: dict, out_dir: Path
+) -> tuple[Path, Path]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    csv_path = out_dir / "summary.csv"
+    json_path = out_dir / "summary_totals.json"
+    # The root group's own summary.csv may be one of the inputs: build aside, then swap.
+    def concatenate(out_fh: Any) -> None:
+        out_fh.write((",".join(SUMMARY_FIELDS) + "\r\n").encode("utf-8"))
+        for path in csv_paths:
+            with path.open("rb") as in_fh:
+                in_fh.readline()  # header
+                shutil.copyfileobj(in_fh, out_fh)
+
+    write_atomic(csv_path, concatenate, mode="wb")
+    write_json_atomic(json_path, totals)
+    return csv_path, json_path
+
+
+def upsert_summary_csv(
+    csv_path: Path, new_outputs: list[Path], order: dict[str, int]
+) -> None:
+    new_rows: dict[str, list[dict]] = {}
+    for out_path in new_outputs:
+        data = json.loads(out_path.read_text(encoding="utf-8"))
+        new_rows.setdefault(data["source_file"], [])
+        for row in summary_rows([out_path]):
+            new_rows[data["source_file"]].append(summary_csv_row(row))
+    pending = sorted(new_rows, key=lambda source: order.get(source, len(order)))
+
+    def merge_rows(out_fh: Any) -> None:
+        writer = csv.DictWriter(out_fh, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        with csv_path.open(encoding="utf-8", newline="") as in_fh:
+            for row in csv.DictReader(in_fh):
+                source = row.get("source_file")
+                if source in new_rows:
+                    continue
+                position = order.get(source)
+                while position is not None and pending and order.get(pending[0], len(order)) < position:
+                    writer.writerows(new_rows[pending.pop(0)])
+                writer.writerow(row)
+        for source in pending:
+            writer.writerows(new_rows[source])
+
+    write_atomic(csv_path, merge_rows)
+
+
+def update_summary(
+    out_dir: Path,
+    order: list[tuple[str, Path]],
+    changed: list[tuple[Path, dict, Optional[dict]]],
+    run_totals: dict,
+) -> tuple[Path, Path]:
+    """Patch a summary with the changed outputs; rebuilt if missing or out of date."""
+    csv_path = out_dir / "summary.csv"
+    json_path = out_dir / "summary_totals.json"
+    outputs = [out_path for _, out_path in order if out_path.exists()]
+    totals = None
+    if csv_path.exists() and json_path.exists():
+        totals = json.loads(json_path.read_text(encoding="utf-8"))
+        added = sum(1 for _, _, previous in changed if previous is None)
+        if totals.get("files_processed", 0) + added != len(outputs):
+            print(f"[INFO] {json_path} is out of date: rebuilding it from the outputs")
+            totals = None
+    if totals is None:
+        totals = dict(run_totals, files_processed=len(outputs))
+        for field in FILE_TOTAL_FIELDS:
+            totals[field] = 0
+        for out_path in outputs:
+            for field, value in read_output_totals(out_path).items():
+                totals[field] += value
+        return write_summary(summary_rows(outputs), totals, out_dir)
+
+    upsert_summary_csv(
+        csv_path,
+        [out_path for out_path, _, _ in changed],
+        {source: idx for idx, (source, _) in enumerate(order)},
+    )
+    for field in (*FILE_TOTAL_FIELDS, "files_processed"):
+        delta = 0
+        for _, new, previous in changed:
+            if field == "files_processed":
+                delta += 0 if previous is not None else 1
+            else:
+                delta += new[field] - (previous or {}).get(field, 0)
+        totals[field] = totals.get(field, 0) + delta
+    for field, value in run_totals.items():
+        if field in SUMMARY_RUN_FIELDS:
+            totals[field] = value
+        elif field not in FILE_TOTAL_FIELDS and field not in ("files_processed", "input_path"):
+            totals[field] = totals.get(field, 0) + value
+    write_json_atomic(json_path, totals)
+    return csv_path, json_path
+
+
+def run_jobs(
+    jobs: list[tuple[bool, Callable[[], Any]]],
+    workers: int,
+    max_api_calls: int = 0,
+    on_done: Optional[Callable[[int, Optional[Any], Optional[Exception]], None]] = None,
+    stop: Optional[Callable[[], bool]] = None,
+) -> tuple[dict[int, tuple[Optional[Any], Optional[Exception]]], bool]:
+    """Run jobs on a thread pool; at most `max_api_calls` API jobs may succeed."""
+    results: dict[int, tuple[Optional[Any], Optional[Exception]]] = {}
+    in_flight: dict[Future, tuple[int, bool]] = {}
+    api_successes = 0
+    limit_reached = False
+
+    def collect(done: set[Future]) -> None:
+        nonlocal api_successes
+        for fut in done:
+            idx, needs_api_call = in_flight.pop(fut)
+            exc = fut.exception()
+            result = None if exc is not None else fut.result()
+            if exc is None and needs_api_call:
+                api_successes += 1
+            results[idx] = (result, exc)
+            if on_done is not None:
+                on_done(idx, result, exc)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for idx, (needs_api_call, fn) in enumerate(jobs):
+            while in_flight:
+                api_in_flight = sum(1 for _, api in in_flight.values() if api)
+                over_limit = (
+                    needs_api_call
+                    and max_api_calls > 0
+                    and api_successes + api_in_flight >= max_api_calls
+                )
+                if len(in_flight) < max(1, workers) and not over_limit:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            if needs_api_call and max_api_calls > 0 and api_successes >= max_api_calls:
+                limit_reached = True
+                break
+            if needs_api_call and stop is not None and stop():
+                continue
+            in_flight[pool.submit(fn)] = (idx, needs_api_call)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    return results, limit_reached
+
+
+def main(argv: Optional[list[str]] = None, client: Any = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Extract SIR victim + location fields from PDF using Gemini File API + Pydantic schema."
+    )
+    parser.add_argument(
+        "input_path", nargs="?", help="PDF file or directory containing PDF files"
+    )
+    parser.add_argument(
+        "--model",
+        default="gemini-2.5-flash",
+        help="Gemini model name (default: gemini-2.5-flash)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="analysis_output",
+        help="Directory where JSON outputs will be written",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        help="Glob pattern to exclude PDF files. Can be used multiple times.",
+    )
+    parser.add_argument(
+        "--min-seconds-between-calls",
+        type=float,
+        default=4.0,
+        help="Minimum delay between Gemini API calls (default: 4.0).",
+    )
+    parser.add_argument(
+        "--skip-existing",
+        action="store_true",
+        default=True,
+        help="Skip PDFs that already have an extracted JSON output (default: on).",
+    )
+    parser.add_argument(
+        "--no-skip-existing",
+        dest="skip_existing",
+        action="store_false",
+        help="Re-process PDFs even if output already exists.",
+    )
+    parser.add_argument(
+        "--prompt-path",
+        default="prompts/extract_sir.txt",
+        help="Path to prompt file (default: prompts/extract_sir.txt)",
+    )
+    parser.add_argument(
+        "--skip-completed-groups",
+        action="store_true",
+        default=True,
+        help="Skip groups/folders that already have summary.csv (default: on).",
+    )
+    parser.add_argument(
+        "--no-skip-completed-groups",
+        dest="skip_completed_groups",
+        action="store_false",
+        help="Do not skip groups by summary.csv; useful for incremental daily batches.",
+    )
+    parser.add_argument(
+        "--max-new-files",
+        type=int,
+        default=0,
+        help="Process at most N new files requiring API calls (0 = no limit).",
+    )
+    parser.add_argument(
+        "--skip-annual-reports",
+        action="store_true",
+        default=True,
+        help="Skip PDFs that appear to be annual reports by filename/path pattern (default: on).",
+    )
+    parser.add_argument(
+        "--no-skip-annual-reports",
+        dest="skip_annual_reports",
+        action="store_false",
+        help="Do not skip annual report PDFs.",
+    )
+    parser.add_argument(
+        "--allow-file-failures",
+        action="store_true",
+        default=False,
+        help="Exit with code 0 even if some PDFs fail; failed files are still reported.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of PDFs processed concurrently (default: 1).",
+    )
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        default=None,
+        help=(
+            "Shared cap on Gemini generate calls per minute across all workers "
+            "(default: derived from --min-seconds-between-calls; 0 = no limit)."
+        ),
+    )
+    parser.add_argument(
+        "--tokens-per-minute",
+        type=float,
+        default=0,
+        help="Shared cap on estimated input tokens per minute (default: 0 = no limit).",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=3,
+        help=(
+            "Attempts per upload/generate call on quota (429) and transient (5xx, "
+            "timeout) errors; other errors are not retried (default: 3)."
+        ),
+    )
+    parser.add_argument(
+        "--retry-max-delay",
+        type=float,
+        default=120.0,
+        help=(
+            "Cap in seconds on the jittered exponential backoff between attempts; a delay "
+            "requested by the server (retryDelay / Retry-After) is always honored (default: 120)."
+        ),
+    )
+    parser.add_argument(
+        "--quota-breaker",
+        type=int,
+        default=5,
+        help=(
+            "Quota errors in a row, across all workers, that trip the circuit breaker "
+            "(default: 5; 0 = disabled)."
+        ),
+    )
+    parser.add_argument(
+        "--quota-pause",
+        type=float,
+        default=60.0,
+        help="Seconds every API call is held when the breaker trips (default: 60).",
+    )
+    parser.add_argument(
+        "--quota-pauses",
+        type=int,
+        default=2,
+        help=(
+            "Pauses before the breaker ends the run, leaving the remaining PDFs for "
+            "the next run (default: 2; 0 = end at the first trip)."
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=".cache/extractions",
+        help="Content-addressed extraction cache (default: .cache/extractions).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        default=True,
+        help="Do not read or write the extraction cache.",
+    )
+    parser.add_argument(
+        "--refresh-stale",
+        action="store_true",
+        default=False,
+        help=(
+            "Re-process existing outputs not produced with the current PDF, prompt, "
+            "model and schema version (served from cache when possible)."
+        ),
+    )
+    parser.add_argument(
+        "--cache-gc",
+        action="store_true",
+        default=False,
+        help="Garbage-collect the extraction cache and exit (no input path needed).",
+    )
+    parser.add_argument(
+        "--cache-max-age-days",
+        type=float,
+        default=90.0,
+        help="With --cache-gc, drop entries unused for this many days (default: 90).",
+    )
+    parser.add_argument(
+        "--upload-registry",
+        default=".cache/uploads.json",
+        help=(
+            "Registry of PDFs already uploaded to the File API (by content hash), "
+            "reused across runs until they expire (default: .cache/uploads.json)."
+        ),
+    )
+    parser.add_argument(
+        "--no-upload-registry",
+        dest="use_upload_registry",
+        action="store_false",
+        default=True,
+        help="Upload every PDF for each call and delete it afterwards.",
+    )
+    parser.add_argument(
+        "--uploads-cleanup",
+        action="store_true",
+        default=False,
+        help="Delete every file in the upload registry from the File API and exit.",
+    )
+    parser.add_argument(
+        "--prompt-cache",
+        action="store_true",
+        default=False,
+        help=(
+            "Register the extraction prompt once as a Gemini cached context (keyed on its "
+            "content hash) and reference it from every call instead of resending it."
+        ),
+    )
+    parser.add_argument(
+        "--prompt-cache-ttl-minutes",
+        type=float,
+        default=60.0,
+        help="Lifetime of the cached prompt context, renewed at each run (default: 60).",
+    )
+    parser.add_argument(
+        "--triage-model",
+        default="",
+        help=(
+            "Ask this fast/cheap model whether each PDF contains SIRs before the full "
+            "extraction; documents it rules out get no extraction call (default: off)."
+        ),
+    )
+    parser.add_argument(
+        "--triage-pages",
+        type=int,
+        default=0,
+        help="With --triage-model, probe only the first N pages (default: 0 = whole PDF; requires pypdf).",
+    )
+    parser.add_argument(
+        "--triage-prompt-path",
+        default="prompts/triage_sir.txt",
+        help="Prompt for the triage stage (default: prompts/triage_sir.txt)",
+    )
+    parser.add_argument(
+        "--telemetry-dir",
+        default=".cache/telemetry",
+        help=(
+            "Per-run JSONL log of stage timings, retries, tokens and estimated cost "
+            "for each extracted PDF (default: .cache/telemetry)."
+        ),
+    )
+    parser.add_argument(
+        "--no-telemetry",
+        dest="use_telemetry",
+        action="store_false",
+        default=True,
+        help="Do not write the per-run telemetry log.",
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        help="Also write the run totals as Prometheus gauges to this .prom file.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="i/N",
+        help=(
+            "Process only shard i of N of the PDFs to extract (split by content hash, "
+            "balanced by page count), for parallel runners; combine with merge_sir_shards.py."
+        ),
+    )
+    parser.add_argument(
+        "--journal-dir",
+        default=".cache/journal",
+        help=(
+            "Append-only per-run journal of planned/started/finished/failed PDFs, "
+            "read by --resume and --retry-failed (default: .cache/journal)."
+        ),
+    )
+    parser.add_argument(
+        "--no-journal",
+        dest="use_journal",
+        action="store_false",
+        default=True,
+        help="Do not write the run journal.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help=(
+            "Process only the PDFs the last journaled run planned but did not finish "
+            "(killed run); input_path defaults to that run's."
+        ),
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        default=False,
+        help="Process only the PDFs that failed in the last journaled run (combinable with --resume).",
+    )
+    parser.add_argument(
+        "--chunk-pages",
+        type=int,
+        default=0,
+        help=(
+            "Split PDFs longer than N pages into overlapping N-page windows, extracted "
+            "concurrently and merged (default: 0 = send whole PDFs; requires pypdf)."
+        ),
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=2,
+        help="Pages shared by consecutive windows with --chunk-pages (default: 2).",
+    )
+    parser.add_argument(
+        "--chunk-workers",
+        type=int,
+        default=4,
+        help="Windows of one PDF extracted concurrently (default: 4).",
+    )
+    parser.add_argument(
+        "--preclassify",
+        action="store_true",
+        default=False,
+        help=(
+            "Score each new PDF's text layer locally (classify_sir_pdfs.py) and skip "
+            "clearly non-SIR documents before any API call (requires pypdf)."
+        ),
+    )
+    batch_mode = parser.add_mutually_exclusive_group()
+    batch_mode.add_argument(
+        "--batch-submit",
+        action="store_true",
+        default=False,
+        help=(
+            "Upload all pending PDFs and submit them as one asynchronous Batch API job; "
+            "the job id and request-to-PDF map are saved in --batch-dir."
+        ),
+    )
+    batch_mode.add_argument(
+        "--batch-collect",
+        action="store_true",
+        default=False,
+        help="Collect finished batch jobs from --batch-dir and write their outputs (no input path needed).",
+    )
+    parser.add_argument(
+        "--batch-dir",
+        default=".cache/batches",
+        help="Where batch job manifests are kept (default: .cache/batches).",
+    )
+    args = parser.parse_args(argv)
+    run_started = time.monotonic()
+
+    if args.cache_gc:
+        removed, kept = ExtractionCache(Path(args.cache_dir)).gc(args.cache_max_age_days)
+        print(f"[CACHE GC] {args.cache_dir}: removed={removed} kept={kept}")
+        return 0
+    if args.uploads_cleanup:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if client is None and not api_key:
+            print("Missing GEMINI_API_KEY environment variable", file=sys.stderr)
+            return 1
+        if client is None:
+            client = genai.Client(api_key=api_key)
+        deleted, failed = UploadRegistry(Path(args.upload_registry)).cleanup(client)
+        print(f"[UPLOADS CLEANUP] {args.upload_registry}: deleted={deleted} failed={failed}")
+        return 0
+    if args.batch_collect:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if client is None and not api_key:
+            print("Missing GEMINI_API_KEY environment variable", file=sys.stderr)
+            return 1
+        if client is None:
+            client = genai.Client(api_key=api_key)
+        cache = ExtractionCache(Path(args.cache_dir)) if args.use_cache else None
+        written, failed, pending = collect_batches(client, Path(args.batch_dir), cache)
+        print(f"[BATCH] outputs written={written} failed={failed} jobs still running={pending}")
+        if written:
+            print("[INFO] Run without --batch-collect to rebuild the summaries.")
+        return 1 if failed and not args.allow_file_failures else 0
+    replay: Optional[set[str]] = None
+    if args.resume or args.retry_failed:
+        if args.batch_submit:
+            parser.error("--batch-submit does not support --resume/--retry-failed")
+        journal_path = RunJournal.latest(Path(args.journal_dir))
+        if journal_path is None:
+            print(f"No run journal found in {args.journal_dir}", file=sys.stderr)
+            return 1
+        last_run, replay_files = RunJournal.replay(
+            journal_path, unfinished=args.resume, failed=args.retry_failed
+        )
+        if args.input_path is None:
+            args.input_path = last_run.get("input_path")
+        if last_run.get("output_dir") not in (None, args.output_dir):
+            print(
+                f"[WARN] {journal_path} was written for --output-dir {last_run['output_dir']}, "
+                f"not {args.output_dir}"
+            )
+        if not replay_files:
+            print(f"[RESUME] Nothing to replay in {journal_path}")
+            return 0
+        print(f"[RESUME] {len(replay_files)} PDFs to replay from {journal_path}")
+        replay = set(replay_files)
+    if args.input_path is None:
+        parser.error("input_path is required")
+    if args.batch_submit and args.chunk_pages:
+        parser.error("--batch-submit does not support --chunk-pages")
+    if args.batch_submit and args.triage_model:
+        parser.error("--batch-submit does not support --triage-model")
+
+    if args.max_new_files < 0:
+        print("--max-new-files must be >= 0", file=sys.stderr)
+        return 1
+    if args.workers < 1:
+        print("--workers must be >= 1", file=sys.stderr)
+        return 1
+    if args.chunk_pages < 0:
+        print("--chunk-pages must be >= 0", file=sys.stderr)
+        return 1
+    if args.chunk_pages and not 0 <= args.chunk_overlap < args.chunk_pages:
+        print("--chunk-overlap must be >= 0 and < --chunk-pages", file=sys.stderr)
+        return 1
+    if args.triage_pages < 0:
+        print("--triage-pages must be >= 0", file=sys.stderr)
+        return 1
+    if args.chunk_pages or args.preclassify or (args.triage_model and args.triage_pages):
+        require_pypdf()
+    if args.preclassify:
+        from classify_sir_pdfs import classify_pdf
+
+    if args.max_new_files > 0 and args.skip_completed_groups:
+        print(
+            "[INFO] --max-new-files detected: disabling group-summary skip for incremental processing."
+        )
+        args.skip_completed_groups = False
+    incremental_mode = args.max_new_files > 0
+    # A replayed PDF may sit in a folder that already has its summary.csv.
+    if replay is not None:
+        args.skip_completed_groups = False
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if client is None and not api_key:
+        print("Missing GEMINI_API_KEY environment variable", file=sys.stderr)
+        return 1
+
+    try:
+        targets = read_pdf_targets(args.input_path)
+    except (FileNotFoundError, ValueError) as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+
+    targets = [p for p in targets if not should_exclude(p, args.exclude)]
+    if not targets:
+        print("No .pdf files found in input path", file=sys.stderr)
+        return 1
+
+    model = normalize_model_name(args.model)
+    if client is None:
+        client = genai.Client(api_key=api_key)
+    out_dir = Path(args.output_dir)
+    prompt_path = Path(args.prompt_path)
+    groups = group_targets_by_top_folder(targets, args.input_path)
+    try:
+        prompt = build_prompt(prompt_path)
+    except FileNotFoundError as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+    triage = None
+    if args.triage_model:
+        try:
+            triage_prompt = build_prompt(Path(args.triage_prompt_path))
+        except FileNotFoundError as exc:
+            print(str(exc), file=sys.stderr)
+            return 1
+        triage = TriageCascade(
+            normalize_model_name(args.triage_model), triage_prompt, args.triage_pages
+        )
+    run_stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    telemetry = None
+    if args.use_telemetry:
+        telemetry = TelemetryLog(Path(args.telemetry_dir) / f"run-{run_stamp}.jsonl")
+    journal = None
+    if args.use_journal and not args.batch_submit:
+        journal = RunJournal(Path(args.journal_dir) / f"run-{run_stamp}.jsonl")
+    cache = ExtractionCache(Path(args.cache_dir)) if args.use_cache else None
+    uploads = UploadRegistry(Path(args.upload_registry)) if args.use_upload_registry else None
+
+    requests_per_minute = args.requests_per_minute
+    if requests_per_minute is None:
+        requests_per_minute = (
+            60.0 / args.min_seconds_between_calls
+            if args.min_seconds_between_calls > 0
+            else 0
+        )
+    limiter = RateLimiter(requests_per_minute, args.tokens_per_minute)
+    breaker = QuotaBreaker(args.quota_breaker, args.quota_pause, args.quota_pauses)
+    retry = RetryPolicy(args.max_retries, max_delay=args.retry_max_delay, breaker=breaker)
+    prompt_cache = None
+    if args.prompt_cache and not args.batch_submit:
+        # Opened at the first API call, so runs with nothing to do create no cache.
+        prompt_cache = PromptCache(
+            client, model, prompt, prompt_path.name, args.prompt_cache_ttl_minutes
+        )
 
     failures = 0
     files_processed = 0
-    all_rows: list[dict] = []
+    total_records = 0
+    group_csv_paths: list[Path] = []
+    all_order: list[tuple[str, Path]] = []
+    all_changed: list[tuple[Path, dict, Optional[dict]]] = []
+    writes_global_summary = len(groups) > 1 or "." not in groups
     total_dead_confirmed = 0
     total_injured_confirmed = 0
     total_missing_confirmed = 0
@@ -709,14 +2862,40 @@ def main() -> int:
     total_records_invalid_skipped = 0
     files_skipped_by_limit = 0
     files_skipped_annual_report = 0
-    api_calls_made = 0
+    files_skipped_non_sir = 0
     groups_with_work = 0
-    limit_reached = False
-
+    run_counters = RunCounters()
+
+    shard_of: Optional[dict[Path, int]] = None
+    if args.shard is not None:
+        shard_index, shard_count = args.shard
+        pending = [
+            pdf_file
+            for group_name, group_targets in groups.items()
+            for pdf_file in group_targets
+            if not (args.skip_annual_reports and is_annual_report_pdf(pdf_file))
+            and not (
+                args.skip_existing
+                and (out_dir if group_name == "." else out_dir / group_name)
+                .joinpath(f"{pdf_file.stem}.extracted.json")
+                .exists()
+            )
+        ]
+        shard_of = shard_assignments(pending, shard_count)
+        mine = sum(1 for shard in shard_of.values() if shard == shard_index)
+        print(f"[SHARD] {shard_index + 1}/{shard_count}: {mine} of {len(pending)} pending PDFs")
+
+    # Plan every group first so the pool can work across group boundaries.
+    group_plans: list[tuple[str, Path, list[int], int, RunCounters, list[tuple[str, Path]]]] = []
+    jobs: list[tuple[bool, Callable[[], Any]]] = []
+    # Incremental mode: totals of outputs a job will overwrite (--refresh-stale).
+    job_previous_totals: dict[int, dict] = {}
+    job_files: list[Path] = []
+    job_out_dirs: list[Path] = []
+    # Jobs that extract (not just reuse an existing output): what the journal plans.
+    job_has_work: list[bool] = []
+    planned_keys: set[str] = set()
     for group_name, group_targets in groups.items():
-        if limit_reached:
-            break
-
         group_out_dir = out_dir if group_name == "." else out_dir / group_name
 
         # If a folder-level summary exists, assume that folder was already processed.
@@ -733,17 +2912,11 @@ def main() -> int:
             continue
 
         groups_with_work += 1
-        group_failures = 0
-        group_files_processed = 0
-        group_rows: list[dict] = []
-        group_dead_confirmed = 0
-        group_injured_confirmed = 0
-        group_missing_confirmed = 0
-        group_dead_possible_min = 0
-        group_dead_possible_max = 0
-        group_records_invalid_skipped = 0
+        group_job_ids: list[int] = []
         group_files_skipped_annual_report = 0
-        group_had_activity = False
+        group_counters = RunCounters()
+        # (source_file, output) of every target, in summary.csv row order.
+        group_order: list[tuple[str, Path]] = []
 
         for pdf_file in group_targets:
             if args.skip_annual_reports and is_annual_report_pdf(pdf_file):
@@ -753,65 +2926,251 @@ def main() -> int:
                 continue
 
             group_out_json = group_out_dir / f"{pdf_file.stem}.extracted.json"
-            needs_api_call = not (args.skip_existing and group_out_json.exists())
+            group_order.append((str(pdf_file), group_out_json))
+            has_output = args.skip_existing and group_out_json.exists()
+            if replay is not None:
+                if str(pdf_file) in replay:
+                    # The output may predate the crash or the failure: redo it.
+                    has_output = False
+                elif not has_output:
+                    continue
+            variant = chunk_variant(pdf_file, args.chunk_pages, args.chunk_overlap)
+            if (
+                has_output
+                and args.refresh_stale
+                and output_is_stale(group_out_json, pdf_file, prompt, model, variant)
+            ):
+                print(f"[STALE] {group_out_json}")
+                has_output = False
+
+            if shard_of is not None and not has_output:
+                shard = shard_of.get(pdf_file)
+                if shard is None:
+                    # Stale or replayed output, not in the pending split: split by hash.
+                    shard = int(file_sha256(pdf_file), 16) % shard_count
+                if shard != shard_index:
+                    continue
 
             # Incremental mode: ignore already-processed files to avoid reloading/rewriting summaries.
-            if incremental_mode and not needs_api_call:
+            if incremental_mode and has_output:
                 continue
 
-            if (
-                needs_api_call
-                and incremental_mode
-                and api_calls_made >= args.max_new_files
+            if args.preclassify and not has_output:
+                verdict = classify_pdf(pdf_file)
+                if verdict["label"] == "non_sir":
+                    print(f"[SKIP NON-SIR] {pdf_file} (score={verdict['score']}, text layer without SIR markers)")
+                    files_skipped_non_sir += 1
+                    group_counters.add("files_skipped_non_sir")
+                    continue
+
+            # Cache hits (including PDFs duplicated earlier in this run) cost no API
+            # call, so they do not count against --max-new-files.
+            needs_api_call = not has_output
+            if needs_api_call and cache is not None:
+                key = extraction_cache_key(file_sha256(pdf_file), prompt, model, variant)
+                needs_api_call = key not in planned_keys and not cache.contains(key)
+                planned_keys.add(key)
+
+            def job(
+                pdf_file: Path = pdf_file,
+                group_out_dir: Path = group_out_dir,
+                skip_existing: bool = has_output,
+                group_counters: RunCounters = group_counters,
             ):
-                limit_reached = True
-                break
-
-            try:
-                if (
-                    needs_api_call
-                    and api_calls_made > 0
-                    and args.min_seconds_between_calls > 0
-                ):
-                    print(f"[WAIT] sleeping {args.min_seconds_between_calls:.1f}s")
-                    time.sleep(args.min_seconds_between_calls)
-
-                out_path, result = process_file(
+                return process_file(
                     client,
                     model,
                     pdf_file,
                     group_out_dir,
-                    args.skip_existing,
-                    prompt_path,
+                    skip_existing,
+                    prompt,
+                    limiter=limiter,
+                    cache=cache,
+                    counters=group_counters,
+                    chunk_pages=args.chunk_pages,
+                    chunk_overlap=args.chunk_overlap,
+                    chunk_workers=args.chunk_workers,
+                    uploads=uploads,
+                    prompt_cache=prompt_cache,
+                    triage=triage,
+                    telemetry=telemetry,
+                    journal=journal,
+                    retry=retry,
                 )
-                if needs_api_call:
-                    api_calls_made += 1
-
-                print(f"[OK] {pdf_file} -> {out_path}")
-                group_had_activity = True
-                group_files_processed += 1
-                group_dead_confirmed += result.dead_confirmed_total
-                group_injured_confirmed += result.injured_confirmed_total
-                group_missing_confirmed += result.missing_confirmed_total
-                group_dead_possible_min += result.dead_possible_total_min
-                group_dead_possible_max += result.dead_possible_total_max
-                group_records_invalid_skipped += result.records_invalid_skipped
-                for rec in result.records:
-                    row = rec.model_dump(mode="json")
-                    row["source_file"] = result.source_file
-                    row["model"] = result.model
-                    group_rows.append(row)
-            except (ValidationError, ValueError, json.JSONDecodeError) as exc:
-                failures += 1
-                group_failures += 1
-                group_had_activity = True
-                print(f"[ERROR] {pdf_file}: {exc}", file=sys.stderr)
-            except Exception as exc:
+
+            if incremental_mode and group_out_json.exists():
+                try:
+                    job_previous_totals[len(jobs)] = read_output_totals(group_out_json)
+                except (OSError, ValueError):
+                    pass
+            group_job_ids.append(len(jobs))
+            jobs.append((needs_api_call, job))
+            job_files.append(pdf_file)
+            job_out_dirs.append(group_out_dir)
+            job_has_work.append(not has_output)
+
+        group_plans.append(
+            (
+                group_name,
+                group_out_dir,
+                group_job_ids,
+                group_files_skipped_annual_report,
+                group_counters,
+                group_order,
+            )
+        )
+
+    if args.batch_submit:
+        pending = []
+        in_open_batches = pdfs_in_open_batches(Path(args.batch_dir))
+        for idx, (needs_api_call, _) in enumerate(jobs):
+            if not needs_api_call:
+                continue
+            if str(job_files[idx]) in in_open_batches:
+                print(f"[SKIP BATCHED] {job_files[idx]} (waiting in an uncollected batch job)")
+                continue
+            pdf_sha256 = file_sha256(job_files[idx])
+            pending.append(
+                {
+                    "pdf_file": str(job_files[idx]),
+                    "out_dir": str(job_out_dirs[idx]),
+                    "pdf_sha256": pdf_sha256,
+                    "extraction_key": extraction_cache_key(pdf_sha256, prompt, model),
+                }
+            )
+        if args.max_new_files > 0:
+            pending = pending[: args.max_new_files]
+        if not pending:
+            print("[BATCH] Nothing to submit: no pending PDFs need an API call.")
+            return 0
+        manifest_path = submit_batch(
+            client, model, pending, prompt, Path(args.batch_dir), uploads=uploads, retry=retry
+        )
+        print(f"[BATCH] Submitted {len(pending)} PDFs: {manifest_path}")
+        print("[INFO] Collect the results later with --batch-collect.")
+        return 0
+
+    if journal is not None:
+        journal.write(
+            "run",
+            input_path=args.input_path,
+            output_dir=args.output_dir,
+            model=model,
+            shard=f"{args.shard[0] + 1}/{args.shard[1]}" if args.shard else None,
+            argv=sys.argv[1:] if argv is None else argv,
+        )
+        journal.write(
+            "plan",
+            pdf_files=[str(job_files[idx]) for idx in range(len(jobs)) if job_has_work[idx]],
+        )
+
+    def report(idx: int, result: Optional[Any], exc: Optional[Exception]) -> None:
+        if exc is None:
+            print(f"[OK] {job_files[idx]} -> {result[0]}")
+        elif isinstance(exc, QuotaExhausted):
+            print(f"[DEFERRED] {job_files[idx]}: {exc}", file=sys.stderr)
+        else:
+            print(f"[ERROR] {job_files[idx]}: {exc}", file=sys.stderr)
+
+    job_results, limit_reached = run_jobs(
+        jobs,
+        args.workers,
+        max_api_calls=args.max_new_files if incremental_mode else 0,
+        on_done=report,
+        stop=lambda: breaker.opened,
+    )
+    # API jobs never started because --max-new-files was reached: left for the next run.
+    skipped_by_limit = (
+        {idx for idx, (needs_api_call, _) in enumerate(jobs) if needs_api_call and idx not in job_results}
+        if limit_reached
+        else set()
+    )
+    files_skipped_by_limit = len(skipped_by_limit)
+    if limit_reached:
+        print(
+            f"[INFO] --max-new-files limit reached ({args.max_new_files}): "
+            f"{files_skipped_by_limit} PDFs left for the next run."
+        )
+    # PDFs stopped by the quota breaker are not failures: no output, picked up next run.
+    quota_deferred = [
+        idx for idx, (_, exc) in job_results.items() if isinstance(exc, QuotaExhausted)
+    ]
+    for idx in quota_deferred:
+        del job_results[idx]
+    if breaker.opened:
+        not_done = sum(
+            1 for idx in range(len(jobs)) if job_has_work[idx] and idx not in job_results
+        )
+        print(
+            f"[QUOTA] Run ended by the quota circuit breaker: {not_done} PDFs left "
+            "for the next run."
+        )
+    elif quota_deferred:
+        print(f"[QUOTA] {len(quota_deferred)} PDFs deferred on quota errors: left for the next run.")
+    if journal is not None:
+        for idx in range(len(jobs)):
+            if job_has_work[idx] and idx not in job_results and idx not in quota_deferred:
+                if breaker.opened:
+                    journal.write("deferred", pdf_file=str(job_files[idx]), reason="quota")
+                elif idx in skipped_by_limit:
+                    journal.write("deferred", pdf_file=str(job_files[idx]), reason="limit")
+                else:
+                    journal.write("deferred", pdf_file=str(job_files[idx]))
+        # Skip counts for merge_sir_shards.py, which has no other way to rebuild them.
+        journal.write(
+            "end",
+            limit_reached=limit_reached,
+            quota_exhausted=breaker.opened,
+            files_skipped_annual_report=files_skipped_annual_report,
+            files_skipped_by_limit=files_skipped_by_limit,
+            annual_reports_by_group={plan[0]: plan[3] for plan in group_plans if plan[3]},
+        )
+
+    for (
+        group_name,
+        group_out_dir,
+        group_job_ids,
+        group_files_skipped_annual_report,
+        group_counters,
+        group_order,
+    ) in group_plans:
+        group_failures = 0
+        group_files_processed = 0
+        group_out_paths: list[Path] = []
+        group_changed: list[tuple[Path, dict, Optional[dict]]] = []
+        group_records_total = 0
+        group_dead_confirmed = 0
+        group_injured_confirmed = 0
+        group_missing_confirmed = 0
+        group_dead_possible_min = 0
+        group_dead_possible_max = 0
+        group_records_invalid_skipped = 0
+        group_had_activity = False
+
+        for idx in group_job_ids:
+            if idx not in job_results:
+                continue
+            group_had_activity = True
+            outcome, exc = job_results[idx]
+            if exc is not None:
                 failures += 1
                 group_failures += 1
-                group_had_activity = True
-                print(f"[ERROR] {pdf_file}: {exc}", file=sys.stderr)
+                continue
 
+            out_path, output_totals = outcome
+            group_files_processed += 1
+            group_records_total += output_totals["records_total"]
+            group_dead_confirmed += output_totals["dead_confirmed_total"]
+            group_injured_confirmed += output_totals["injured_confirmed_total"]
+            group_missing_confirmed += output_totals["missing_confirmed_total"]
+            group_dead_possible_min += output_totals["dead_possible_total_min"]
+            group_dead_possible_max += output_totals["dead_possible_total_max"]
+            group_records_invalid_skipped += output_totals["records_invalid_skipped"]
+            group_out_paths.append(out_path)
+            group_changed.append((out_path, output_totals, job_previous_totals.get(idx)))
+
+        all_order.extend(group_order)
+        all_changed.extend(group_changed)
         if not group_had_activity:
             continue
 
@@ -824,7 +3183,7 @@ def main() -> int:
             "input_path": group_input_label,
             "files_processed": group_files_processed,
             "files_failed": group_failures,
-            "records_total": len(group_rows),
+            "records_total": group_records_total,
             "dead_confirmed_total": group_dead_confirmed,
             "injured_confirmed_total": group_injured_confirmed,
             "missing_confirmed_total": group_missing_confirmed,
@@ -832,13 +3191,25 @@ def main() -> int:
             "dead_possible_total_max": group_dead_possible_max,
             "records_invalid_skipped": group_records_invalid_skipped,
             "files_skipped_annual_report": group_files_skipped_annual_report,
-            "files_skipped_by_limit": 0,
+            "files_skipped_non_sir": group_counters.get("files_skipped_non_sir"),
+            "files_skipped_by_limit": len(skipped_by_limit.intersection(group_job_ids)),
+            **counter_totals(group_counters),
         }
-        groups_with_work += 1
         if not incremental_mode:
-            csv_path, json_path = write_summary(group_rows, group_totals, group_out_dir)
+            csv_path, json_path = write_summary(
+                summary_rows(group_out_paths), group_totals, group_out_dir
+            )
+            group_csv_paths.append(csv_path)
             print(f"[SUMMARY] {csv_path}")
             print(f"[SUMMARY] {json_path}")
+        # Incremental: patch only the groups that got new outputs. The root group's
+        # summary is the global one when there are subfolders, updated below.
+        elif group_changed and not (group_name == "." and writes_global_summary):
+            csv_path, json_path = update_summary(
+                group_out_dir, group_order, group_changed, group_totals
+            )
+            print(f"[SUMMARY UPDATED] {csv_path}")
+            print(f"[SUMMARY UPDATED] {json_path}")
 
         files_processed += group_files_processed
         total_dead_confirmed += group_dead_confirmed
@@ -847,7 +3218,8 @@ def main() -> int:
         total_dead_possible_min += group_dead_possible_min
         total_dead_possible_max += group_dead_possible_max
         total_records_invalid_skipped += group_records_invalid_skipped
-        all_rows.extend(group_rows)
+        total_records += group_records_total
+        run_counters.merge(group_counters)
 
     if groups_with_work == 0:
         if incremental_mode:
@@ -862,7 +3234,7 @@ def main() -> int:
         "input_path": args.input_path,
         "files_processed": files_processed,
         "files_failed": failures,
-        "records_total": len(all_rows),
+        "records_total": total_records,
         "dead_confirmed_total": total_dead_confirmed,
         "injured_confirmed_total": total_injured_confirmed,
         "missing_confirmed_total": total_missing_confirmed,
@@ -870,18 +3242,34 @@ def main() -> int:
         "dead_possible_total_max": total_dead_possible_max,
         "records_invalid_skipped": total_records_invalid_skipped,
         "files_skipped_annual_report": files_skipped_annual_report,
+        "files_skipped_non_sir": files_skipped_non_sir,
         "files_skipped_by_limit": files_skipped_by_limit,
+        **counter_totals(run_counters),
     }
+    if telemetry is not None and telemetry.path.exists():
+        print(
+            f"[TELEMETRY] {telemetry.path} (prompt tokens={totals['prompt_tokens']}, "
+            f"output tokens={totals['output_tokens']}, "
+            f"estimated cost=${totals['estimated_cost_usd']:.4f})"
+        )
+    if args.prometheus_textfile:
+        write_prometheus_textfile(
+            Path(args.prometheus_textfile), totals, time.monotonic() - run_started
+        )
 
-    # In incremental mode avoid writing partial summaries.
+    # In incremental mode the summaries are patched with the new outputs only.
     if incremental_mode:
         limit_text = f"/{args.max_new_files}" if args.max_new_files > 0 else ""
         print(
             f"[DONE] Incremental batch processed {files_processed}{limit_text} new files; failures={failures}."
         )
+        if all_changed and writes_global_summary:
+            csv_path, json_path = update_summary(out_dir, all_order, all_changed, totals)
+            print(f"[SUMMARY ALL UPDATED] {csv_path}")
+            print(f"[SUMMARY ALL UPDATED] {json_path}")
     # When processing multiple top-level folders, also emit one global summary at output root.
-    elif len(groups) > 1 or "." not in groups:
-        csv_path, json_path = write_summary(all_rows, totals, out_dir)
+    elif writes_global_summary:
+        csv_path, json_path = write_summary_from_csvs(group_csv_paths, totals, out_dir)
         print(f"[SUMMARY ALL] {csv_path}")
         print(f"[SUMMARY ALL] {json_path}")
 
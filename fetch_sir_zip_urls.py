@@ -1,44 +1,227 @@
 #!/usr/bin/env python3
 """
 Fetches all SIR documents from the Frontex PRD:
-- Appends new download URLs to zip_urls.txt (idempotent)
-- Writes full metadata to sir_documents.jsonl (one record per document)
+- Upserts documents (by doc_id) and download URLs into sir_documents.sqlite
+- Regenerates zip_urls.txt and sir_documents.jsonl from it, keeping line order:
+  new entries are appended, documents whose metadata changed are updated in place
 
 Usage:
     python3 fetch_sir_zip_urls.py
     python3 fetch_sir_zip_urls.py --dry-run
     python3 fetch_sir_zip_urls.py --output other_file.txt --jsonl other_file.jsonl
+    python3 fetch_sir_zip_urls.py --base-url http://127.0.0.1:8000/ --dry-run   # local fixtures
+    python3 fetch_sir_zip_urls.py --offline --dry-run                            # cache replay
 """
 
 import argparse
+import hashlib
 import json
+import os
 import re
+import sqlite3
 import sys
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 
 import requests
 
-LISTING_URL = (
-    "https://prd.frontex.europa.eu/"
+BASE_URL = "https://prd.frontex.europa.eu/"
+LISTING_PATH = (
     "?form-fields%5Bdocument-tag%5D%5B0%5D=409"
     "&form-fields%5Bpaged%5D={page}"
 )
-DIALOG_URL = (
-    "https://prd.frontex.europa.eu/"
+DIALOG_PATH = (
     "wp-content/themes/template/templates/cards/1/dialog.php"
     "?card-post-id=2722&document-post-id={doc_id}"
 )
 HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; frontex-sir-scraper/1.0)"}
-SLEEP = 0.5  # seconds between requests
+SLEEP = 0.25  # min seconds between request starts, shared by all workers
+MAX_SLEEP = 30.0  # ceiling for the adaptive spacing after 429/503
+THROTTLE_STATUSES = (429, 503)
+DEFAULT_HTTP_CACHE_DIR = ".cache/http"
+DEFAULT_CACHE_TTL_HOURS = 12.0
+DEFAULT_DB = "sir_documents.sqlite"
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class Politeness:
+    """Shared request spacing that backs off on 429/503."""
+
+    def __init__(self, min_interval: float = SLEEP, max_interval: float = MAX_SLEEP) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait_turn(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.interval = max(self.min_interval, self.interval * 0.8)
+
+    def on_throttle(self, retry_after: float | None) -> float:
+        with self._lock:
+            self.throttled += 1
+            self.interval = min(self.max_interval, max(self.interval * 2, 0.5))
+            pause = retry_after if retry_after is not None else self.interval
+            self._next_start = max(self._next_start, time.monotonic() + pause)
+            return pause
+
+
+class CacheMiss(requests.RequestException):
+    """Raised in offline mode for a URL that was never cached."""
+
+
+class HttpCache:
+    """On-disk response cache with ETag / Last-Modified validators."""
+
+    def __init__(self, root: Path, ttl_hours: float = DEFAULT_CACHE_TTL_HOURS, offline: bool = False) -> None:
+        self.root = root
+        self.ttl = ttl_hours * 3600
+        self.offline = offline
+        self.stats = {"network": 0, "fresh": 0, "not_modified": 0, "bytes_saved": 0, "bytes_downloaded": 0}
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> Path:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / key[:2] / f"{key}.json"
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += value
+
+    def get(self, url: str) -> dict | None:
+        try:
+            return json.loads(self._path(url).read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def conditional_headers(self, entry: dict | None) -> dict[str, str]:
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, response: requests.Response | None, entry: dict | None = None) -> None:
+        if response is not None and response.status_code == 200:
+            entry = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "body": response.text,
+            }
+        if entry is None:
+            return
+        entry["fetched_at"] = time.time()
+        path = self._path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".tmp{threading.get_ident()}")
+        tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def summary(self) -> str:
+        st = self.stats
+        saved = st["fresh"] + st["not_modified"]
+        return (
+            f"HTTP cache: {st['network']} network requests, {st['fresh']} served from cache, "
+            f"{st['not_modified']} not modified (304); saved {saved} downloads / "
+            f"{st['bytes_saved'] / 1024:.0f} KiB, downloaded {st['bytes_downloaded'] / 1024:.0f} KiB"
+        )
 
 
-def get_doc_ids_from_page(page: int, session: requests.Session) -> list[str]:
-    url = LISTING_URL.format(page=page)
-    r = session.get(url, headers=HEADERS, timeout=20)
-    r.raise_for_status()
-    return re.findall(r"document-post-id=(\d+)", r.text)
+def fetch(
+    session: requests.Session,
+    url: str,
+    polite: Politeness | None = None,
+    retries: int = 5,
+    cache: HttpCache | None = None,
+) -> str:
+    entry = cache.get(url) if cache else None
+    if cache and entry and (cache.offline or cache.is_fresh(entry)):
+        cache.count("fresh")
+        cache.count("bytes_saved", len(entry["body"].encode("utf-8")))
+        return entry["body"]
+    if cache and cache.offline:
+        raise CacheMiss(f"not in cache (offline): {url}")
+
+    polite = polite or Politeness()
+    headers = dict(HEADERS)
+    if cache:
+        headers.update(cache.conditional_headers(entry))
+    for attempt in range(retries):
+        polite.wait_turn()
+        try:
+            r = session.get(url, headers=headers, timeout=20)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if attempt == retries - 1:
+                raise
+            pause = polite.on_throttle(None)
+            print(f"  [RETRY {attempt + 1}/{retries}] {url}: {exc} — backing off {pause:.1f}s",
+                  file=sys.stderr)
+            continue
+        if r.status_code in THROTTLE_STATUSES and attempt < retries - 1:
+            pause = polite.on_throttle(parse_retry_after(r.headers.get("Retry-After")))
+            print(f"  [THROTTLED {r.status_code}] waiting {pause:.1f}s, "
+                  f"spacing now {polite.interval:.2f}s", file=sys.stderr)
+            continue
+        if cache:
+            cache.count("network")
+        if r.status_code == 304 and entry:
+            polite.on_success()
+            cache.count("not_modified")
+            cache.count("bytes_saved", len(entry["body"].encode("utf-8")))
+            cache.put(url, None, entry)
+            return entry["body"]
+        r.raise_for_status()
+        polite.on_success()
+        if cache:
+            cache.count("bytes_downloaded", len(r.content))
+            cache.put(url, r)
+        return r.text
+    raise RuntimeError("unreachable")
+
+
+def get_doc_ids_from_page(
+    page: int,
+    session: requests.Session,
+    base_url: str = BASE_URL,
+    polite: Politeness | None = None,
+    cache: HttpCache | None = None,
+) -> list[str]:
+    url = base_url + LISTING_PATH.format(page=page)
+    html = fetch(session, url, polite, cache=cache)
+    return re.findall(r"document-post-id=(\d+)", html)
 
 
 def parse_date(raw: str) -> str | None:
@@ -49,11 +232,15 @@ def parse_date(raw: str) -> str | None:
         return raw.strip() or None
 
 
-def get_metadata_from_dialog(doc_id: str, session: requests.Session) -> dict:
-    url = DIALOG_URL.format(doc_id=doc_id)
-    r = session.get(url, headers=HEADERS, timeout=20)
-    r.raise_for_status()
-    html = r.text
+def get_metadata_from_dialog(
+    doc_id: str,
+    session: requests.Session,
+    base_url: str = BASE_URL,
+    polite: Politeness | None = None,
+    cache: HttpCache | None = None,
+) -> dict:
+    url = base_url + DIALOG_PATH.format(doc_id=doc_id)
+    html = fetch(session, url, polite, cache=cache)
 
     # Title
     title_m = re.search(
@@ -107,29 +294,289 @@ def get_metadata_from_dialog(doc_id: str, session: requests.Session) -> dict:
     }
 
 
-def load_existing_urls(path: Path) -> set[str]:
+def read_url_lines(path: Path) -> list[str]:
     if not path.exists():
-        return set()
-    urls = set()
+        return []
+    urls = []
     for line in path.read_text().splitlines():
         line = line.strip()
         if line and not line.startswith("#"):
-            urls.add(line)
+            urls.append(line)
     return urls
 
 
-def load_existing_doc_ids(jsonl_path: Path) -> set[str]:
+def read_jsonl_docs(jsonl_path: Path) -> list[dict]:
     if not jsonl_path.exists():
-        return set()
-    ids = set()
+        return []
+    docs = []
     for line in jsonl_path.read_text().splitlines():
         line = line.strip()
         if line:
             try:
-                ids.add(json.loads(line)["doc_id"])
-            except (json.JSONDecodeError, KeyError):
-                pass
-    return ids
+                doc = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "doc_id" in doc:
+                docs.append(doc)
+    return docs
+
+
+def doc_json(doc: dict) -> str:
+    return json.dumps(doc, ensure_ascii=False)
+
+
+def file_signature(path: Path) -> str:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return ""
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def write_lines_atomic(path: Path, lines: list[str]) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class MetadataStore:
+    """SQLite store of documents and URLs; `position` keeps the exported files stable."""
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                record TEXT NOT NULL,
+                record_sha256 TEXT NOT NULL,
+                first_seen_utc TEXT NOT NULL,
+                updated_utc TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                doc_id TEXT,
+                first_seen_utc TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _next_position(self, table: str) -> int:
+        (pos,) = self.conn.execute(f"SELECT COALESCE(MAX(position), -1) + 1 FROM {table}").fetchone()
+        return pos
+
+    def _meta(self, key: str) -> str | None:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def has_doc(self, doc_id: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def has_url(self, url: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM urls WHERE url = ?", (url,)).fetchone() is not None
+
+    def doc_ids(self) -> set[str]:
+        return {row[0] for row in self.conn.execute("SELECT doc_id FROM documents")}
+
+    def counts(self) -> tuple[int, int]:
+        (docs,) = self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()
+        (urls,) = self.conn.execute("SELECT COUNT(*) FROM urls").fetchone()
+        return docs, urls
+
+    def add_url(self, url: str, doc_id: str | None = None) -> bool:
+        if self.has_url(url):
+            return False
+        self.conn.execute(
+            "INSERT INTO urls (url, position, doc_id, first_seen_utc) VALUES (?, ?, ?, ?)",
+            (url, self._next_position("urls"), doc_id, datetime.now(timezone.utc).isoformat()),
+        )
+        return True
+
+    def upsert_doc(self, doc: dict) -> tuple[str, list[str]]:
+        """Return ("new" | "changed" | "unchanged", changed field names)."""
+        record = doc_json(doc)
+        digest = hashlib.sha256(record.encode("utf-8")).hexdigest()
+        now = datetime.now(timezone.utc).isoformat()
+        row = self.conn.execute(
+            "SELECT record, record_sha256 FROM documents WHERE doc_id = ?", (doc["doc_id"],)
+        ).fetchone()
+        if row is None:
+            self.conn.execute(
+                "INSERT INTO documents (doc_id, position, record, record_sha256, first_seen_utc, updated_utc) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc["doc_id"], self._next_position("documents"), record, digest, now, now),
+            )
+            return "new", []
+        if row[1] == digest:
+            return "unchanged", []
+        old = json.loads(row[0])
+        fields = [k for k in dict.fromkeys([*old, *doc]) if old.get(k) != doc.get(k)]
+        self.conn.execute(
+            "UPDATE documents SET record = ?, record_sha256 = ?, updated_utc = ? WHERE doc_id = ?",
+            (record, digest, now, doc["doc_id"]),
+        )
+        return "changed", fields
+
+    def sync_from_files(self, urls_path: Path, jsonl_path: Path) -> int:
+        """Import hand edits of the flat files; existing rows win."""
+        imported = 0
+        if self._meta("jsonl_signature") != file_signature(jsonl_path):
+            for doc in read_jsonl_docs(jsonl_path):
+                if not self.has_doc(doc["doc_id"]):
+                    self.upsert_doc(doc)
+                    imported += 1
+        if self._meta("urls_signature") != file_signature(urls_path):
+            for url in read_url_lines(urls_path):
+                imported += self.add_url(url)
+        return imported
+
+    def export(self, urls_path: Path, jsonl_path: Path) -> None:
+        urls = [row[0] for row in self.conn.execute("SELECT url FROM urls ORDER BY position")]
+        docs = [row[0] for row in self.conn.execute("SELECT record FROM documents ORDER BY position")]
+        write_lines_atomic(urls_path, urls)
+        write_lines_atomic(jsonl_path, docs)
+        self._set_meta("urls_signature", file_signature(urls_path))
+        self._set_meta("jsonl_signature", file_signature(jsonl_path))
+        self.conn.commit()
+
+
+def crawl(
+    session: requests.Session,
+    polite: Politeness,
+    pages: int,
+    known_doc_ids: set[str],
+    base_url: str = BASE_URL,
+    workers: int = 4,
+    stop_at_known: bool = True,
+    cache: HttpCache | None = None,
+) -> tuple[list[dict], int]:
+    """Return (metadata in listing order, failed fetches)."""
+    pending: list[tuple[str, Future]] = []
+    doc_ids_seen: set[str] = set()
+    failures = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for page in range(pages):
+            print(f"Scraping listing page {page + 1}/{pages}...", file=sys.stderr)
+            try:
+                doc_ids = get_doc_ids_from_page(page, session, base_url, polite, cache)
+            except requests.RequestException as exc:
+                print(f"[ERROR] listing page {page + 1}: {exc}", file=sys.stderr)
+                failures += 1
+                break
+            if not doc_ids:
+                print(f"  No more results at page {page + 1}, stopping.", file=sys.stderr)
+                break
+
+            for doc_id in dict.fromkeys(doc_ids):
+                if doc_id in doc_ids_seen:
+                    continue
+                doc_ids_seen.add(doc_id)
+                future = pool.submit(get_metadata_from_dialog, doc_id, session, base_url, polite, cache)
+                pending.append((doc_id, future))
+
+            if stop_at_known and known_doc_ids and set(doc_ids) <= known_doc_ids:
+                print(f"  Page {page + 1} has only known documents, stopping.", file=sys.stderr)
+                break
+
+        metas = []
+        for doc_id, future in pending:
+            try:
+                metas.append(future.result())
+            except requests.RequestException as exc:
+                print(f"[ERROR] dialog {doc_id}: {exc}", file=sys.stderr)
+                failures += 1
+    return metas, failures
+
+
+def run(args, base_url: str, store: MetadataStore, output_path: Path, jsonl_path: Path) -> int:
+    imported = store.sync_from_files(output_path, jsonl_path)
+    if imported:
+        print(f"Imported {imported} lines from {output_path} / {jsonl_path} into {store.db_path}",
+              file=sys.stderr)
+    if args.export_only:
+        store.export(output_path, jsonl_path)
+        docs, urls = store.counts()
+        print(f"Exported {urls} URLs to {output_path} and {docs} docs to {jsonl_path}", file=sys.stderr)
+        return 0
+
+    known_doc_ids = store.doc_ids()
+    docs, urls = store.counts()
+    print(f"Existing URLs : {urls}", file=sys.stderr)
+    print(f"Existing docs : {docs}", file=sys.stderr)
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(args.workers, 10))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    polite = Politeness(args.delay)
+    cache = (
+        HttpCache(Path(args.cache_dir), args.cache_ttl_hours, offline=args.offline)
+        if args.use_cache
+        else None
+    )
+
+    started = time.monotonic()
+    metas, failures = crawl(
+        session,
+        polite,
+        args.pages,
+        known_doc_ids,
+        base_url=base_url,
+        workers=args.workers,
+        stop_at_known=not args.full,
+        cache=cache,
+    )
+
+    # Upsert in one transaction; --dry-run rolls it back.
+    new_urls: list[str] = []
+    new_docs = changed_docs = 0
+    for meta in metas:
+        for item in meta["download_urls"]:
+            if store.add_url(item["url"], meta["doc_id"]):
+                print(f"  + {item['url']}", file=sys.stderr)
+                new_urls.append(item["url"])
+        status, fields = store.upsert_doc(meta)
+        if status == "new":
+            new_docs += 1
+        elif status == "changed":
+            changed_docs += 1
+            print(f"  ~ {meta['doc_id']}: {', '.join(fields)}", file=sys.stderr)
+
+    print(f"\nDocuments : {len(metas)} in {time.monotonic() - started:.1f}s "
+          f"(throttled {polite.throttled}x, failures {failures})", file=sys.stderr)
+    if cache:
+        print(cache.summary(), file=sys.stderr)
+    print(f"New URLs  : {len(new_urls)}", file=sys.stderr)
+    print(f"New docs  : {new_docs}", file=sys.stderr)
+    print(f"Changed   : {changed_docs}", file=sys.stderr)
+
+    if args.dry_run:
+        store.conn.rollback()
+        for url in new_urls:
+            print(url)
+        return 1 if failures else 0
+
+    store.conn.commit()
+    if new_urls or new_docs or changed_docs or imported:
+        store.export(output_path, jsonl_path)
+        print(f"Wrote {output_path} (+{len(new_urls)} URLs) and {jsonl_path} "
+              f"(+{new_docs} new, {changed_docs} updated docs)", file=sys.stderr)
+    return 1 if failures else 0
 
 
 def main():
@@ -155,67 +602,77 @@ def main():
         default=20,
         help="Max pages to scrape (default: 20)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Concurrent dialog.php fetches (default: 4)",
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=SLEEP,
+        help=f"Min seconds between request starts; grows on 429/503 (default: {SLEEP})",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Scan all pages instead of stopping at the first page with only known documents",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="Site root, e.g. a local server replaying recorded HTML fixtures (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_HTTP_CACHE_DIR,
+        help=f"On-disk HTTP cache directory (default: {DEFAULT_HTTP_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="Always fetch from the network, do not read or write the HTTP cache",
+    )
+    parser.add_argument(
+        "--cache-ttl-hours",
+        type=float,
+        default=DEFAULT_CACHE_TTL_HOURS,
+        help="Serve cached pages younger than this without a request; older ones are "
+        f"revalidated with ETag/Last-Modified (default: {DEFAULT_CACHE_TTL_HOURS:g})",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Replay pages from the HTTP cache only; uncached pages count as failures",
+    )
+    parser.add_argument(
+        "--db",
+        default=DEFAULT_DB,
+        help=f"SQLite metadata store; the two flat files are exported from it (default: {DEFAULT_DB})",
+    )
+    parser.add_argument(
+        "--export-only",
+        action="store_true",
+        help="Regenerate --output and --jsonl from the store without crawling",
+    )
     args = parser.parse_args()
+    if args.offline and not args.use_cache:
+        parser.error("--offline needs the HTTP cache (drop --no-cache)")
+    base_url = args.base_url.rstrip("/") + "/"
 
     output_path = Path(args.output)
     jsonl_path = Path(args.jsonl)
 
-    existing_urls = load_existing_urls(output_path)
-    existing_doc_ids = load_existing_doc_ids(jsonl_path)
-    print(f"Existing URLs : {len(existing_urls)}", file=sys.stderr)
-    print(f"Existing docs : {len(existing_doc_ids)}", file=sys.stderr)
-
-    session = requests.Session()
-    new_urls: list[str] = []
-    new_docs: list[dict] = []
-    doc_ids_seen: set[str] = set()
-
-    for page in range(args.pages):
-        print(f"Scraping listing page {page + 1}/{args.pages}...", file=sys.stderr)
-        doc_ids = get_doc_ids_from_page(page, session)
-        if not doc_ids:
-            print(f"  No more results at page {page + 1}, stopping.", file=sys.stderr)
-            break
-        time.sleep(SLEEP)
-
-        for doc_id in doc_ids:
-            if doc_id in doc_ids_seen:
-                continue
-            doc_ids_seen.add(doc_id)
-
-            meta = get_metadata_from_dialog(doc_id, session)
-
-            for item in meta["download_urls"]:
-                url = item["url"]
-                if url not in existing_urls and url not in new_urls:
-                    print(f"  + {url}", file=sys.stderr)
-                    new_urls.append(url)
-
-            if doc_id not in existing_doc_ids:
-                new_docs.append(meta)
-
-            time.sleep(SLEEP)
-
-    print(f"\nNew URLs  : {len(new_urls)}", file=sys.stderr)
-    print(f"New docs  : {len(new_docs)}", file=sys.stderr)
-
-    if args.dry_run:
-        for url in new_urls:
-            print(url)
-        return
-
-    if new_urls:
-        with output_path.open("a") as f:
-            for url in new_urls:
-                f.write(url + "\n")
-        print(f"Appended {len(new_urls)} URLs to {output_path}", file=sys.stderr)
-
-    if new_docs:
-        with jsonl_path.open("a") as f:
-            for doc in new_docs:
-                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
-        print(f"Appended {len(new_docs)} docs to {jsonl_path}", file=sys.stderr)
+    db_path = Path(args.db)
+    # A dry run must not create the store as a side effect.
+    store = MetadataStore(db_path if db_path.exists() or not args.dry_run else Path(":memory:"))
+    try:
+        return run(args, base_url, store, output_path, jsonl_path)
+    finally:
+        store.close()
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Combines the work of several `extract_sir_pdf_gemini.py --shard i/N` runs into one tree.
+
+Each shard directory holds what one runner produced, with the repo layout:
+    <shard>/analysis_output/...     outputs (.extracted.json)
+    <shard>/.cache/journal/*.jsonl  run journals
+
+The merge:
+- copies the outputs that are new or changed into --output-dir (temp file + rename) and
+  refreshes their .totals.json sidecars; the same output from two shards keeps the most
+  recent generated_at_utc
+- updates the summary.csv / summary_totals.json of the touched folders and the global one
+  as an incremental run would (rows in full-pass order, corpus totals by delta); activity
+  counters (tokens, cost, uploads, ...) come from the shard journals
+- writes one combined journal in --journal-dir, so --resume / --retry-failed work across
+  the shards
+
+Usage:
+    python3 merge_sir_shards.py shards/shard-1 shards/shard-2 shards/shard-3
+    python3 merge_sir_shards.py shards/* --input-path pdfs --output-dir analysis_output
+"""
+
+import argparse
+import json
+import shutil
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from extract_sir_pdf_gemini import (
+    RunCounters,
+    RunJournal,
+    counter_totals,
+    group_targets_by_top_folder,
+    read_output_totals,
+    read_pdf_targets,
+    update_summary,
+    write_atomic,
+)
+
+
+def generated_at(path: Path) -> str:
+    try:
+        return json.loads(path.read_text(encoding="utf-8")).get("generated_at_utc") or ""
+    except (OSError, json.JSONDecodeError):
+        return ""
+
+
+def collect_outputs(shard_dirs: list[Path], subdir: str) -> dict[Path, Path]:
+    """Relative output path -> shard file to take it from (latest generated_at_utc wins)."""
+    chosen: dict[Path, Path] = {}
+    for shard_dir in shard_dirs:
+        root = shard_dir / subdir
+        for path in sorted(root.rglob("*.extracted.json")):
+            rel = path.relative_to(root)
+            current = chosen.get(rel)
+            if current is not None and current.read_bytes() != path.read_bytes():
+                print(f"[CONFLICT] {rel}: {current} vs {path}, keeping the most recent")
+                if generated_at(path) <= generated_at(current):
+                    continue
+            chosen[rel] = path
+    return chosen
+
+
+def read_journal_lines(shard_dirs: list[Path], subdir: str) -> tuple[list[dict], int]:
+    """Every journal line of every shard, and how many journals ended cleanly."""
+    lines: list[dict] = []
+    ended = 0
+    for shard_dir in shard_dirs:
+        for path in sorted((shard_dir / subdir).glob("run-*.jsonl")):
+            for raw in path.read_text(encoding="utf-8").splitlines():
+                try:
+                    line = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue  # last line cut by a crash
+                line["journal"] = str(path)
+                lines.append(line)
+                ended += line.get("event") == "end"
+    return lines, ended
+
+
+def write_merged_journal(journal_dir: Path, lines: list[dict], journals: int, ended: int,
+                         input_path: str, output_dir: str) -> Path:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    journal = RunJournal(journal_dir / f"run-{stamp}.jsonl")
+    runs = [line for line in lines if line.get("event") == "run"]
+    journal.write(
+        "run",
+        input_path=input_path,
+        output_dir=output_dir,
+        model=runs[-1].get("model") if runs else None,
+        merged_from=sorted({line["journal"] for line in runs}),
+        shards=[line.get("shard") for line in runs],
+    )
+    planned = [pdf for line in lines if line.get("event") == "plan" for pdf in line["pdf_files"]]
+    journal.write("plan", pdf_files=list(dict.fromkeys(planned)))
+    events = sorted(
+        (line for line in lines if line.get("event") in ("start", "finish", "fail", "deferred")),
+        key=lambda line: line.get("ts_utc", ""),
+    )
+    for line in events:
+        fields = {k: v for k, v in line.items() if k not in ("ts_utc", "event", "journal")}
+        journal.write(line["event"], **fields)
+    # The merged run only counts as complete when every shard's run was.
+    if journals and ended == journals:
+        ends = [line for line in lines if line.get("event") == "end"]
+        journal.write(
+            "end",
+            limit_reached=any(line.get("limit_reached") for line in ends),
+            files_skipped_annual_report=max(
+                (line.get("files_skipped_annual_report", 0) for line in ends), default=0
+            ),
+            files_skipped_by_limit=sum(line.get("files_skipped_by_limit", 0) for line in ends),
+        )
+    return journal.path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Merge the outputs, journals and totals of sharded extraction runs"
+    )
+    parser.add_argument("shards", nargs="+", help="Shard directories (one per runner)")
+    parser.add_argument("--input-path", default="pdfs",
+                        help="PDF tree the shards extracted, for summary row order (default: pdfs)")
+    parser.add_argument("--output-dir", default="analysis_output",
+                        help="Tree to merge into (default: analysis_output)")
+    parser.add_argument("--journal-dir", default=".cache/journal",
+                        help="Where the combined journal is written (default: .cache/journal)")
+    parser.add_argument("--shard-output-subdir", default="analysis_output",
+                        help="Outputs inside each shard directory (default: analysis_output)")
+    parser.add_argument("--shard-journal-subdir", default=".cache/journal",
+                        help="Journals inside each shard directory (default: .cache/journal)")
+    args = parser.parse_args()
+
+    shard_dirs = [Path(shard) for shard in args.shards]
+    missing = [str(shard) for shard in shard_dirs if not shard.is_dir()]
+    if missing:
+        print(f"Shard directory not found: {', '.join(missing)}", file=sys.stderr)
+        return 1
+    try:
+        targets = read_pdf_targets(args.input_path)
+    except (FileNotFoundError, ValueError) as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+    out_dir = Path(args.output_dir)
+    groups = group_targets_by_top_folder(targets, args.input_path)
+
+    # 1. Outputs: copy what is new or changed, remembering the totals it replaces.
+    changed: dict[Path, tuple[Path, dict, Optional[dict]]] = {}
+    for rel, src in collect_outputs(shard_dirs, args.shard_output_subdir).items():
+        dest = out_dir / rel
+        if dest.exists() and dest.read_bytes() == src.read_bytes():
+            continue
+        previous = read_output_totals(dest) if dest.exists() else None
+        with src.open("rb") as in_fh:
+            write_atomic(dest, lambda fh: shutil.copyfileobj(in_fh, fh), mode="wb")
+        changed[dest] = (dest, read_output_totals(dest), previous)
+        print(f"[MERGED] {src} -> {dest}")
+
+    # 2. Journals: per-folder activity counters and failures, and the combined journal.
+    lines, ended = read_journal_lines(shard_dirs, args.shard_journal_subdir)
+    journals = len({line["journal"] for line in lines})
+    runs = [line for line in lines if line.get("event") == "run"]
+    model = runs[-1].get("model") if runs else None
+    group_counters: dict[Path, RunCounters] = {}
+    group_failed: dict[Path, int] = {}
+    group_by_limit: dict[Path, int] = {}
+    group_annual: dict[Path, int] = {}
+    all_counters = RunCounters()
+    ends = [line for line in lines if line.get("event") == "end"]
+    # Every shard skips the same annual reports (they are filtered before the split), so
+    # take the largest count; the PDFs a shard left to --max-new-files are its own: sum them.
+    all_annual = max((line.get("files_skipped_annual_report", 0) for line in ends), default=0)
+    all_by_limit = sum(line.get("files_skipped_by_limit", 0) for line in ends)
+    for line in ends:
+        for group_name, count in (line.get("annual_reports_by_group") or {}).items():
+            group_dir = out_dir if group_name == "." else out_dir / group_name
+            group_annual[group_dir] = max(group_annual.get(group_dir, 0), count)
+    for line in lines:
+        limited = line.get("event") == "deferred" and line.get("reason") == "limit"
+        if line.get("event") not in ("finish", "fail") and not limited:
+            continue
+        pdf_file = Path(line["pdf_file"])
+        try:
+            rel = pdf_file.relative_to(args.input_path)
+            group_dir = out_dir / rel.parts[0] if len(rel.parts) > 1 else out_dir
+        except ValueError:
+            group_dir = out_dir
+        if limited:
+            group_by_limit[group_dir] = group_by_limit.get(group_dir, 0) + 1
+            continue
+        counters = group_counters.setdefault(group_dir, RunCounters())
+        for name, value in (line.get("counters") or {}).items():
+            counters.add(name, value)
+            all_counters.add(name, value)
+        if line["event"] == "fail":
+            group_failed[group_dir] = group_failed.get(group_dir, 0) + 1
+
+    def run_totals(counters: RunCounters, failed: int, annual: int, by_limit: int,
+                   input_path: str) -> dict:
+        return {
+            "generated_at_utc": datetime.now(timezone.utc).isoformat(),
+            "model": model,
+            "input_path": input_path,
+            "files_failed": failed,
+            "files_skipped_annual_report": annual,
+            "files_skipped_non_sir": counters.get("files_skipped_non_sir"),
+            "files_skipped_by_limit": by_limit,
+            **counter_totals(counters),
+        }
+
+    # 3. Summaries of the touched folders, then the global one.
+    writes_global_summary = len(groups) > 1 or "." not in groups
+    all_order: list[tuple[str, Path]] = []
+    for group_name, group_targets in groups.items():
+        group_dir = out_dir if group_name == "." else out_dir / group_name
+        order = [
+            (str(pdf), group_dir / f"{pdf.stem}.extracted.json") for pdf in group_targets
+        ]
+        all_order.extend(order)
+        group_changed = [changed[out_path] for _, out_path in order if out_path in changed]
+        if not group_changed or (group_name == "." and writes_global_summary):
+            continue
+        input_label = args.input_path if group_name == "." else f"{args.input_path}/{group_name}"
+        csv_path, json_path = update_summary(
+            group_dir,
+            order,
+            group_changed,
+            run_totals(group_counters.get(group_dir, RunCounters()),
+                       group_failed.get(group_dir, 0), group_annual.get(group_dir, 0),
+                       group_by_limit.get(group_dir, 0), input_label),
+        )
+        print(f"[SUMMARY UPDATED] {csv_path}")
+        print(f"[SUMMARY UPDATED] {json_path}")
+    if changed and writes_global_summary:
+        all_changed = [changed[out_path] for _, out_path in all_order if out_path in changed]
+        csv_path, json_path = update_summary(
+            out_dir,
+            all_order,
+            all_changed,
+            run_totals(all_counters, sum(group_failed.values()), all_annual, all_by_limit,
+                       args.input_path),
+        )
+        print(f"[SUMMARY ALL UPDATED] {csv_path}")
+        print(f"[SUMMARY ALL UPDATED] {json_path}")
+
+    if lines:
+        journal_path = write_merged_journal(
+            Path(args.journal_dir), lines, journals, ended, args.input_path, args.output_dir
+        )
+        print(f"[JOURNAL] {journal_path} (from {journals} shard journals)")
+    failed = sum(group_failed.values())
+    print(f"[DONE] merged {len(changed)} outputs from {len(shard_dirs)} shards; failures={failed}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Brings existing .extracted.json outputs up to the current SirRecord/BatchOutput schema
+without calling the model.
+
+Every output carries the schema_version it was written with (missing = 0, written before
+the field existed). For each output below SCHEMA_VERSION the registered migrations are
+applied in order, then the result is validated with BatchOutput and rewritten in place
+(temp file + rename, totals sidecar refreshed). Validation runs in a process pool.
+
+Statuses:
+- current      already at SCHEMA_VERSION and valid: not touched
+- upgraded     migrated offline and rewritten
+- backfilled   upgraded, but a migration could only fill some fields with null:
+               re-extract those fields to get real values
+- reextract    still invalid after the migrations: the PDF must be extracted again
+- unreadable   not valid JSON
+
+Usage:
+    python3 migrate_sir_outputs.py analysis_output --dry-run
+    python3 migrate_sir_outputs.py analysis_output --report tmp/migration.tsv --reextract-list tmp/reextract.txt
+"""
+
+import argparse
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from pydantic import ValidationError
+
+from extract_sir_pdf_gemini import (
+    SCHEMA_VERSION,
+    BatchOutput,
+    file_totals,
+    write_json_atomic,
+    write_totals_sidecar,
+)
+
+STATUSES = ("current", "upgraded", "backfilled", "reextract", "unreadable")
+
+# from_version -> function upgrading the output dict in place to from_version + 1.
+# It returns the fields it could only backfill with null (re-extraction candidates).
+MIGRATIONS: dict[int, Callable[[dict], list[str]]] = {}
+
+
+def migration(from_version: int):
+    def register(fn: Callable[[dict], list[str]]) -> Callable[[dict], list[str]]:
+        MIGRATIONS[from_version] = fn
+        return fn
+
+    return register
+
+
+@migration(0)
+def add_libyan_coast_guard_involved(data: dict) -> list[str]:
+    """Records written before issue #2 have no libyan_coast_guard_involved."""
+    missing = False
+    for record in data.get("records") or []:
+        if "libyan_coast_guard_involved" not in record:
+            record["libyan_coast_guard_involved"] = None
+            missing = True
+    return ["libyan_coast_guard_involved"] if missing else []
+
+
+def migrate_output(path: Path, dry_run: bool = False) -> dict:
+    row = {"path": str(path), "source_file": "", "status": "", "from_version": "",
+           "backfilled_fields": "", "error": ""}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as exc:
+        row.update(status="unreadable", error=str(exc))
+        return row
+    if not isinstance(data, dict):
+        row.update(status="unreadable", error="not a JSON object")
+        return row
+
+    version = data.get("schema_version", 0)
+    row["from_version"] = version
+    row["source_file"] = data.get("source_file") or ""
+    backfilled: list[str] = []
+    for step in range(version, SCHEMA_VERSION):
+        if step not in MIGRATIONS:
+            row.update(status="reextract", error=f"no migration from schema_version {step}")
+            return row
+        backfilled.extend(MIGRATIONS[step](data))
+    data["schema_version"] = max(version, SCHEMA_VERSION)
+
+    try:
+        result = BatchOutput.model_validate(data)
+    except ValidationError as exc:
+        error = "; ".join(
+            f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in exc.errors()
+        )
+        row.update(status="reextract", error=error)
+        return row
+
+    if version >= SCHEMA_VERSION:
+        row["status"] = "current"
+        return row
+    row["status"] = "backfilled" if backfilled else "upgraded"
+    row["backfilled_fields"] = ",".join(sorted(set(backfilled)))
+    if not dry_run:
+        upgraded = result.model_dump(mode="json")
+        write_json_atomic(path, upgraded)
+        write_totals_sidecar(path, file_totals(upgraded))
+    return row
+
+
+def write_report(path: Path, rows: list[dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fields = ["path", "source_file", "status", "from_version", "backfilled_fields", "error"]
+    with path.open("w", encoding="utf-8", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields, delimiter="\t")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Upgrade existing .extracted.json outputs to the current schema offline"
+    )
+    parser.add_argument("output_dir", nargs="?", default="analysis_output",
+                        help="Outputs to migrate (default: analysis_output)")
+    parser.add_argument("--dry-run", action="store_true", help="Report only, rewrite nothing")
+    parser.add_argument("--report", help="Write per-file status to this TSV")
+    parser.add_argument("--reextract-list",
+                        help="Write the source PDFs of backfilled/reextract outputs, one per line")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel processes (default: 4)")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    if not output_dir.is_dir():
+        print(f"Output directory not found: {output_dir}", file=sys.stderr)
+        return 1
+    paths = sorted(output_dir.rglob("*.extracted.json"))
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        rows = list(pool.map(migrate_output, paths, [args.dry_run] * len(paths), chunksize=16))
+
+    counts = {status: sum(1 for row in rows if row["status"] == status) for status in STATUSES}
+    print(f"Outputs         : {len(rows)} (schema_version target {SCHEMA_VERSION})")
+    verb = "to upgrade" if args.dry_run else "upgraded"
+    print(f"Current         : {counts['current']}")
+    print(f"Upgraded        : {counts['upgraded']} {verb} offline")
+    print(f"Backfilled      : {counts['backfilled']} {verb}, some fields left null")
+    print(f"Re-extract      : {counts['reextract']}")
+    print(f"Unreadable      : {counts['unreadable']}")
+    for row in rows:
+        if row["status"] == "backfilled":
+            print(f"  [BACKFILLED] {row['path']}: {row['backfilled_fields']}")
+        elif row["status"] in ("reextract", "unreadable"):
+            print(f"  [{row['status'].upper()}] {row['path']}: {row['error']}", file=sys.stderr)
+    if args.report:
+        write_report(Path(args.report), rows)
+        print(f"Report          : {args.report}")
+    if args.reextract_list:
+        sources = sorted({
+            row["source_file"]
+            for row in rows
+            if row["source_file"] and row["status"] in ("backfilled", "reextract")
+        })
+        out_path = Path(args.reextract_list)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_text("".join(f"{source}\n" for source in sources), encoding="utf-8")
+        print(f"Re-extract list : {args.reextract_list} ({len(sources)} files)")
+    return 1 if counts["reextract"] or counts["unreadable"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
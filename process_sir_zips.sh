@@ -4,12 +4,15 @@ set -euo pipefail
 usage() {
   cat <<'EOF'
 Usage:
-  ./process_sir_zips.sh <zip_urls.txt> [--zip-dir DIR] [--pdf-dir DIR]
+  ./process_sir_zips.sh <zip_urls.txt> [--zip-dir DIR] [--pdf-dir DIR] [--workers N]
 
 Behavior:
-  1) Downloads each ZIP into --zip-dir (default: rawdata/) if not already present.
-  2) Extracts only PDF files from each ZIP.
-  3) Writes PDFs into --pdf-dir/<zip_stem>/ (default: pdfs/), skipping existing files.
+  1) Downloads every URL into --zip-dir (default: rawdata/) with download_sir_files.py:
+     N parallel downloads (default: 4), resume of partial files, integrity check
+     before a file is marked done.
+  2) Extracts only PDF members from each ZIP with unpack_sir_zips.py, streaming them
+     straight into --pdf-dir/<zip_stem>/ (default: pdfs/); members whose size and
+     CRC already match an existing file are skipped. N archives in parallel.
 
 Input format:
   - One ZIP URL per line.
@@ -40,6 +43,7 @@ shift
 
 ZIP_DIR="rawdata"
 PDF_DIR="pdfs"
+WORKERS=4
 while [[ $# -gt 0 ]]; do
   case "$1" in
     --zip-dir)
@@ -50,6 +54,10 @@ while [[ $# -gt 0 ]]; do
       PDF_DIR="${2:-}"
       shift 2
       ;;
+    --workers)
+      WORKERS="${2:-}"
+      shift 2
+      ;;
     *)
       echo "Unknown option: $1" >&2
       usage
@@ -63,103 +71,19 @@ if [[ ! -f "$URLS_FILE" ]]; then
   exit 1
 fi
 
-require_cmd curl
-require_cmd unzip
-require_cmd find
-require_cmd mktemp
+require_cmd python3
 
 mkdir -p "$ZIP_DIR" "$PDF_DIR"
 
-downloaded=0
-download_skipped=0
-pdf_extracted=0
-pdf_skipped=0
-failures=0
-
-while IFS= read -r line || [[ -n "$line" ]]; do
-  # Trim leading/trailing whitespace.
-  line="${line#"${line%%[![:space:]]*}"}"
-  line="${line%"${line##*[![:space:]]}"}"
-
-  [[ -z "$line" ]] && continue
-  [[ "$line" == \#* ]] && continue
-
-  url="$line"
-  file_name="$(basename "${url%%\?*}")"
-  file_name="${file_name// /_}"
-  file_path="$ZIP_DIR/$file_name"
-
-  if [[ -f "$file_path" ]]; then
-    echo "[SKIP download] $file_name"
-    ((download_skipped+=1))
-  else
-    echo "[DOWNLOAD] $url -> $file_path"
-    curl -fL --retry 3 --retry-delay 2 -o "$file_path" "$url"
-    ((downloaded+=1))
-  fi
-
-  # Direct PDF: copy into its own subfolder under PDF_DIR.
-  if [[ "${file_name,,}" == *.pdf ]]; then
-    stem="${file_name%.pdf}"
-    stem="${stem%.PDF}"
-    stem="${stem//.}"
-    out_dir="$PDF_DIR/$stem"
-    mkdir -p "$out_dir"
-    out_pdf="$out_dir/$file_name"
-    if [[ -f "$out_pdf" ]]; then
-      echo "  [SKIP PDF] $out_pdf"
-      ((pdf_skipped+=1))
-    else
-      cp -f "$file_path" "$out_pdf"
-      echo "  [PDF] $file_name -> $out_pdf"
-      ((pdf_extracted+=1))
-    fi
-    continue
-  fi
-
-  # ZIP: extract PDFs into subfolder.
-  zip_stem="${file_name%.zip}"
-  out_dir="$PDF_DIR/$zip_stem"
-  mkdir -p "$out_dir"
-
-  tmp_dir="$(mktemp -d)"
-  if ! unzip -q -o "$file_path" -d "$tmp_dir"; then
-    echo "[ERROR] Cannot extract $file_path" >&2
-    ((failures+=1))
-    rm -rf "$tmp_dir"
-    continue
-  fi
-
-  found_pdf=0
-  while IFS= read -r -d '' pdf_path; do
-    found_pdf=1
-    pdf_name="$(basename "$pdf_path")"
-    pdf_name="${pdf_name// /_}"
-    out_pdf="$out_dir/$pdf_name"
-
-    if [[ -f "$out_pdf" ]]; then
-      echo "  [SKIP PDF] $out_pdf"
-      ((pdf_skipped+=1))
-    else
-      cp -f "$pdf_path" "$out_pdf"
-      echo "  [PDF] $pdf_name -> $out_pdf"
-      ((pdf_extracted+=1))
-    fi
-  done < <(find "$tmp_dir" -type f \( -iname '*.pdf' -o -iname '*.PDF' \) -print0 | sort -z)
-
-  if [[ $found_pdf -eq 0 ]]; then
-    echo "  [WARN] No PDF found in $file_name"
-  fi
-
-  rm -rf "$tmp_dir"
-done < "$URLS_FILE"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+download_status=0
+python3 "$SCRIPT_DIR/download_sir_files.py" "$URLS_FILE" --zip-dir "$ZIP_DIR" --workers "$WORKERS" \
+  || download_status=$?
 
-echo
-echo "Done."
-echo "Downloads: new=$downloaded skipped=$download_skipped"
-echo "PDF files: new=$pdf_extracted skipped=$pdf_skipped"
-echo "Failures:  $failures"
+unpack_status=0
+python3 "$SCRIPT_DIR/unpack_sir_zips.py" "$URLS_FILE" --zip-dir "$ZIP_DIR" --pdf-dir "$PDF_DIR" --workers "$WORKERS" \
+  || unpack_status=$?
 
-if [[ $failures -gt 0 ]]; then
+if [[ $download_status -ne 0 || $unpack_status -ne 0 ]]; then
   exit 1
 fi
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Delta re-extraction: fills new or changed SirRecord fields in existing .extracted.json
+outputs without re-running the full extraction.
+
+For each output with records, the model gets:
+- only the requested fields to fill (--fields), for the records already extracted,
+  identified by record_index, sir_id, evidence_pages and the start of evidence_quote
+- only the evidence pages of those records (± --context-pages), cut out with pypdf;
+  the whole PDF when a record has no evidence pages or the PDF can't be read
+- the extraction prompt as reference for the field definitions (prompts/delta_sir_fields.txt)
+
+Answers are merged into the records and validated with SirRecord: an invalid answer keeps
+the record as it was. Outputs are rewritten with their totals, and the summary.csv /
+summary_totals.json of the touched folders and the global one are patched in place
+(rows in the order of the --input-path PDF tree), as merge_sir_shards.py does.
+
+Usage:
+    python3 reextract_sir_fields.py analysis_output --fields libyan_coast_guard_involved
+    python3 reextract_sir_fields.py analysis_output --fields libyan_coast_guard_involved --only-missing \\
+        --from-list tmp/reextract.txt --workers 4
+"""
+
+import argparse
+import json
+import os
+import string
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from google import genai
+from pydantic import ValidationError
+
+from extract_sir_pdf_gemini import (
+    BatchOutput,
+    QuotaBreaker,
+    QuotaExhausted,
+    RateLimiter,
+    RetryPolicy,
+    RunCounters,
+    SirRecord,
+    UploadRegistry,
+    acquire_upload,
+    build_prompt,
+    call_gemini,
+    counter_totals,
+    estimate_request_tokens,
+    group_targets_by_top_folder,
+    normalize_model_name,
+    read_output_totals,
+    read_pdf_targets,
+    require_pypdf,
+    sum_max_possible,
+    sum_opt,
+    timed_upload,
+    update_summary,
+    write_batch_output,
+)
+
+# Fields that identify a record for the model: they are never re-extracted.
+KEY_FIELDS = ("sir_id", "evidence_pages", "evidence_quote", "confidence")
+QUOTE_PREVIEW_CHARS = 200
+TOTAL_FIELDS = {
+    "dead_confirmed_total": "dead_confirmed",
+    "injured_confirmed_total": "injured_confirmed",
+    "missing_confirmed_total": "missing_confirmed",
+    "dead_possible_total_min": "dead_possible_min",
+}
+
+
+def is_missing(value: object) -> bool:
+    return value in (None, [], "")
+
+
+def target_indexes(result: BatchOutput, fields: list[str], only_missing: bool) -> list[int]:
+    return [
+        idx
+        for idx, record in enumerate(result.records)
+        if not only_missing or any(is_missing(getattr(record, field)) for field in fields)
+    ]
+
+
+def pages_to_send(records: list[SirRecord], total: int, context: int) -> Optional[list[int]]:
+    """1-based pages around the records' evidence pages, or None for the whole PDF."""
+    pages: set[int] = set()
+    for record in records:
+        if not record.evidence_pages:
+            return None
+        for page in record.evidence_pages:
+            pages.update(range(page - context, page + context + 1))
+    selected = sorted(page for page in pages if 1 <= page <= total)
+    if not selected or len(selected) >= total:
+        return None
+    return selected
+
+
+def page_ranges(pages: list[int]) -> str:
+    """[3, 4, 5, 9] -> "3-5, 9"."""
+    ranges = []
+    start = prev = pages[0]
+    for page in pages[1:] + [None]:
+        if page is not None and page == prev + 1:
+            prev = page
+            continue
+        ranges.append(f"{start}-{prev}" if prev != start else str(start))
+        if page is not None:
+            start = prev = page
+    return ", ".join(ranges)
+
+
+def build_delta_prompt(
+    template: str,
+    extraction_prompt: str,
+    fields: list[str],
+    result: BatchOutput,
+    indexes: list[int],
+    pages: Optional[list[int]],
+) -> str:
+    lines = []
+    for idx in indexes:
+        record = result.records[idx]
+        quote = " ".join(record.evidence_quote.split())[:QUOTE_PREVIEW_CHARS]
+        lines.append(json.dumps({
+            "record_index": idx,
+            "sir_id": record.sir_id,
+            "evidence_pages": record.evidence_pages,
+            "evidence_quote": quote,
+        }, ensure_ascii=False))
+    pages_note = ""
+    if pages is not None:
+        pages_note = (
+            f"\nNOTA: questo PDF contiene solo le pagine {page_ranges(pages)} del documento "
+            "originale; le pagine di evidenza elencate sotto usano la numerazione originale.\n"
+        )
+    return string.Template(template).safe_substitute(
+        fields=", ".join(fields),
+        pages_note=pages_note,
+        records="\n".join(lines),
+        extraction_prompt=extraction_prompt,
+    )
+
+
+def write_pdf_page_list(pdf_file: Path, pages: list[int], out_path: Path) -> None:
+    pypdf = require_pypdf()
+    reader = pypdf.PdfReader(str(pdf_file))
+    writer = pypdf.PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page - 1])
+    with open(out_path, "wb") as fh:
+        writer.write(fh)
+
+
+def pdf_page_count(pdf_file: Path) -> Optional[int]:
+    pypdf = require_pypdf()
+    try:
+        return len(pypdf.PdfReader(str(pdf_file)).pages)
+    except Exception:  # pypdf raises many types on broken/LFS-pointer input
+        return None
+
+
+def merge_answers(
+    result: BatchOutput, fields: list[str], indexes: list[int], raw_json: dict
+) -> tuple[list[SirRecord], int, int]:
+    """Return (records, records updated, answers rejected)."""
+    records = list(result.records)
+    updated = rejected = 0
+    answers = raw_json.get("records") if isinstance(raw_json, dict) else None
+    seen: set[int] = set()
+    for answer in answers if isinstance(answers, list) else []:
+        idx = answer.get("record_index") if isinstance(answer, dict) else None
+        if not isinstance(idx, int) or idx not in indexes or idx in seen:
+            rejected += 1
+            continue
+        seen.add(idx)
+        record = records[idx]
+        if record.sir_id and answer.get("sir_id") and answer["sir_id"] != record.sir_id:
+            rejected += 1
+            continue
+        update = {field: answer[field] for field in fields if field in answer}
+        if not update:
+            rejected += 1
+            continue
+        try:
+            merged = SirRecord.model_validate({**record.model_dump(), **update})
+        except ValidationError as exc:
+            print(f"  [INVALID] record {idx}: {exc.errors()[0]['msg']}")
+            rejected += 1
+            continue
+        if merged != record:
+            records[idx] = merged
+            updated += 1
+    return records, updated, rejected
+
+
+def reextract_output(
+    client: genai.Client,
+    model: str,
+    out_path: Path,
+    fields: list[str],
+    template: str,
+    extraction_prompt: str,
+    args: argparse.Namespace,
+    limiter: RateLimiter,
+    uploads: Optional[UploadRegistry],
+    counters: RunCounters,
+    retry: RetryPolicy,
+) -> tuple[int, int, int, Optional[tuple[Path, dict, dict]]]:
+    """Return (records asked, records updated, answers rejected, summary change) for one output."""
+    result = BatchOutput.model_validate_json(out_path.read_text(encoding="utf-8"))
+    indexes = target_indexes(result, fields, args.only_missing)
+    if not indexes:
+        return 0, 0, 0, None
+    pdf_file = Path(result.source_file)
+    if not pdf_file.is_file():
+        raise FileNotFoundError(f"Source PDF not found: {pdf_file}")
+
+    pages = None
+    if not args.whole_pdf:
+        total = pdf_page_count(pdf_file)
+        if total is not None:
+            pages = pages_to_send([result.records[idx] for idx in indexes], total, args.context_pages)
+    prompt = build_delta_prompt(template, extraction_prompt, fields, result, indexes, pages)
+
+    with tempfile.TemporaryDirectory(prefix="sir-delta-") as tmp_dir:
+        if pages is None:
+            send_file, registry = pdf_file, uploads
+        else:
+            send_file, registry = Path(tmp_dir) / pdf_file.name, None
+            write_pdf_page_list(pdf_file, pages, send_file)
+        uploaded = (
+            acquire_upload(client, send_file, registry, counters, retry)
+            if registry is not None
+            else timed_upload(client, send_file, counters, retry)
+        )
+        try:
+            counters.add("delta_calls")
+            raw_json = call_gemini(
+                client,
+                model,
+                uploaded,
+                prompt,
+                limiter=limiter,
+                estimated_tokens=estimate_request_tokens(send_file, prompt),
+                counters=counters,
+                retry=retry,
+            )
+        finally:
+            if registry is None:
+                try:
+                    client.files.delete(name=uploaded.name)
+                except Exception:
+                    pass
+
+    records, updated, rejected = merge_answers(result, fields, indexes, raw_json)
+    sent = "whole PDF" if pages is None else f"pages {page_ranges(pages)}"
+    print(f"[OK] {out_path}: {updated}/{len(indexes)} records updated ({sent})")
+    change = None
+    if updated:
+        update: dict[str, Any] = {
+            total: sum_opt(records, field) for total, field in TOTAL_FIELDS.items()
+        }
+        update["dead_possible_total_max"] = sum_max_possible(records)
+        update["records"] = records
+        previous = read_output_totals(out_path)
+        change = (out_path, write_batch_output(out_path, result.model_copy(update=update)), previous)
+    return len(indexes), updated, rejected, change
+
+
+def patch_summaries(
+    output_dir: Path,
+    input_path: str,
+    changed: dict[Path, tuple[Path, dict, dict]],
+    output_counters: dict[Path, RunCounters],
+) -> int:
+    """Patch the folder and global summaries; return how many changed outputs were placed."""
+    groups = group_targets_by_top_folder(read_pdf_targets(input_path), input_path)
+
+    def run_totals(out_paths: list[Path]) -> dict:
+        # Only activity counters: files_failed, model, ... stay those of the last full run.
+        counters = RunCounters()
+        for out_path in out_paths:
+            counters.merge(output_counters.get(out_path, RunCounters()))
+        return {"generated_at_utc": datetime.now(timezone.utc).isoformat(), **counter_totals(counters)}
+
+    writes_global_summary = len(groups) > 1 or "." not in groups
+    all_order: list[tuple[str, Path]] = []
+    for group_name, group_targets in groups.items():
+        group_dir = output_dir if group_name == "." else output_dir / group_name
+        order = [(str(pdf), group_dir / f"{pdf.stem}.extracted.json") for pdf in group_targets]
+        all_order.extend(order)
+        group_changed = [changed[out_path] for _, out_path in order if out_path in changed]
+        if not group_changed or (group_name == "." and writes_global_summary):
+            continue
+        csv_path, json_path = update_summary(
+            group_dir, order, group_changed, run_totals([change[0] for change in group_changed])
+        )
+        print(f"[SUMMARY UPDATED] {csv_path}")
+        print(f"[SUMMARY UPDATED] {json_path}")
+    all_changed = [changed[out_path] for _, out_path in all_order if out_path in changed]
+    if all_changed and writes_global_summary:
+        csv_path, json_path = update_summary(
+            output_dir, all_order, all_changed, run_totals([change[0] for change in all_changed])
+        )
+        print(f"[SUMMARY ALL UPDATED] {csv_path}")
+        print(f"[SUMMARY ALL UPDATED] {json_path}")
+    return len(all_changed)
+
+
+def main(argv: Optional[list[str]] = None, client: Any = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Fill new/changed SirRecord fields in existing outputs without a full re-extraction"
+    )
+    parser.add_argument("output_dir", nargs="?", default="analysis_output",
+                        help="Outputs to update (default: analysis_output)")
+    parser.add_argument("--input-path", default="pdfs",
+                        help="PDF tree the outputs come from, for summary row order (default: pdfs)")
+    parser.add_argument("--fields", required=True,
+                        help="Comma-separated SirRecord fields to re-extract")
+    parser.add_argument("--only-missing", action="store_true",
+                        help="Only records where one of the fields is null/empty (new fields)")
+    parser.add_argument("--from-list",
+                        help="Only outputs of the PDFs listed in this file (e.g. migrate_sir_outputs.py --reextract-list)")
+    parser.add_argument("--context-pages", type=int, default=1,
+                        help="Pages sent around each evidence page (default: 1)")
+    parser.add_argument("--whole-pdf", action="store_true",
+                        help="Always send the whole PDF instead of the evidence pages")
+    parser.add_argument("--model", default="gemini-2.5-flash",
+                        help="Gemini model name (default: gemini-2.5-flash)")
+    parser.add_argument("--prompt-path", default="prompts/extract_sir.txt",
+                        help="Extraction prompt used as field reference (default: prompts/extract_sir.txt)")
+    parser.add_argument("--delta-prompt-path", default="prompts/delta_sir_fields.txt",
+                        help="Delta prompt template (default: prompts/delta_sir_fields.txt)")
+    parser.add_argument("--workers", type=int, default=1, help="Outputs processed in parallel (default: 1)")
+    parser.add_argument("--requests-per-minute", type=float, default=15,
+                        help="Shared request rate limit (default: 15; 0 = off)")
+    parser.add_argument("--tokens-per-minute", type=float, default=0,
+                        help="Shared input-token rate limit (default: 0 = off)")
+    parser.add_argument("--max-retries", type=int, default=3,
+                        help="Attempts per call on quota/transient errors (default: 3)")
+    parser.add_argument("--quota-breaker", type=int, default=5,
+                        help="Quota errors in a row that trip the circuit breaker (default: 5; 0 = off)")
+    parser.add_argument("--quota-pause", type=float, default=60.0,
+                        help="Seconds API calls are held when the breaker trips (default: 60)")
+    parser.add_argument("--quota-pauses", type=int, default=2,
+                        help="Pauses before the breaker defers the remaining outputs (default: 2)")
+    parser.add_argument("--upload-registry", default=".cache/uploads.json",
+                        help="Registry of reusable whole-PDF uploads (default: .cache/uploads.json)")
+    parser.add_argument("--no-upload-registry", dest="use_upload_registry", action="store_false",
+                        help="Upload whole PDFs again and delete them after the call")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="List the outputs and records that would be re-extracted, no API calls")
+    args = parser.parse_args(argv)
+
+    fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in SirRecord.model_fields]
+    if unknown:
+        parser.error(f"unknown SirRecord fields: {', '.join(unknown)}")
+    keys = [field for field in fields if field in KEY_FIELDS]
+    if keys:
+        parser.error(f"key fields cannot be re-extracted: {', '.join(keys)}")
+    if args.workers < 1 or args.context_pages < 0:
+        parser.error("--workers must be >= 1 and --context-pages >= 0")
+
+    output_dir = Path(args.output_dir)
+    if not output_dir.is_dir():
+        print(f"Output directory not found: {output_dir}", file=sys.stderr)
+        return 1
+    out_paths = sorted(output_dir.rglob("*.extracted.json"))
+    if args.from_list:
+        wanted = {
+            line.strip()
+            for line in Path(args.from_list).read_text(encoding="utf-8").splitlines()
+            if line.strip()
+        }
+        out_paths = [
+            path for path in out_paths
+            if json.loads(path.read_text(encoding="utf-8")).get("source_file") in wanted
+        ]
+
+    if args.dry_run:
+        files = records = 0
+        for path in out_paths:
+            result = BatchOutput.model_validate_json(path.read_text(encoding="utf-8"))
+            count = len(target_indexes(result, fields, args.only_missing))
+            if count:
+                files += 1
+                records += count
+                print(f"[DELTA] {path}: {count} records")
+        print(f"Would re-extract {', '.join(fields)} for {records} records in {files} outputs")
+        return 0
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if client is None and not api_key:
+        print("Missing GEMINI_API_KEY environment variable", file=sys.stderr)
+        return 1
+    try:
+        extraction_prompt = build_prompt(Path(args.prompt_path))
+        template = build_prompt(Path(args.delta_prompt_path))
+    except FileNotFoundError as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+    if not args.whole_pdf:
+        require_pypdf()
+
+    if client is None:
+        client = genai.Client(api_key=api_key)
+    model = normalize_model_name(args.model)
+    limiter = RateLimiter(args.requests_per_minute, args.tokens_per_minute)
+    uploads = UploadRegistry(Path(args.upload_registry)) if args.use_upload_registry else None
+    counters = RunCounters()
+    output_counters = {path: RunCounters() for path in out_paths}
+    breaker = QuotaBreaker(args.quota_breaker, args.quota_pause, args.quota_pauses)
+    retry = RetryPolicy(args.max_retries, breaker=breaker)
+
+    def job(path: Path) -> Optional[tuple[int, int, int, Optional[tuple[Path, dict, dict]]]]:
+        try:
+            if breaker.opened:
+                raise QuotaExhausted("API quota exhausted (circuit breaker open)")
+            return reextract_output(
+                client, model, path, fields, template, extraction_prompt,
+                args, limiter, uploads, output_counters[path], retry,
+            )
+        except QuotaExhausted as exc:
+            # Nothing was written: the output is simply asked again on the next run.
+            print(f"[DEFERRED] {path}: {exc}", file=sys.stderr)
+            output_counters[path].add("delta_deferred")
+            return 0, 0, 0, None
+        except Exception as exc:
+            print(f"[ERROR] {path}: {exc}", file=sys.stderr)
+            return None
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(job, out_paths))
+    for path_counters in output_counters.values():
+        counters.merge(path_counters)
+
+    done = [r for r in results if r is not None]
+    failed = len(results) - len(done)
+    totals = counter_totals(counters)
+    print()
+    print(f"Outputs updated : {sum(1 for r in done if r[1])} of {sum(1 for r in done if r[0])} asked")
+    print(f"Records         : asked={sum(r[0] for r in done)} updated={sum(r[1] for r in done)} "
+          f"answers rejected={sum(r[2] for r in done)}")
+    print(f"Calls           : {counters.get('delta_calls')} (uploads={totals['uploads']} "
+          f"reused={totals['uploads_avoided']}) input tokens={totals['prompt_tokens']} "
+          f"estimated cost=${totals['estimated_cost_usd']}")
+    print(f"Failures        : {failed}")
+    if counters.get("delta_deferred"):
+        print(f"Deferred        : {counters.get('delta_deferred')} (quota exhausted, run again later)")
+    changed = {r[3][0]: r[3] for r in done if r[3] is not None}
+    if changed:
+        try:
+            placed = patch_summaries(output_dir, args.input_path, changed, output_counters)
+        except (FileNotFoundError, ValueError) as exc:
+            print(f"[WARN] Summaries not updated: {exc}", file=sys.stderr)
+            placed = 0
+        if placed < len(changed):
+            print(
+                f"[WARN] {len(changed) - placed} updated outputs are missing from the summaries; "
+                "rebuild them with: python3 extract_sir_pdf_gemini.py "
+                f"{args.input_path} --output-dir {output_dir} --no-skip-completed-groups",
+                file=sys.stderr,
+            )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
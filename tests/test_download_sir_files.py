@@ -0,0 +1,148 @@
+"""download_sir_files.py against a local HTTP server (Range resume, 416, integrity)."""
+
+import io
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import download_sir_files as dl  # noqa: E402
+
+
+def make_zip() -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("a.pdf", b"%PDF-1.4\n" + bytes(range(256)) * 64 + b"\n%%EOF\n")
+    return buf.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    files: dict[str, bytes] = {}
+    paths: list[str] = []
+    ranges: list[str | None] = []
+
+    def do_GET(self) -> None:
+        self.paths.append(self.path)
+        body = self.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        requested = self.headers.get("Range")
+        self.ranges.append(requested)
+        start = int(requested[len("bytes="):].rstrip("-")) if requested else 0
+        if start >= len(body):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(body)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(206 if requested else 200)
+        if requested:
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dest = Path(self.tmp.name)
+        self.body = make_zip()
+        Handler.files = {"/sir.zip": self.body}
+        Handler.paths = []
+        Handler.ranges = []
+        self.session = dl.requests.Session()
+        self.limiter = dl.HostLimiter(per_host=2, delay=0)
+
+    def tearDown(self) -> None:
+        self.session.close()
+        self.tmp.cleanup()
+
+    def fetch(self, name: str = "sir.zip", retries: int = 3):
+        return dl.download_one(self.session, f"{self.base}/{name}", self.dest, self.limiter,
+                               retries=retries, backoff=0)
+
+    def test_resumes_partial_download_with_range(self) -> None:
+        half = len(self.body) // 2
+        (self.dest / "sir.zip.part").write_bytes(self.body[:half])
+        status, path = self.fetch()
+        self.assertEqual(status, "new")
+        self.assertEqual(path.read_bytes(), self.body)
+        self.assertEqual(Handler.ranges, [f"bytes={half}-"])
+
+    def test_truncated_final_file_is_resumed(self) -> None:
+        (self.dest / "sir.zip").write_bytes(self.body[:-10])
+        status, path = self.fetch()
+        self.assertEqual(status, "new")
+        self.assertEqual(path.read_bytes(), self.body)
+        self.assertEqual(Handler.ranges, [f"bytes={len(self.body) - 10}-"])
+
+    def test_416_with_complete_part_is_accepted(self) -> None:
+        (self.dest / "sir.zip.part").write_bytes(self.body)
+        status, path = self.fetch()
+        self.assertEqual(status, "new")
+        self.assertEqual(path.read_bytes(), self.body)
+        self.assertFalse((self.dest / "sir.zip.part").exists())
+
+    def test_416_with_corrupt_part_restarts_from_zero(self) -> None:
+        corrupt = bytearray(self.body)
+        corrupt[100] ^= 0xFF
+        (self.dest / "sir.zip.part").write_bytes(bytes(corrupt))
+        status, path = self.fetch()
+        self.assertEqual(status, "new")
+        self.assertEqual(path.read_bytes(), self.body)
+        self.assertEqual(Handler.ranges, [f"bytes={len(self.body)}-", None])
+
+    def test_integrity_failure_keeps_file_out_of_place(self) -> None:
+        bad = bytearray(self.body)
+        bad[100] ^= 0xFF
+        Handler.files = {"/sir.zip": bytes(bad)}
+        with self.assertRaises(ValueError):
+            self.fetch(retries=2)
+        self.assertFalse((self.dest / "sir.zip").exists())
+
+    def test_404_is_not_retried(self) -> None:
+        with self.assertRaises(dl.requests.HTTPError):
+            self.fetch("missing.zip")
+        self.assertEqual(Handler.paths, ["/missing.zip"])
+
+    def test_backoff_does_not_hold_the_host_slot(self) -> None:
+        Handler.files = {"/sir.zip": b"not a zip"}
+        limiter = dl.HostLimiter(per_host=1, delay=0)
+        host = f"127.0.0.1:{self.server.server_address[1]}"
+        slot_free: list[bool] = []
+
+        def sleep(seconds: float) -> None:
+            acquired = limiter._semaphore(host).acquire(blocking=False)
+            slot_free.append(acquired)
+            if acquired:
+                limiter.release(host)
+
+        with self.assertRaises(ValueError):
+            dl.download_one(self.session, f"{self.base}/sir.zip", self.dest, limiter,
+                            retries=2, sleep=sleep)
+        self.assertEqual(slot_free, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
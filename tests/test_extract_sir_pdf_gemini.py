@@ -0,0 +1,215 @@
+"""extract_sir_pdf_gemini.py on the fake client of bench_sir_pipeline.py (workers, limit, batch)."""
+
+import contextlib
+import csv
+import io
+import json
+import sys
+import tempfile
+import unittest
+from argparse import Namespace
+from pathlib import Path
+from unittest import mock
+
+from pypdf import PdfWriter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import extract_sir_pdf_gemini as pipeline  # noqa: E402
+from bench_sir_pipeline import FakeGemini  # noqa: E402
+
+PDFS = {"a": ["sir_01", "sir_02", "sir_03", "sir_04", "sir_05"], "b": ["sir_06", "sir_07", "sir_08"]}
+
+
+def fake_args(**overrides) -> Namespace:
+    values = dict(
+        seed=1,
+        latency_ms=5,
+        jitter_ms=5,
+        upload_latency_ms=0,
+        error_rate=0.0,
+        upload_error_rate=0.0,
+        burst_every=0,
+        burst_length=0,
+        cache_ttl_scale=1.0,
+    )
+    values.update(overrides)
+    return Namespace(**values)
+
+
+def canned_answers() -> dict[str, str]:
+    """One valid record per PDF, so no RETRY EMPTY second call."""
+    answers = {}
+    for stems in PDFS.values():
+        for stem in stems:
+            record = {
+                "sir_id": f"{int(stem[4:])}/2024",
+                "dead_confirmed": 1,
+                "evidence_quote": "one person died",
+                "confidence": "high",
+            }
+            answers[stem] = json.dumps({"records": [record]})
+    return answers
+
+
+def write_pdf(path: Path) -> None:
+    writer = PdfWriter()
+    writer.add_blank_page(width=595, height=842)
+    writer.add_metadata({"/Title": path.stem})  # distinct bytes: no extraction-cache hits
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as fh:
+        writer.write(fh)
+
+
+def summary_sources(csv_path: Path) -> list[str]:
+    with csv_path.open(encoding="utf-8", newline="") as fh:
+        return [row["source_file"] for row in csv.DictReader(fh)]
+
+
+class MaxNewFilesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.pdfs = self.tmp / "pdfs"
+        for group, stems in PDFS.items():
+            for stem in stems:
+                write_pdf(self.pdfs / group / f"{stem}.pdf")
+        self.client = FakeGemini(fake_args(), canned_answers())
+
+    def run_main(self, out_dir: Path, *extra: str) -> int:
+        argv = [
+            str(self.pdfs),
+            "--output-dir", str(out_dir),
+            "--prompt-path", str(ROOT / "prompts" / "extract_sir.txt"),
+            "--cache-dir", str(self.tmp / "cache"),
+            "--upload-registry", str(self.tmp / "uploads.json"),
+            "--telemetry-dir", str(self.tmp / "telemetry"),
+            "--journal-dir", str(self.tmp / "journal"),
+            "--min-seconds-between-calls", "0",
+            "--workers", "4",
+            *extra,
+        ]
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            return pipeline.main(argv, client=self.client)
+
+    def test_limit_counts_outputs_and_keeps_full_pass_order(self) -> None:
+        out = self.tmp / "out"
+        # sir_02 is left out of the first run so the second has to insert it mid-summary.
+        self.assertEqual(self.run_main(out, "--max-new-files", "3", "--exclude", "sir_02.pdf"), 0)
+        self.assertEqual(len(list(out.rglob("*.extracted.json"))), 3)
+        self.assertEqual(self.client.stats["generate_calls"], 3)
+        totals = json.loads((out / "summary_totals.json").read_text(encoding="utf-8"))
+        self.assertEqual(totals["files_processed"], 3)
+        self.assertEqual(totals["files_skipped_by_limit"], 4)  # a/sir_05 and all of b
+        group_a = json.loads((out / "a" / "summary_totals.json").read_text(encoding="utf-8"))
+        self.assertEqual(group_a["files_skipped_by_limit"], 1)
+        self.assertFalse((out / "b" / "summary.csv").exists())
+
+        self.assertEqual(self.run_main(out, "--max-new-files", "10"), 0)
+        self.assertEqual(len(list(out.rglob("*.extracted.json"))), 8)
+        totals = json.loads((out / "summary_totals.json").read_text(encoding="utf-8"))
+        self.assertEqual(totals["files_processed"], 8)
+        self.assertEqual(totals["records_total"], 8)
+        self.assertEqual(totals["files_skipped_by_limit"], 0)
+
+        full = self.tmp / "full"
+        self.assertEqual(self.run_main(full), 0)
+        for group in ("a", "b"):
+            self.assertEqual(
+                summary_sources(out / group / "summary.csv"),
+                summary_sources(full / group / "summary.csv"),
+            )
+        self.assertEqual(
+            summary_sources(out / "a" / "summary.csv"),
+            [str(self.pdfs / "a" / f"{stem}.pdf") for stem in PDFS["a"]],
+        )
+        self.assertEqual(summary_sources(out / "summary.csv"), summary_sources(full / "summary.csv"))
+
+
+class BatchCollectTest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.pdfs = self.tmp / "pdfs"
+        for group, stems in PDFS.items():
+            for stem in stems:
+                write_pdf(self.pdfs / group / f"{stem}.pdf")
+        canned = canned_answers()
+        canned["sir_04"] = '{"records": []}'  # empty: RETRY EMPTY follow-up job
+        canned["sir_05"] = "no JSON here"  # invalid: failed, left for the next submit
+        self.client = FakeGemini(fake_args(), canned)
+        self.out = self.tmp / "out"
+        self.batch_dir = self.tmp / "batches"
+        self.cache = pipeline.ExtractionCache(self.tmp / "cache")
+
+    def submit(self) -> int:
+        argv = [
+            str(self.pdfs),
+            "--batch-submit",
+            "--output-dir", str(self.out),
+            "--prompt-path", str(ROOT / "prompts" / "extract_sir.txt"),
+            "--cache-dir", str(self.tmp / "cache"),
+            "--upload-registry", str(self.tmp / "uploads.json"),
+            "--batch-dir", str(self.batch_dir),
+        ]
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return pipeline.main(argv, client=self.client)
+
+    def collect(self) -> tuple[int, int, int]:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return pipeline.collect_batches(self.client, self.batch_dir, self.cache)
+
+    def manifests(self) -> list[dict]:
+        return [
+            json.loads(path.read_text(encoding="utf-8"))
+            for path in sorted(self.batch_dir.glob("*.json"))
+        ]
+
+    def test_collect_validates_writes_and_requeues(self) -> None:
+        self.assertEqual(self.submit(), 0)
+        self.assertEqual(len(self.manifests()[0]["requests"]), 8)
+        self.assertEqual(self.collect(), (0, 0, 1))  # first poll: still running
+        self.assertEqual(list(self.out.rglob("*.extracted.json")), [])
+
+        with mock.patch.object(pipeline, "write_atomic", wraps=pipeline.write_atomic) as spy:
+            self.assertEqual(self.collect(), (6, 1, 0))
+        written_paths = {call.args[0] for call in spy.call_args_list}
+        outputs = sorted(self.out.rglob("*.extracted.json"))
+        self.assertEqual(
+            [path.name for path in outputs],
+            [f"{stem}.extracted.json" for stem in ("sir_01", "sir_02", "sir_03", "sir_06", "sir_07", "sir_08")],
+        )
+        for out_path in outputs:
+            data = json.loads(out_path.read_text(encoding="utf-8"))
+            self.assertEqual([rec["sir_id"] for rec in data["records"]], [f"{int(out_path.name[4:6])}/2024"])
+            sidecar = pipeline.totals_sidecar_path(out_path)
+            self.assertIn(out_path, written_paths)
+            self.assertIn(sidecar, written_paths)
+            totals = json.loads(sidecar.read_text(encoding="utf-8"))
+            self.assertEqual((totals["records_total"], totals["dead_confirmed_total"]), (1, 1))
+            self.assertEqual(totals["output_size"], out_path.stat().st_size)
+        self.assertEqual(list(self.out.rglob("*.tmp")), [])
+
+        # The empty result went to a follow-up job without RETRY EMPTY.
+        first, retry = self.manifests()
+        self.assertTrue(first["collected_at_utc"])
+        self.assertFalse(retry["retry_empty"])
+        self.assertEqual([Path(e["pdf_file"]).name for e in retry["requests"]], ["sir_04.pdf"])
+        self.assertEqual(self.collect(), (0, 0, 1))
+        self.assertEqual(self.collect(), (1, 0, 0))
+        data = json.loads((self.out / "a" / "sir_04.extracted.json").read_text(encoding="utf-8"))
+        self.assertEqual(data["records"], [])
+
+        # The failed request has no output: the next submit picks it up again.
+        self.assertEqual(self.submit(), 0)
+        self.assertEqual(
+            [Path(e["pdf_file"]).name for e in self.manifests()[-1]["requests"]], ["sir_05.pdf"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""fetch_sir_zip_urls.py against recorded listing/dialog pages served locally."""
+
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fetch_sir_zip_urls as fz  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "prd"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serve tests/fixtures/prd: listing-<page>.html and dialog-<doc_id>.html."""
+
+    paths: list[str] = []
+    throttle: dict[str, int] = {}  # path -> 429 responses still to send
+    retry_after = "1"
+
+    def do_GET(self) -> None:
+        self.paths.append(self.path)
+        if self.throttle.get(self.path):
+            self.throttle[self.path] -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", self.retry_after)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        query = parse_qs(urlsplit(self.path).query)
+        if "document-post-id" in query:
+            name = f"dialog-{query['document-post-id'][0]}.html"
+        elif "form-fields[paged]" in query:
+            name = f"listing-{query['form-fields[paged]'][0]}.html"
+        else:
+            name = ""
+        path = FIXTURES / name
+        if not name or not path.is_file():
+            self.send_error(404)
+            return
+        body = path.read_bytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def listing_pages(paths: list[str]) -> list[int]:
+    return [
+        int(parse_qs(urlsplit(p).query)["form-fields[paged]"][0])
+        for p in paths
+        if "form-fields" in p
+    ]
+
+
+class CrawlTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}/"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        Handler.paths.clear()
+        Handler.throttle.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def run_main(self, *extra: str) -> int:
+        argv = [
+            "fetch_sir_zip_urls.py",
+            "--base-url", self.base,
+            "--output", str(self.tmp / "zip_urls.txt"),
+            "--jsonl", str(self.tmp / "sir_documents.jsonl"),
+            "--db", str(self.tmp / "sir_documents.sqlite"),
+            "--no-cache",
+            "--delay", "0",
+            "--workers", "2",
+            *extra,
+        ]
+        with mock.patch.object(sys, "argv", argv):
+            return fz.main()
+
+    def test_first_run_reads_until_the_empty_page(self) -> None:
+        self.assertEqual(self.run_main(), 0)
+        self.assertEqual(listing_pages(Handler.paths), [0, 1, 2])
+        urls = (self.tmp / "zip_urls.txt").read_text(encoding="utf-8").split()
+        self.assertEqual(
+            urls,
+            [f"https://prd.frontex.europa.eu/wp-content/uploads/sir_2023_part{n}.zip" for n in (1, 2, 3)],
+        )
+        first = (self.tmp / "sir_documents.jsonl").read_text(encoding="utf-8").splitlines()[0]
+        self.assertIn('"publication_date": "2024-03-01"', first)
+
+    def test_stops_at_the_first_page_of_known_documents(self) -> None:
+        self.assertEqual(self.run_main(), 0)
+        Handler.paths.clear()
+        self.assertEqual(self.run_main(), 0)
+        self.assertEqual(listing_pages(Handler.paths), [0])
+
+        Handler.paths.clear()
+        self.assertEqual(self.run_main("--full"), 0)
+        self.assertEqual(listing_pages(Handler.paths), [0, 1, 2])
+
+    def test_429_waits_for_retry_after(self) -> None:
+        page0 = "/" + fz.LISTING_PATH.format(page=0)
+        Handler.throttle[page0] = 1
+        polite = fz.Politeness(0.0)
+        session = requests.Session()
+        self.addCleanup(session.close)
+
+        started = time.monotonic()
+        metas, failures = fz.crawl(session, polite, 5, set(), base_url=self.base, workers=2)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(failures, 0)
+        self.assertEqual([m["doc_id"] for m in metas], ["2001", "2002", "2003"])
+        self.assertEqual(polite.throttled, 1)
+        self.assertEqual(Handler.paths.count(page0), 2)
+        # Retry-After: 1 beats the 0.5s spacing the throttle alone would impose.
+        self.assertGreaterEqual(elapsed, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Extracts the PDFs of the files downloaded by download_sir_files.py into pdfs/<stem>/:
+- ZIPs are read from their central directory; only PDF members are streamed,
+  straight to their final path (basename, spaces → _), no temporary full unpack
+- a member is skipped when a file with the same size and CRC-32 is already there
+- direct PDFs are copied into pdfs/<stem without dots>/ with the same check
+- several archives are processed in parallel; files are written as temp + rename
+
+Usage:
+    python3 unpack_sir_zips.py zip_urls.txt
+    python3 unpack_sir_zips.py zip_urls.txt --zip-dir rawdata --pdf-dir pdfs --workers 4
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from download_sir_files import read_url_list, target_name
+
+CHUNK_SIZE = 1 << 16
+
+_print_lock = threading.Lock()
+
+
+def file_crc32(path: Path) -> int:
+    crc = 0
+    with open(path, "rb") as fh:
+        while chunk := fh.read(CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def is_same_file(path: Path, size: int, crc: int) -> bool:
+    """Size first (free), CRC only when sizes match."""
+    try:
+        if path.stat().st_size != size:
+            return False
+    except FileNotFoundError:
+        return False
+    return file_crc32(path) == crc
+
+
+def write_stream(src, out_path: Path) -> None:
+    """Copy a readable stream to out_path through a temp file in the same directory."""
+    fd, tmp_name = tempfile.mkstemp(dir=out_path.parent, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            shutil.copyfileobj(src, fh, CHUNK_SIZE)
+        os.replace(tmp_name, out_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def pdf_members(zf: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    """PDF members in path order, as the old `find | sort` walk produced them."""
+    members = [
+        info for info in zf.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(".pdf")
+    ]
+    return sorted(members, key=lambda info: info.filename)
+
+
+def unpack_zip(zip_path: Path, out_dir: Path, log: list[str]) -> dict[str, int]:
+    counts = {"new": 0, "skipped": 0}
+    with zipfile.ZipFile(zip_path) as zf:
+        members = pdf_members(zf)
+        if not members:
+            log.append(f"  [WARN] No PDF found in {zip_path.name}")
+            return counts
+        out_dir.mkdir(parents=True, exist_ok=True)
+        seen: set[str] = set()
+        for info in members:
+            pdf_name = os.path.basename(info.filename).replace(" ", "_")
+            out_pdf = out_dir / pdf_name
+            # Same basename in two folders of the archive: the first one wins.
+            if pdf_name in seen or is_same_file(out_pdf, info.file_size, info.CRC):
+                log.append(f"  [SKIP PDF] {out_pdf}")
+                counts["skipped"] += 1
+            else:
+                # ZipExtFile checks the CRC at EOF, so a corrupt member raises before the rename.
+                with zf.open(info) as src:
+                    write_stream(src, out_pdf)
+                log.append(f"  [PDF] {pdf_name} -> {out_pdf}")
+                counts["new"] += 1
+            seen.add(pdf_name)
+    return counts
+
+
+def copy_pdf(pdf_path: Path, out_dir: Path, log: list[str]) -> dict[str, int]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_pdf = out_dir / pdf_path.name
+    if is_same_file(out_pdf, pdf_path.stat().st_size, file_crc32(pdf_path)):
+        log.append(f"  [SKIP PDF] {out_pdf}")
+        return {"new": 0, "skipped": 1}
+    with open(pdf_path, "rb") as src:
+        write_stream(src, out_pdf)
+    log.append(f"  [PDF] {pdf_path.name} -> {out_pdf}")
+    return {"new": 1, "skipped": 0}
+
+
+def output_dir_for(file_name: str, pdf_dir: Path) -> Path:
+    """pdfs/<zip stem>/ for ZIPs, pdfs/<pdf stem without dots>/ for direct PDFs."""
+    if file_name.lower().endswith(".pdf"):
+        return pdf_dir / file_name[:-4].replace(".", "")
+    return pdf_dir / file_name.removesuffix(".zip")
+
+
+def unpack_one(file_path: Path, pdf_dir: Path) -> dict[str, int]:
+    log: list[str] = []
+    counts = {"new": 0, "skipped": 0, "failed": 0}
+    try:
+        if not file_path.is_file():
+            raise FileNotFoundError(f"Missing download: {file_path}")
+        out_dir = output_dir_for(file_path.name, pdf_dir)
+        if file_path.name.lower().endswith(".pdf"):
+            counts.update(copy_pdf(file_path, out_dir, log))
+        else:
+            counts.update(unpack_zip(file_path, out_dir, log))
+    except Exception as exc:
+        # Also covers encrypted members (RuntimeError) and e.g. Deflate64 (NotImplementedError).
+        log.append(f"[ERROR] Cannot extract {file_path}: {exc}")
+        counts["failed"] = 1
+    # One block per archive, so parallel workers don't interleave their lines.
+    with _print_lock:
+        for line in log:
+            print(line, file=sys.stderr if line.startswith("[ERROR]") else sys.stdout)
+    return counts
+
+
+def unpack_all(file_paths: list[Path], pdf_dir: Path, workers: int = 4) -> dict[str, int]:
+    pdf_dir.mkdir(parents=True, exist_ok=True)
+    totals = {"new": 0, "skipped": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for counts in pool.map(lambda path: unpack_one(path, pdf_dir), file_paths):
+            for key, value in counts.items():
+                totals[key] += value
+    return totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Extract PDFs from downloaded SIR ZIP/PDF files")
+    parser.add_argument("urls_file", help="File with one URL per line (e.g. zip_urls.txt)")
+    parser.add_argument("--zip-dir", default="rawdata", help="Downloaded files (default: rawdata)")
+    parser.add_argument("--pdf-dir", default="pdfs", help="Output PDF directory (default: pdfs)")
+    parser.add_argument("--workers", type=int, default=4, help="Archives processed in parallel (default: 4)")
+    args = parser.parse_args()
+
+    urls_path = Path(args.urls_file)
+    if not urls_path.is_file():
+        print(f"Input file not found: {urls_path}", file=sys.stderr)
+        return 1
+
+    zip_dir = Path(args.zip_dir)
+    file_paths = [zip_dir / target_name(url) for url in read_url_list(urls_path)]
+    totals = unpack_all(file_paths, Path(args.pdf_dir), workers=args.workers)
+    print()
+    print("Done.")
+    print(f"PDF files: new={totals['new']} skipped={totals['skipped']}")
+    print(f"Failures:  {totals['failed']}")
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())